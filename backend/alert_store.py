@@ -0,0 +1,267 @@
+"""
+Alert Store
+In-memory lifecycle of diagnosis alerts with batched persistence.
+
+    new -> active -> resolved        (condition cleared, or deleted by the user)
+           active -> acknowledged    (by the user; still active until resolved)
+
+The active alerts (by signature) and the unread ids live in memory.
+update() diffs the alerts raised by one sample against the active set and
+queues the transitions; a flush writes all queued transitions in a single
+transaction and publishes them as a single event:
+
+    {"type": "alert", "events": [{"event": "created" | "resolved" |
+     "acknowledged" | "deleted", "id": ..., "alert": {...}}, ...],
+     "unread_count": ...}
+
+With flush_seconds > 0, transitions are collected over that window (an
+alert raised and cleared within one window is inserted already resolved).
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def alert_to_dict(alert_id, alert, resolved_at=None):
+    """API representation of a newly created alert"""
+    return {
+        'id': alert_id,
+        'timestamp': alert.timestamp,
+        'severity': alert.severity,
+        'category': alert.category,
+        'title': alert.title,
+        'message': alert.message,
+        'component': alert.component,
+        'value': alert.value,
+        'threshold': alert.threshold,
+        'acknowledged': False,
+        'acknowledged_at': None,
+        'resolved': resolved_at is not None,
+        'resolved_at': resolved_at,
+        'deleted': False
+    }
+
+
+class AlertStore:
+    def __init__(self, db_file, signature, publish=None, flush_seconds=0.0):
+        """
+        - signature: function(alert) -> key used to deduplicate alerts
+        - publish: function(message) called once per flush with all events
+        """
+        self.db_file = db_file
+        self.signature = signature
+        self.publish = publish
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.active = {}  # Signature -> alert id (None while the INSERT is queued)
+        self.unread = set()  # Ids of unacknowledged, unresolved alerts
+        self._creates = []  # Queued [signature, alert, resolved_at]
+        self._create_by_signature = {}
+        self._resolves = {}  # Queued alert id -> resolved_at
+        self._closed = set()  # Active ids resolved by the user (deleted)
+        self._last_flush = 0.0
+
+    def load(self):
+        """Initialize the unread set from the database"""
+        try:
+            conn = sqlite3.connect(self.db_file)
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM alerts WHERE acknowledged = 0 AND resolved = 0')
+            ids = {row[0] for row in cursor.fetchall()}
+            conn.close()
+            with self.lock:
+                self.unread = ids
+        except Exception as e:
+            logger.error(f"Error loading unread alerts: {e}")
+
+    def unread_count(self):
+        with self.lock:
+            return len(self.unread)
+
+    def update(self, alerts):
+        """
+        Apply the alerts currently raised by the diagnosis engine: new
+        signatures are created, signatures no longer raised are resolved.
+        Flushes when the flush window has elapsed.
+        """
+        current = {}
+        for alert in alerts:
+            current.setdefault(self.signature(alert), alert)
+        with self.lock:
+            created = [alert for signature, alert in current.items() if signature not in self.active]
+            resolved = [signature for signature in self.active if signature not in current]
+            message = self._apply_locked(created, resolved)
+        if message and self.publish:
+            self.publish(message)
+
+    def apply(self, created, resolved):
+        """
+        Apply alert transitions computed elsewhere (e.g. by the diagnosis
+        worker): alerts newly raised and signatures no longer raised.
+        Alerts already active and signatures not active are ignored.
+        """
+        with self.lock:
+            message = self._apply_locked(created, resolved)
+        if message and self.publish:
+            self.publish(message)
+
+    def pending(self):
+        """Number of transitions queued for the next flush"""
+        return len(self._creates) + len(self._resolves)
+
+    def active_signatures(self):
+        with self.lock:
+            return list(self.active)
+
+    def _apply_locked(self, created, resolved):
+        for alert in created:
+            signature = self.signature(alert)
+            if signature not in self.active:
+                self.active[signature] = None
+                entry = [signature, alert, None]
+                self._creates.append(entry)
+                self._create_by_signature[signature] = entry
+
+        resolved_at = None
+        for signature in resolved:
+            if signature not in self.active:
+                continue
+            resolved_at = resolved_at or datetime.now().isoformat()
+            alert_id = self.active.pop(signature)
+            if alert_id is None:
+                # Raised and cleared within one flush window
+                self._create_by_signature.pop(signature)[2] = resolved_at
+            elif alert_id in self._closed:
+                self._closed.discard(alert_id)
+            else:
+                self._resolves[alert_id] = resolved_at
+            logger.info(f"Auto-resolved alert: {signature}")
+
+        if not (self._creates or self._resolves):
+            return None
+        if time.monotonic() - self._last_flush < self.flush_seconds:
+            return None
+        return self._flush_locked()
+
+    def flush(self):
+        """Write all queued transitions now"""
+        with self.lock:
+            message = self._flush_locked()
+        if message and self.publish:
+            self.publish(message)
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        creates, self._creates = self._creates, []
+        self._create_by_signature = {}
+        resolves = self._resolves
+        if not (creates or resolves):
+            return None
+
+        events = []
+        try:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                with conn:
+                    cursor = conn.cursor()
+                    for signature, alert, resolved_at in creates:
+                        cursor.execute('''
+                            INSERT INTO alerts
+                            (timestamp, severity, category, title, message, component, value, threshold,
+                             resolved, resolved_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', (
+                            alert.timestamp,
+                            alert.severity,
+                            alert.category,
+                            alert.title,
+                            alert.message,
+                            alert.component,
+                            alert.value,
+                            alert.threshold,
+                            resolved_at is not None,
+                            resolved_at
+                        ))
+                        alert.id = cursor.lastrowid
+                        events.append({'event': 'created', 'id': alert.id,
+                                       'alert': alert_to_dict(alert.id, alert, resolved_at)})
+                    if resolves:
+                        cursor.executemany('UPDATE alerts SET resolved = 1, resolved_at = ? WHERE resolved = 0 AND id = ?',
+                                           [(resolved_at, alert_id) for alert_id, resolved_at in resolves.items()])
+            finally:
+                conn.close()
+        except Exception as e:
+            # Resolves stay queued; failed creates are raised again by the next sample
+            logger.error(f"Error saving alerts: {e}")
+            for signature, alert, resolved_at in creates:
+                if resolved_at is None and self.active.get(signature, 0) is None:
+                    del self.active[signature]
+            return None
+
+        self._resolves = {}
+        for signature, alert, resolved_at in creates:
+            if resolved_at is None:
+                if signature in self.active:
+                    self.active[signature] = alert.id
+                self.unread.add(alert.id)
+                logger.info(f"New alert generated: {alert.title}")
+        for alert_id, resolved_at in resolves.items():
+            self.unread.discard(alert_id)
+            events.append({'event': 'resolved', 'id': alert_id,
+                           'alert': {'resolved': True, 'resolved_at': resolved_at}})
+        return self._message(events)
+
+    def _message(self, events):
+        return {"type": "alert", "events": events, "unread_count": len(self.unread)}
+
+    def acknowledge(self, alert_id):
+        """Acknowledge an alert. Returns False on a database error."""
+        acknowledged_at = datetime.now().isoformat()
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_file)
+                try:
+                    with conn:
+                        changed = conn.execute('UPDATE alerts SET acknowledged = 1, acknowledged_at = ? WHERE id = ?',
+                                               (acknowledged_at, alert_id)).rowcount > 0
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Error acknowledging alert: {e}")
+                return False
+            if not changed:
+                return True
+            self.unread.discard(alert_id)
+            message = self._message([{'event': 'acknowledged', 'id': alert_id,
+                                      'alert': {'acknowledged': True, 'acknowledged_at': acknowledged_at}}])
+        if self.publish:
+            self.publish(message)
+        return True
+
+    def delete(self, alert_id):
+        """Soft-delete an alert: marked deleted and resolved, so it leaves the active view"""
+        resolved_at = datetime.now().isoformat()
+        with self.lock:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                with conn:
+                    changed = conn.execute('UPDATE alerts SET deleted = 1, resolved = 1, resolved_at = ? WHERE id = ?',
+                                           (resolved_at, alert_id)).rowcount > 0
+            finally:
+                conn.close()
+            if not changed:
+                return
+            self.unread.discard(alert_id)
+            self._resolves.pop(alert_id, None)
+            if alert_id in self.active.values():
+                # Still raised: no new alert until the condition clears
+                self._closed.add(alert_id)
+            message = self._message([{'event': 'deleted', 'id': alert_id,
+                                      'alert': {'deleted': True, 'resolved': True, 'resolved_at': resolved_at}}])
+        if self.publish:
+            self.publish(message)
@@ -0,0 +1,248 @@
+"""
+Diagnosis benchmark: per-sample cost of DiagnosisEngine.analyze_measurement
+against the previous per-field scan, on a synthetic site with many MBs.
+
+Usage (from backend/):
+    python benchmarks/bench_diagnosis.py [--mbs 60] [--samples 2000] [--rules 0 20]
+
+--rules adds that many user-defined rules (half simple field/limit
+comparisons, half compound expressions) to the compiled engine.
+
+--churn also simulates a PV string hovering around pv_min with noise
+(1 sample/s) and counts the alert DB writes (created + resolved) with and
+without debounce/hysteresis.
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diagnosis import DiagnosisEngine  # noqa: E402
+
+logger = logging.getLogger("bench_diagnosis")
+
+
+def build_site(mb_count):
+    """Schema columns, MB categories and a base sample for `mb_count` MBs"""
+    columns = []
+    categories = {}
+    for i in range(mb_count):
+        kind = i % 4
+        if kind == 0:
+            mb_id, fields, category = f"VD{i}", ["V1D", "BattS", "Rssi"], "solar"
+        elif kind == 1:
+            mb_id, fields, category = f"ID{i}", ["I1D", "T_m", "BattS", "Rssi"], "solar"
+        elif kind == 2:
+            mb_id, fields, category = f"VB{i}", ["V1D", "I1D", "BattS", "Rssi"], "battery"
+        else:
+            mb_id, fields, category = f"WS{i}", ["G", "T_amb", "Hum", "BattS", "Rssi"], "other"
+        categories[mb_id] = category
+        columns.extend((mb_id, f) for f in fields)
+    columns.extend(("INVD", f) for f in ["PV1_V", "PV1_I", "PV2_V", "PV2_I", "Vbat", "Ibat",
+                                          "Vout", "Iout", "Pout", "BattS", "Rssi"])
+    return columns, categories
+
+
+def sample_values(columns, rng, fault_rate=0.002):
+    """A healthy sample; each value is out of range with probability `fault_rate`"""
+    values = []
+    for mb_id, field_name in columns:
+        if field_name.startswith("V") and "D" in field_name:
+            value = rng.uniform(45, 55) if mb_id.startswith("VB") else rng.uniform(200, 400)
+        elif field_name == "Rssi":
+            value = rng.uniform(-85, -40)
+        elif field_name.startswith("T"):
+            value = rng.uniform(10, 45)
+        elif field_name in ("PV1_V", "PV2_V"):
+            value = rng.uniform(200, 400)
+        elif field_name == "Vbat":
+            value = rng.uniform(45, 55)
+        else:
+            value = rng.uniform(0, 20)
+        if rng.random() < fault_rate:
+            value *= 3
+        values.append(value)
+    return values
+
+
+def to_data(columns, values):
+    data = {}
+    for (mb_id, field_name), value in zip(columns, values):
+        data.setdefault(mb_id, {})[field_name] = value
+    return data
+
+
+def legacy_analyze(thresholds, categories, data, invd_data):
+    """The previous per-field scan (voltage, current, temperature, RSSI and NaN checks)"""
+    alerts = []
+    for mb_id, fields in data.items():
+        nan_fields = [f for f, v in fields.items() if isinstance(v, str) and v.upper() == "NAN"]
+        if nan_fields:
+            alerts.append(("nan", mb_id, len(nan_fields)))
+    for check in ("V", "I"):
+        for mb_id, fields in data.items():
+            category = categories.get(mb_id, "other")
+            if check == "V":
+                logger.info(f"Checking voltages for {mb_id}, category: {category}")
+            for field_name, value in fields.items():
+                if value == "NaN" or value == "nan" or (isinstance(value, str) and value.upper() == "NAN"):
+                    continue
+                if not (field_name.startswith(check) and "D" in field_name and isinstance(value, (int, float))):
+                    continue
+                if check == "V" and (category == "solar" or (category == "other" and value > 100)):
+                    if value > thresholds["voltage"]["pv_max"]:
+                        alerts.append(f"PV voltage from {mb_id} ({value:.1f}V) exceeds maximum")
+                    elif value < thresholds["voltage"]["pv_min"] and value > 10:
+                        alerts.append(f"PV voltage from {mb_id} ({value:.1f}V) below minimum")
+                elif check == "V" and category == "battery":
+                    if value > thresholds["voltage"]["battery_max"]:
+                        alerts.append(f"Battery voltage from {mb_id} ({value:.1f}V) exceeds maximum")
+                    elif value < thresholds["voltage"]["battery_min"] and value > 10:
+                        alerts.append(f"Battery voltage from {mb_id} ({value:.1f}V) below minimum")
+                elif check == "I" and category == "solar":
+                    if value > thresholds["current"]["max_pv_current"]:
+                        alerts.append(f"PV current from {mb_id} ({value:.1f}A) exceeds maximum")
+                elif check == "I" and category == "battery":
+                    if value > thresholds["current"]["max_battery_current"]:
+                        alerts.append(f"Battery current from {mb_id} ({value:.1f}A) exceeds maximum")
+    for key in ("PV1_V", "PV2_V"):
+        value = invd_data.get(key)
+        if isinstance(value, (int, float)) and value > thresholds["voltage"]["pv_max"]:
+            alerts.append(f"Inverter {key} ({value:.1f}V) exceeds maximum")
+    for mb_id, fields in data.items():
+        if "T_m" in fields and isinstance(fields["T_m"], (int, float)) \
+                and fields["T_m"] > thresholds["temperature"]["panel_max"]:
+            alerts.append(f"Panel temperature ({fields['T_m']:.1f}°C) exceeds maximum")
+        if "T_amb" in fields and isinstance(fields["T_amb"], (int, float)):
+            if fields["T_amb"] > thresholds["temperature"]["ambient_max"]:
+                alerts.append(f"Ambient temperature ({fields['T_amb']:.1f}°C) is very high")
+    for mb_id, fields in data.items():
+        if "Rssi" in fields or "RSSI" in fields:
+            value = fields.get("Rssi", fields.get("RSSI"))
+            if isinstance(value, (int, float)) and value < thresholds["communication"]["min_rssi"]:
+                alerts.append(f"Measurement board {mb_id} has weak signal (RSSI: {value})")
+    return alerts
+
+
+def user_rules(count):
+    """Synthetic user-defined rules: alternating simple and compound expressions"""
+    rules = []
+    for i in range(count):
+        if i % 2 == 0:
+            rules.append({"id": f"simple_{i}", "when": f"*.V1D > {500 + i}"})
+        else:
+            rules.append({"id": f"compound_{i}",
+                          "when": f"*.I1D > INVD.PV1_I + {50 + i} and total_pv_power > 100",
+                          "severity": "INFO"})
+    return rules
+
+
+def run(mb_count, samples, rule_count=0, seed=1):
+    rng = random.Random(seed)
+    columns, categories = build_site(mb_count)
+    samples_values = [sample_values(columns, rng) for _ in range(samples)]
+    datas = [to_data(columns, values) for values in samples_values]
+    rows = [np.array(values) for values in samples_values]
+    calculations = [{
+        "total_pv_power": d["INVD"]["PV1_V"] * d["INVD"]["PV1_I"] + d["INVD"]["PV2_V"] * d["INVD"]["PV2_I"],
+        "battery_power": d["INVD"]["Vbat"] * d["INVD"]["Ibat"],
+    } for d in datas]
+
+    engine = DiagnosisEngine()
+    engine.enabled = True
+    engine.sensor_categories = categories
+    engine.set_columns(columns)
+    engine.set_rules(user_rules(rule_count))
+
+    start = time.perf_counter()
+    legacy_alerts = 0
+    for data in datas:
+        legacy_alerts += len(legacy_analyze(engine.thresholds, categories, data, data["INVD"]))
+    legacy = (time.perf_counter() - start) / samples
+
+    start = time.perf_counter()
+    compiled_alerts = 0
+    for i, (data, calcs, row) in enumerate(zip(datas, calculations, rows)):
+        compiled_alerts += len(engine.analyze_measurement(data, calcs, data["INVD"], row, now=float(i)))
+    compiled = (time.perf_counter() - start) / samples
+
+    return {
+        "mbs": mb_count,
+        "rules": rule_count,
+        "columns": len(columns),
+        "plan_entries": engine.plan_size,
+        "samples": samples,
+        "legacy_us_per_sample": legacy * 1e6,
+        "compiled_us_per_sample": compiled * 1e6,
+        "speedup": legacy / compiled if compiled else float("inf"),
+        "legacy_alerts": legacy_alerts,
+        "compiled_alerts": compiled_alerts,
+    }
+
+
+def alert_writes(engine, data_rows, calculations):
+    """DB writes the server would make: one per alert created and one per auto-resolve"""
+    active = set()
+    writes = 0
+    for i, (data, row) in enumerate(data_rows):
+        alerts = engine.analyze_measurement(data, calculations, data.get("INVD", {}), row, now=float(i))
+        current = {engine.get_alert_signature(a) for a in alerts}
+        writes += len(current - active) + len(active - current)
+        active = current
+    return writes
+
+
+def churn(samples, noise=3.0, seed=1):
+    """Alert writes for a V1D reading hovering around pv_min, with and without debounce"""
+    rng = random.Random(seed)
+    columns = [("VD1", "V1D")]
+    engine = DiagnosisEngine()
+    pv_min = engine.thresholds["voltage"]["pv_min"]
+    # Slow drift across the limit plus sample noise
+    values = [pv_min + 10 * np.sin(i / 300) + rng.gauss(0, noise) for i in range(samples)]
+    data_rows = [({"VD1": {"V1D": v}}, np.array([v])) for v in values]
+
+    results = {}
+    for name, debounce in (("raw", {"for_seconds": 0, "clear_seconds": 0, "hysteresis_pct": 0}),
+                           ("debounced", {"for_seconds": 30, "clear_seconds": 60, "hysteresis_pct": 2})):
+        engine = DiagnosisEngine()
+        engine.enabled = True
+        engine.sensor_categories = {"VD1": "solar"}
+        engine.thresholds = dict(engine.thresholds, debounce=debounce)
+        engine.set_columns(columns)
+        results[name] = alert_writes(engine, data_rows, {})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbs", type=int, nargs="+", default=[10, 60, 200])
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[0])
+    parser.add_argument("--churn", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'MBs':>5} {'rules':>5} {'cols':>5} {'plan':>5} {'legacy us':>10} {'compiled us':>12} "
+          f"{'speedup':>8} {'alerts':>7}")
+    for mb_count in args.mbs:
+        for rule_count in args.rules:
+            r = run(mb_count, args.samples, rule_count)
+            print(f"{r['mbs']:>5} {r['rules']:>5} {r['columns']:>5} {r['plan_entries']:>5} "
+                  f"{r['legacy_us_per_sample']:>10.1f} {r['compiled_us_per_sample']:>12.1f} {r['speedup']:>7.1f}x "
+                  f"{r['compiled_alerts']:>7}")
+
+    if args.churn:
+        writes = churn(args.samples)
+        print(f"\nAlert DB writes over {args.samples} samples near pv_min: "
+              f"raw {writes['raw']}, debounced {writes['debounced']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Benchmark suite for the backend hot paths, on synthetic sites scaled from
+stm_config.json (see synthetic.py).
+
+Usage (from backend/):
+    python benchmarks/bench_suite.py [--mbs 10 50 200 500] [--samples 300]
+        [--clients 1 10 50 200] [--spans month year 5y] [--only NAME ...]
+        [--json results.json] [--compare baseline.json] [--tolerance 0.25]
+
+Benchmarks (time per operation):
+- process_line: SerialManager.process_measurement_line (parse, calculate,
+  persist; diagnosis off)
+- calculate: SerialManager.calculate_power_energy
+- diagnose: DiagnosisEngine.analyze_measurement
+- persist: save_measurement_to_db
+- history: get_historical_data over synthetic 1-month, 1-year and 5-year
+  databases (INVD fields and calculations every --history-interval seconds,
+  cached in --cache-dir)
+- fanout: one measurement published to N WebSocket clients until every
+  client's sender task has sent it
+
+Each site size runs in its own process with PV_DASHBOARD_DATA_DIR pointing
+at a temporary directory, so nothing in backend/ is touched.
+
+--json writes the results with the environment (Python, NumPy, SQLite,
+CPUs, git revision) to compare releases; --compare lists the results whose
+median is slower than the baseline by more than --tolerance and exits with
+status 1 if there are any.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+SITE_BENCHMARKS = ("process_line", "calculate", "diagnose", "persist", "fanout")
+BENCHMARKS = SITE_BENCHMARKS + ("history",)
+SPANS = {"month": 30, "year": 365, "5y": 1826}
+SPAN_GRANULARITIES = {"month": ("hour", "day"), "year": ("day", "month"), "5y": ("day", "month")}
+
+
+def summarize(name, params, times):
+    """Result entry from per-operation times in seconds"""
+    us = sorted(t * 1e6 for t in times)
+    return {
+        "name": name,
+        "params": params,
+        "unit": "us",
+        "iterations": len(us),
+        "median": round(statistics.median(us), 3),
+        "mean": round(statistics.fmean(us), 3),
+        "p95": round(us[min(len(us) - 1, int(len(us) * 0.95))], 3),
+        "min": round(us[0], 3),
+    }
+
+
+def timed(function, inputs):
+    times = []
+    for item in inputs:
+        start = time.perf_counter()
+        function(item)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+class FakeWebSocket:
+    """Accepts every frame immediately (measures the server side of the fan-out)"""
+    client = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        pass
+
+    async def send_bytes(self, frame):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+async def fanout(messages, client_count):
+    from streaming import ConnectionManager
+
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(client_count)]
+    for websocket in sockets:
+        await manager.connect(websocket)
+    clients = list(manager.clients.values())
+    times = []
+    for message in messages:
+        start = time.perf_counter()
+        manager.publish(message)
+        while any(client.backlog for client in clients):
+            await asyncio.sleep(0)
+        times.append(time.perf_counter() - start)
+    for websocket in sockets:
+        manager.disconnect(websocket)
+    return times
+
+
+def run_site(mb_count, args):
+    """Benchmarks for one site size (in a process of its own: imports server)"""
+    data_dir = tempfile.mkdtemp(prefix=f"pv_bench_{mb_count}_")
+    schema = synthetic.write_data_dir(data_dir, mb_count)
+    os.environ["PV_DASHBOARD_DATA_DIR"] = data_dir
+
+    import logging
+    import server
+
+    logging.getLogger().setLevel(getattr(logging, args.log_level))
+    manager = server.serial_manager
+    manager.load_measurement_schema()
+    manager.load_assignments()
+    server.diagnosis_engine.enabled = False
+
+    columns = len(manager.calculator.columns)
+    params = {"mbs": mb_count, "columns": columns}
+    lines = synthetic.measurement_lines(schema, args.samples + args.warmup)
+    warm, lines = lines[:args.warmup], lines[args.warmup:]
+    only = set(args.only or BENCHMARKS)
+    results = []
+
+    for line in warm:
+        manager.process_measurement_line(line)
+    messages, ledgers = [], []
+    for line in lines:
+        start = time.perf_counter()
+        messages.append(manager.process_measurement_line(line))
+        ledgers.append((time.perf_counter() - start, list(manager.ledger_entries)))
+    if "process_line" in only:
+        results.append(summarize("process_line", params, [t for t, _ in ledgers]))
+
+    samples = [(m["data"], manager.calculator.row_from_data(m["data"]), m["calculations"], m["timestamp"])
+               for m in messages]
+
+    if "calculate" in only:
+        results.append(summarize("calculate", params,
+                                 timed(lambda s: manager.calculate_power_energy(s[0], s[1]), samples)))
+
+    if "diagnose" in only:
+        engine = server.diagnosis_engine
+        config = server.config_store.current().data
+        engine.set_config(config)
+        engine.set_sensor_categories(config)
+        engine.enabled = True
+        for i, (data, row, calcs, _) in enumerate(samples[:args.warmup]):
+            engine.analyze_measurement(data, calcs, data.get("INVD", {}), row, float(i))
+        clock = iter(range(len(samples)))
+        results.append(summarize("diagnose", dict(params, plan_entries=engine.plan_size), timed(
+            lambda s: engine.analyze_measurement(s[0], s[2], s[0].get("INVD", {}), s[1], float(next(clock))),
+            samples)))
+        engine.enabled = False
+
+    if "persist" in only:
+        entries = iter([ledger for _, ledger in ledgers])
+        results.append(summarize("persist", params, timed(
+            lambda s: server.save_measurement_to_db(s[3], s[0], s[2], next(entries)), samples)))
+
+    if "fanout" in only:
+        loop = asyncio.new_event_loop()
+        try:
+            for client_count in args.clients:
+                times = loop.run_until_complete(fanout(messages, client_count))
+                results.append(summarize("fanout", dict(params, clients=client_count), times))
+        finally:
+            loop.close()
+    return results
+
+
+def run_history(args):
+    """get_historical_data over the synthetic databases (imports server)"""
+    data_dir = tempfile.mkdtemp(prefix="pv_bench_history_")
+    synthetic.write_data_dir(data_dir, 10)
+    os.environ["PV_DASHBOARD_DATA_DIR"] = data_dir
+
+    import logging
+    import server
+
+    logging.getLogger().setLevel(getattr(logging, args.log_level))
+
+    def init_database(path):
+        previous, server.DB_FILE = server.DB_FILE, path
+        try:
+            server.init_database()
+        finally:
+            server.DB_FILE = previous
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    results = []
+    for span in args.spans:
+        days = SPANS[span]
+        path = os.path.join(args.cache_dir, f"history_{span}_{int(args.history_interval)}s.db")
+        started = time.perf_counter()
+        synthetic.history_db(path, init_database, days, args.history_interval)
+        built = time.perf_counter() - started
+        if built > 1:
+            print(f"Built {os.path.basename(path)} in {built:.1f} s", file=sys.stderr)
+        conn = sqlite3.connect(path)
+        start, end, rows = conn.execute('SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM measurements').fetchone()
+        conn.close()
+        server.DB_FILE = path
+        for granularity in SPAN_GRANULARITIES[span]:
+            times = timed(lambda _: server.get_historical_data(start, end, granularity), range(args.history_repeat))
+            results.append(summarize("history", {"span": span, "granularity": granularity,
+                                                 "interval_s": args.history_interval, "rows": rows}, times))
+    return results
+
+
+def environment():
+    import numpy as np
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                  capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _key(result):
+    return result["name"], json.dumps({k: v for k, v in result["params"].items() if k != "rows"}, sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+    """Results slower than the baseline median by more than `tolerance` (a fraction)"""
+    base = {_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        previous = base.get(_key(result))
+        if previous and previous["median"] > 0:
+            ratio = result["median"] / previous["median"]
+            result["baseline_median"] = previous["median"]
+            result["ratio"] = round(ratio, 3)
+            if ratio > 1 + tolerance:
+                regressions.append(result)
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<14} {'params':<46} {'median us':>11} {'p95 us':>11} {'n':>5} {'vs base':>8}")
+    for r in results:
+        params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+        ratio = f"{r['ratio']:.2f}x" if "ratio" in r else ""
+        print(f"{r['name']:<14} {params:<46} {r['median']:>11.1f} {r['p95']:>11.1f} {r['iterations']:>5} {ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbs", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--samples", type=int, default=300, help="measurement lines per site size")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--spans", nargs="+", choices=list(SPANS), default=list(SPANS))
+    parser.add_argument("--history-interval", type=float, default=300.0,
+                        help="seconds between samples in the synthetic history databases")
+    parser.add_argument("--history-repeat", type=int, default=3)
+    parser.add_argument("--cache-dir", default=os.path.join(BENCH_DIR, ".cache"))
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS)
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline results (a previous --json file)")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--part", help=argparse.SUPPRESS)  # Internal: run one part, print JSON
+    args = parser.parse_args()
+
+    if args.part:
+        results = run_history(args) if args.part == "history" else run_site(int(args.part), args)
+        print(json.dumps(results))
+        return 0
+
+    only = set(args.only or BENCHMARKS)
+    parts = [str(mb_count) for mb_count in args.mbs] if only & set(SITE_BENCHMARKS) else []
+    if "history" in only:
+        parts.append("history")
+    results = []
+    for part in parts:
+        command = [sys.executable, os.path.abspath(__file__), "--part", part] + sys.argv[1:]
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            print(f"Benchmark part {part} failed (exit code {completed.returncode})", file=sys.stderr)
+            return completed.returncode
+        results.extend(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} result(s) slower than the baseline by more than {args.tolerance:.0%}:")
+        for r in regressions:
+            print(f"  {r['name']} {r['params']}: {r['baseline_median']:.1f} -> {r['median']:.1f} us")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+End-to-end load harness: a virtual STM32 MASTER on a pseudo-terminal,
+the real server on the other end, and WebSocket clients measuring how long
+a CSV line takes from the serial port to a WebSocket frame.
+
+Usage (from backend/, Linux/macOS):
+    python benchmarks/load_harness.py [--mbs 50] [--clients 1]
+        [--rates 1 2 5 10 20 50 100] [--seconds 10] [--max-latency 1.0]
+        [--json results.json]
+
+The harness writes a synthetic site (see synthetic.py) to a temporary data
+directory and starts `uvicorn server:app` with PV_DASHBOARD_DATA_DIR set to
+it and PV_DASHBOARD_SERIAL_PORT set to the pty, so the server opens the
+virtual MASTER like a real one. Measurement is started with the
+"start_measurement" WebSocket command (CMD:START -> STATUS:RUNNING), then
+the MASTER streams lines at each rate in turn for --seconds.
+
+Per rate it reports the lines sent and delivered and the latency
+percentiles from the scheduled write of a line to its frame arriving at
+each client. A rate is sustained when every client got at least 99% of the
+lines and the p95 latency stays under --max-latency; the ramp stops at the
+first rate that is not, and the highest sustained rate is reported.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tty
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+DELIVERED_MIN = 0.99
+
+
+class VirtualMaster:
+    """
+    The MASTER's serial protocol (MASTER_persistent_state.ino) on a pty:
+    every line is echoed; CMD:START / CMD:STOP answer STATUS:RUNNING /
+    STATUS:STOPPED; CONFIG:START ... CONFIG:END replaces the schema. While
+    running, stream() writes measurement lines at a fixed rate.
+    """
+
+    def __init__(self, schema, delay=10):
+        self.schema = list(schema)
+        self.delay = delay
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)  # No echo or line editing by the pty itself
+        self.port = os.ttyname(self.slave_fd)
+        self.is_running = False
+        self.in_config = False
+        self.received = []  # Lines the server sent
+        self.sent = {}  # Timestamp of each measurement line -> scheduled write time (monotonic)
+        self.write_lock = threading.Lock()
+        self._config = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._values = []
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="virtual-master", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def write_line(self, line):
+        data = (line + "\r\n").encode("utf-8")
+        with self.write_lock:
+            while data:
+                data = data[os.write(self.master_fd, data):]
+
+    def _serve(self):
+        buffer = b""
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self.master_fd, 4096)
+            except OSError:
+                # The server closed the port (EIO on Linux); wait for it to reopen
+                time.sleep(0.1)
+                continue
+            buffer += chunk
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                line = raw.decode("utf-8", errors="replace").strip()
+                if line:
+                    self.handle(line)
+
+    def handle(self, line):
+        """One line from the server, answered as checkSerialConfig() does"""
+        self.received.append(line)
+        self.write_line(line)  # Echo back
+        command = line.upper()
+        if command == "CMD:START":
+            self.is_running = True
+            self.write_line("STATUS:RUNNING")
+        elif command == "CMD:STOP":
+            self.is_running = False
+            self.write_line("STATUS:STOPPED")
+        elif command == "CONFIG:START":
+            self.in_config = True
+            self._config = []
+            self.write_line("READY FOR CONFIG")
+        elif command == "CONFIG:END":
+            if not self.in_config:
+                self.write_line("WARN: CONFIG:END without START")
+                return
+            self.in_config = False
+            self.schema = self._config
+            self._values = []
+            self.write_line("CONFIG APPLIED")
+            self.write_line(f"MB count: {len(self.schema)}")
+            self.write_line(f"Loop delay: {self.delay}")
+        elif self.in_config:
+            entry = line[len("CONFIG:"):] if command.startswith("CONFIG:") else line
+            if entry.upper().startswith("DELAY="):
+                self.delay = int(entry.split("=", 1)[1])
+                return
+            parts = [p.strip() for p in entry.split(",")]
+            if len(parts) >= 2:
+                self._config.append((parts[0], parts[1:]))
+            else:
+                self.write_line(f"WARN: bad config line: {line}")
+
+    def stream(self, rate, seconds):
+        """Write measurement lines at `rate` per second for `seconds` (only while running)"""
+        if not self._values:
+            # Reuse a pool of readings; only the timestamp has to be unique
+            self._values = [line.split(",", 1)[1] for line in synthetic.measurement_lines(self.schema, 64)]
+        interval = 1.0 / rate
+        start = time.monotonic()
+        count = int(rate * seconds)
+        written = 0
+        for i in range(count):
+            scheduled = start + i * interval
+            wait = scheduled - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if not self.is_running:
+                continue
+            timestamp = datetime.now().isoformat(timespec="microseconds")
+            self.sent[timestamp] = scheduled
+            self.write_line(f"{timestamp},{self._values[i % len(self._values)]}")
+            written += 1
+        return written
+
+
+class FrameClient:
+    """A WebSocket client recording when each measurement frame arrives"""
+
+    def __init__(self, url):
+        self.url = url
+        self.arrivals = {}  # Timestamp -> arrival time (monotonic)
+        self.acks = asyncio.Queue()
+        self.websocket = None
+        self.task = None
+
+    async def connect(self, connect):
+        self.websocket = await connect(self.url, max_size=None)
+        self.task = asyncio.create_task(self._receive())
+
+    async def _receive(self):
+        async for frame in self.websocket:
+            arrived = time.monotonic()
+            if isinstance(frame, bytes):
+                continue
+            message = json.loads(frame)
+            kind = message.get("type")
+            if kind == "measurement":
+                self.arrivals[message.get("timestamp")] = arrived
+            elif kind == "command_ack":
+                await self.acks.put(message)
+
+    async def command(self, command, timeout=10.0):
+        await self.websocket.send(json.dumps({"command": command}))
+        return await asyncio.wait_for(self.acks.get(), timeout)
+
+    async def close(self):
+        await self.websocket.close()
+        self.task.cancel()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir, serial_port, http_port):
+    env = dict(os.environ, PV_DASHBOARD_DATA_DIR=data_dir, PV_DASHBOARD_SERIAL_PORT=serial_port)
+    log = open(os.path.join(data_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+         "--port", str(http_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} (see {log.name})")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{http_port}/api/config", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not start (see {log.name})")
+
+
+def step_result(rate, seconds, timestamps, clients):
+    sent = len(timestamps)
+    latencies, delivered = [], []
+    for client in clients:
+        got = [client.arrivals[ts] - scheduled for ts, scheduled in timestamps.items() if ts in client.arrivals]
+        delivered.append(len(got))
+        latencies.extend(got)
+    ms = np.array(latencies) * 1000.0
+    result = {
+        "rate": rate,
+        "seconds": seconds,
+        "sent": sent,
+        "delivered_min": min(delivered) if delivered else 0,
+        "delivered_ratio": round(min(delivered) / sent, 4) if sent and delivered else 0.0,
+    }
+    if len(ms):
+        result.update({f"p{p}_ms": round(float(np.percentile(ms, p)), 2) for p in (50, 95, 99)})
+        result["max_ms"] = round(float(ms.max()), 2)
+    return result
+
+
+async def run(args, master, http_port):
+    try:
+        from websockets.asyncio.client import connect
+    except ImportError:
+        try:
+            from websockets import connect
+        except ImportError:
+            raise SystemExit("The load harness needs the 'websockets' package (pip install websockets)")
+
+    clients = [FrameClient(f"ws://127.0.0.1:{http_port}/ws") for _ in range(args.clients)]
+    for client in clients:
+        await client.connect(connect)
+
+    ack = await clients[0].command("start_measurement")
+    if ack.get("status") != "success":
+        raise RuntimeError(f"CMD:START failed: {ack.get('message')}")
+
+    steps, sustained = [], None
+    for rate in args.rates:
+        master.sent = {}
+        await asyncio.to_thread(master.stream, rate, args.seconds)
+        timestamps = dict(master.sent)
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline and any(
+                len(timestamps.keys() - client.arrivals.keys()) for client in clients):
+            await asyncio.sleep(0.05)
+        result = step_result(rate, args.seconds, timestamps, clients)
+        result["sustained"] = (result["delivered_ratio"] >= DELIVERED_MIN
+                               and result.get("p95_ms", float("inf")) <= args.max_latency * 1000.0)
+        steps.append(result)
+        print(f"{rate:>8g} lines/s  sent {result['sent']:>6}  delivered {result['delivered_ratio']:>7.2%}  "
+              f"p50 {result.get('p50_ms', float('nan')):>9.1f} ms  p95 {result.get('p95_ms', float('nan')):>9.1f} ms  "
+              f"p99 {result.get('p99_ms', float('nan')):>9.1f} ms  {'ok' if result['sustained'] else 'NOT SUSTAINED'}")
+        for client in clients:
+            client.arrivals.clear()
+        if not result["sustained"]:
+            break
+        sustained = rate
+
+    await clients[0].command("stop_measurement")
+    for client in clients:
+        await client.close()
+    return steps, sustained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbs", type=int, default=50, help="measurement boards of the synthetic site")
+    parser.add_argument("--clients", type=int, default=1, help="WebSocket clients")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1, 2, 5, 10, 20, 50, 100],
+                        help="lines per second, in increasing order")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of each rate")
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for late frames after each rate")
+    parser.add_argument("--max-latency", type=float, default=1.0, help="p95 latency (s) a sustained rate must stay under")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="pv_load_")
+    schema = synthetic.write_data_dir(data_dir, args.mbs)
+    master = VirtualMaster(schema)
+    master.start()
+    http_port = _free_port()
+    print(f"Virtual MASTER on {master.port}; server data in {data_dir}")
+    server = start_server(data_dir, master.port, http_port)
+    try:
+        steps, sustained = asyncio.run(run(args, master, http_port))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        master.close()
+
+    print(f"\nMaximum sustained rate: {f'{sustained:g} lines/s' if sustained else 'none of the tested rates'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mbs": args.mbs, "clients": args.clients, "max_latency_s": args.max_latency,
+                       "max_sustained_rate": sustained, "steps": steps}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
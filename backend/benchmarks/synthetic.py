@@ -0,0 +1,200 @@
+"""
+Synthetic sites and data for the benchmarks, scaled from stm_config.json.
+
+A site of N measurement boards keeps the singleton boards of the template
+(INVD, WS) and fills the rest by cycling through the other template boards
+with new numbers (VD1 -> VD12, field V1D -> V12D). Every VD/ID pair is
+assigned to a PV string, every VA/IA pair to a battery sensor.
+"""
+
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_FILE = os.path.join(BACKEND_DIR, "stm_config.json")
+SINGLETONS = ("INVD", "WS")
+INVD_FIELDS = ("PV1_V", "PV1_I", "PV2_V", "PV2_I", "Vbat", "Ibat", "Vout", "Iout", "Pout")
+STRINGS_PER_ARRAY = 20
+
+
+def load_template(path=TEMPLATE_FILE):
+    """[(mb_id, [fields])] and the measurement delay from an stm_config.json"""
+    schema, delay = [], 10
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("CONFIG:DELAY="):
+                delay = int(line.split("=", 1)[1])
+            elif line and not line.startswith("CONFIG:"):
+                parts = [p.strip() for p in line.split(",")]
+                if len(parts) >= 2:
+                    schema.append((parts[0], parts[1:]))
+    return schema, delay
+
+
+def _renumber(name, number):
+    return re.sub(r"\d+", str(number), name, count=1)
+
+
+def build_site(mb_count, template=None):
+    """
+    Schema [(mb_id, [fields])] of `mb_count` boards and the matching
+    config.json assignments and sensors.
+    """
+    template, _ = template or load_template()
+    singletons = [(mb_id, fields) for mb_id, fields in template if mb_id in SINGLETONS]
+    boards = [(mb_id, fields) for mb_id, fields in template if mb_id not in SINGLETONS]
+    schema = list(singletons[:mb_count])
+    number = 0
+    while len(schema) < mb_count and boards:
+        number += 1
+        for mb_id, fields in boards:
+            if len(schema) == mb_count:
+                break
+            schema.append((_renumber(mb_id, number),
+                           [_renumber(f, number) if re.search(r"\d", f) else f for f in fields]))
+
+    ids = {mb_id for mb_id, _ in schema}
+    assignments, sensors = {}, []
+    for n in range(1, number + 1):
+        if f"VD{n}" in ids and f"ID{n}" in ids:
+            assignments[f"arr-{(n - 1) // STRINGS_PER_ARRAY + 1}-str-{n}"] = [f"VD{n}", f"ID{n}"]
+        if f"VA{n}" in ids and f"IA{n}" in ids:
+            sensor_id = f"sens-battery-{n}"
+            assignments[sensor_id] = [f"IA{n}", f"VA{n}"]
+            sensors.append({"id": sensor_id, "type": "Battery", "category": "battery"})
+    if "INVD" in ids:
+        assignments["sens-inverter"] = ["INVD"]
+        sensors.append({"id": "sens-inverter", "type": "Inverter", "category": "inverter"})
+    if "WS" in ids:
+        assignments["sens-weather"] = ["WS"]
+        sensors.append({"id": "sens-weather", "type": "Weather", "category": "environmental"})
+    return schema, assignments, sensors
+
+
+def stm_config_text(schema, delay=10):
+    lines = ["CONFIG:START", f"CONFIG:DELAY={delay}"]
+    lines += [",".join([mb_id, *fields]) for mb_id, fields in schema]
+    lines.append("CONFIG:END")
+    return "\n".join(lines) + "\n"
+
+
+def write_data_dir(path, mb_count, delay=10):
+    """
+    Populate a data directory (PV_DASHBOARD_DATA_DIR) for `mb_count` boards:
+    stm_config.json, config.json (based on the backend's) and mb_list.json.
+    """
+    os.makedirs(path, exist_ok=True)
+    schema, assignments, sensors = build_site(mb_count)
+    with open(os.path.join(path, "stm_config.json"), "w") as f:
+        f.write(stm_config_text(schema, delay))
+    with open(os.path.join(BACKEND_DIR, "config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config.update({"assignments": assignments, "sensors": sensors, "measurementDelay": delay})
+    with open(os.path.join(path, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    with open(os.path.join(path, "mb_list.json"), "w", encoding="utf-8") as f:
+        json.dump({"mb_list": [{"id": mb_id, "config": fields} for mb_id, fields in schema]}, f, indent=2)
+    return schema
+
+
+def value_for(field_name, rng, hour=12.0):
+    """A plausible reading for a field, following the daylight curve at `hour`"""
+    sun = max(0.0, math.sin(math.pi * (hour - 6.0) / 12.0))
+    if field_name == "Rssi" or field_name == "RSSI":
+        return rng.uniform(-85, -45)
+    if field_name.startswith("Batt"):
+        return rng.uniform(3.6, 4.2)
+    if field_name.startswith("T_"):
+        return rng.uniform(10, 25) + 25 * sun
+    if field_name in ("PV1_V", "PV2_V"):
+        return 320 * sun + rng.uniform(0, 10)
+    if field_name in ("PV1_I", "PV2_I"):
+        return 9 * sun + rng.uniform(0, 0.2)
+    if field_name == "Vbat":
+        return rng.uniform(48, 54)
+    if field_name == "Ibat":
+        return rng.uniform(-20, 20)
+    if field_name == "Vout":
+        return rng.uniform(225, 235)
+    if field_name == "Iout":
+        return rng.uniform(0, 15)
+    if field_name == "Pout":
+        return 3000 * sun + rng.uniform(0, 100)
+    if field_name == "G":
+        return 1000 * sun
+    if field_name.startswith("V"):
+        return 300 * sun + rng.uniform(0, 20) if field_name.endswith("D") else rng.uniform(48, 54)
+    if field_name.startswith("I") or field_name.startswith("A"):
+        return 8 * sun + rng.uniform(0, 0.5)
+    return rng.uniform(0, 100)
+
+
+def measurement_lines(schema, count, start=None, interval=10.0, nan_rate=0.01, seed=1):
+    """CSV lines as sent by the MASTER: timestamp, then every field in schema order"""
+    rng = random.Random(seed)
+    start = start or datetime(2025, 6, 1, 6, 0, 0)
+    fields = [f for _, fs in schema for f in fs]
+    lines = []
+    for i in range(count):
+        t = start + timedelta(seconds=i * interval)
+        hour = t.hour + t.minute / 60.0
+        values = ["NaN" if rng.random() < nan_rate else f"{value_for(f, rng, hour):.3f}" for f in fields]
+        lines.append(",".join([t.isoformat(), *values]))
+    return lines
+
+
+def history_db(path, init_database, days, interval=300.0, mbs=("INVD",), seed=1):
+    """
+    A measurements database covering `days` days up to 2025-12-31 at one
+    sample per `interval` seconds: calculations, the fields of `mbs` (INVD
+    by default, what get_historical_data reads) and a daily energy ledger.
+    init_database(path) creates the schema. Reused if it already exists.
+    """
+    if os.path.exists(path):
+        return path
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    init_database(tmp_path)
+    rng = random.Random(seed)
+    schema, _, _ = build_site(max(len(mbs), 2))
+    fields = {mb_id: list(INVD_FIELDS) if mb_id == "INVD" else dict(schema).get(mb_id, []) for mb_id in mbs}
+    end = datetime(2026, 1, 1)
+    start = end - timedelta(days=days)
+    steps = int(days * 86400 / interval)
+
+    def samples():
+        for i in range(steps):
+            t = start + timedelta(seconds=i * interval)
+            yield t, t.isoformat(), t.hour + t.minute / 60.0
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.executemany('''
+                INSERT INTO calculations (timestamp, total_pv_power, battery_soc, battery_voltage, battery_power,
+                                          consumption_power, daily_energy, monthly_energy, total_energy)
+                VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0)
+            ''', ((ts, value_for("Pout", rng, hour), rng.uniform(40, 90), rng.uniform(48, 54),
+                   rng.uniform(-500, 500), rng.uniform(200, 1500)) for _, ts, hour in samples()))
+            conn.executemany(
+                'INSERT INTO measurements (timestamp, mb_id, field_name, value) VALUES (?, ?, ?, ?)',
+                ((ts, mb_id, f, value_for(f, rng, hour))
+                 for _, ts, hour in samples() for mb_id, fs in fields.items() for f in fs))
+            conn.executemany('''
+                INSERT INTO energy_ledger (point_id, day, array_id, energy_kwh, samples, first_seen, last_seen)
+                VALUES ('arr-1-str-1', ?, 'arr-1', ?, 1, ?, ?)
+            ''', (((start + timedelta(days=d)).date().isoformat(), rng.uniform(5, 25),
+                   (start + timedelta(days=d)).isoformat(), (start + timedelta(days=d)).isoformat())
+                  for d in range(days)))
+    finally:
+        conn.close()
+    shutil.move(tmp_path, path)
+    return path
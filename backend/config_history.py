@@ -0,0 +1,304 @@
+"""
+Config History
+Append-only history of config.json saves in the config_history table.
+
+Every save appends one row: a full copy of the config every
+FULL_SNAPSHOT_EVERY entries, otherwise a JSON Patch (RFC 6902) against the
+previous entry. The latest config is kept in memory, so a save costs one
+diff of the config and one INSERT, independent of the history length.
+Reading entry N applies at most FULL_SNAPSHOT_EVERY - 1 patches to the
+closest full snapshot before it.
+
+Rows: id, timestamp (indexed), kind ('full' | 'delta'), data (config or
+patch JSON), changes (number of patch operations against the previous
+entry) and keys (top-level config keys that changed).
+
+The former config_history.json (a list of {timestamp, config}) is imported
+once by migrate_json() and renamed to config_history.json.migrated.
+"""
+
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+FULL_SNAPSHOT_EVERY = 20
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def json_diff(old, new, path=""):
+    """JSON Patch operations that turn `old` into `new`"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(json_diff(old[key], value, child))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            ops.extend(json_diff(a, b, f"{path}/{i}"))
+        return ops
+    # JSON types: 1, 1.0 and true are different values
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(doc, ops):
+    """Apply JSON Patch add/remove/replace operations to a copy of doc"""
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        kind, path = op.get("op"), op.get("path", "")
+        value = copy.deepcopy(op.get("value"))
+        if path == "":
+            if kind not in ("add", "replace"):
+                raise PatchError(f"cannot {kind} the whole document")
+            doc = value
+            continue
+        tokens = [_unescape(t) for t in path.split("/")[1:]]
+        parent = doc
+        try:
+            for token in tokens[:-1]:
+                parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+            last = tokens[-1]
+            if isinstance(parent, list):
+                index = len(parent) if last == "-" else int(last)
+                if kind == "add":
+                    parent.insert(index, value)
+                elif kind == "remove":
+                    del parent[index]
+                elif kind == "replace":
+                    parent[index] = value
+                else:
+                    raise PatchError(f"unsupported operation {kind!r}")
+            else:
+                if kind in ("add", "replace"):
+                    if kind == "replace" and last not in parent:
+                        raise PatchError(f"no value at {path}")
+                    parent[last] = value
+                elif kind == "remove":
+                    del parent[last]
+                else:
+                    raise PatchError(f"unsupported operation {kind!r}")
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            if isinstance(e, PatchError):
+                raise
+            raise PatchError(f"cannot {kind} {path}: {e}") from e
+    return doc
+
+
+def _changed_keys(ops):
+    keys = []
+    for op in ops:
+        token = op["path"].split("/")[1] if op["path"] else ""
+        key = _unescape(token)
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+class ConfigHistory:
+    def __init__(self, db_file, full_every=FULL_SNAPSHOT_EVERY):
+        self.db_file = db_file
+        self.full_every = full_every
+        self.lock = threading.Lock()
+        self._loaded = False
+        self._last = None  # Config of the latest entry
+        self._since_full = 0  # Deltas appended since the latest full snapshot
+
+    def _load_locked(self, conn):
+        """Reconstruct the latest entry once (the in-memory base for the next delta)"""
+        if self._loaded:
+            return
+        row = conn.execute('SELECT id FROM config_history ORDER BY id DESC LIMIT 1').fetchone()
+        if row:
+            self._last = self._reconstruct(conn, row[0])
+            full_id = conn.execute("SELECT MAX(id) FROM config_history WHERE kind = 'full'").fetchone()[0] or 0
+            self._since_full = conn.execute('SELECT COUNT(*) FROM config_history WHERE id > ?',
+                                            (full_id,)).fetchone()[0]
+        self._loaded = True
+
+    def _append_locked(self, cursor, config, timestamp):
+        ops = json_diff(self._last, config) if self._last is not None else None
+        full = ops is None or self._since_full + 1 >= self.full_every
+        cursor.execute('''
+            INSERT INTO config_history (timestamp, kind, data, changes, keys)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            timestamp,
+            'full' if full else 'delta',
+            json.dumps(config if full else ops),
+            None if ops is None else len(ops),
+            json.dumps(_changed_keys(ops)) if ops is not None else None,
+        ))
+        self._last = copy.deepcopy(config)
+        self._since_full = 0 if full else self._since_full + 1
+        return cursor.lastrowid
+
+    def append(self, config, timestamp=None):
+        """Record a saved config. Returns the entry id, or None on a database error."""
+        timestamp = timestamp or datetime.now().isoformat()
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_file)
+                try:
+                    self._load_locked(conn)
+                    last, since_full = self._last, self._since_full
+                    try:
+                        with conn:
+                            return self._append_locked(conn.cursor(), config, timestamp)
+                    except Exception:
+                        self._last, self._since_full = last, since_full
+                        raise
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Error saving config history: {e}")
+                return None
+
+    def migrate_json(self, path):
+        """Import a legacy config_history.json (if present) and rename it"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            entries = json.loads(content) if content else []
+            if not isinstance(entries, list):
+                entries = []
+        except Exception as e:
+            logger.error(f"Failed to read {os.path.basename(path)} for migration: {e}")
+            return 0
+
+        imported = 0
+        with self.lock:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                if conn.execute('SELECT COUNT(*) FROM config_history').fetchone()[0] == 0:
+                    with conn:
+                        cursor = conn.cursor()
+                        for entry in entries:
+                            if isinstance(entry, dict) and isinstance(entry.get("config"), dict):
+                                self._append_locked(cursor, entry["config"],
+                                                    entry.get("timestamp") or datetime.now().isoformat())
+                                imported += 1
+                    self._loaded = True
+            except Exception:
+                self._loaded, self._last, self._since_full = False, None, 0
+                raise
+            finally:
+                conn.close()
+        os.replace(path, path + ".migrated")
+        logger.info(f"Migrated {imported} config history entries from {os.path.basename(path)}")
+        return imported
+
+    def _reconstruct(self, conn, entry_id):
+        base = conn.execute('''
+            SELECT id, data FROM config_history WHERE id <= ? AND kind = 'full' ORDER BY id DESC LIMIT 1
+        ''', (entry_id,)).fetchone()
+        if base is None:
+            return None
+        config = json.loads(base[1])
+        for (data,) in conn.execute('SELECT data FROM config_history WHERE id > ? AND id <= ? ORDER BY id',
+                                    (base[0], entry_id)):
+            config = apply_patch(config, json.loads(data))
+        return config
+
+    def list(self, limit=DEFAULT_PAGE_SIZE, before=None, since=None, until=None):
+        """
+        One page of entries, newest first (no configs, only what changed).
+        `before` is the `next_before` of the previous page; since/until are
+        ISO timestamps.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = [], []
+        if before is not None:
+            where.append('id < ?')
+            params.append(before)
+        if since:
+            where.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            where.append('timestamp < ?')
+            params.append(until)
+        conn = sqlite3.connect(self.db_file)
+        try:
+            rows = conn.execute(f'''
+                SELECT id, timestamp, kind, changes, keys FROM config_history
+                {'WHERE ' + ' AND '.join(where) if where else ''}
+                ORDER BY id DESC LIMIT ?
+            ''', (*params, limit + 1)).fetchall()
+        finally:
+            conn.close()
+        entries = [{
+            'id': row[0],
+            'timestamp': row[1],
+            'kind': row[2],
+            'changes': row[3],
+            'keys': json.loads(row[4]) if row[4] else [],
+        } for row in rows[:limit]]
+        return {
+            'entries': entries,
+            'next_before': entries[-1]['id'] if len(rows) > limit else None,
+        }
+
+    def get(self, entry_id):
+        """{id, timestamp, config} of an entry, or None"""
+        conn = sqlite3.connect(self.db_file)
+        try:
+            row = conn.execute('SELECT id, timestamp FROM config_history WHERE id = ?', (entry_id,)).fetchone()
+            if row is None:
+                return None
+            return {'id': row[0], 'timestamp': row[1], 'config': self._reconstruct(conn, entry_id)}
+        finally:
+            conn.close()
+
+    def diff(self, entry_id, against=None):
+        """
+        JSON Patch from entry `against` (default: the entry before) to
+        `entry_id`, or None if either entry does not exist.
+        """
+        conn = sqlite3.connect(self.db_file)
+        try:
+            row = conn.execute('SELECT id, kind, data FROM config_history WHERE id = ?', (entry_id,)).fetchone()
+            if row is None:
+                return None
+            if against is None:
+                previous = conn.execute('SELECT MAX(id) FROM config_history WHERE id < ?', (entry_id,)).fetchone()[0]
+                if row[1] == 'delta':
+                    return {'from': previous, 'to': entry_id, 'patch': json.loads(row[2])}
+                against = previous
+            new = self._reconstruct(conn, entry_id)
+            if against is None:
+                # The first entry: everything was added
+                return {'from': None, 'to': entry_id, 'patch': json_diff({}, new)}
+            if conn.execute('SELECT 1 FROM config_history WHERE id = ?', (against,)).fetchone() is None:
+                return None
+            return {'from': against, 'to': entry_id, 'patch': json_diff(self._reconstruct(conn, against), new)}
+        finally:
+            conn.close()
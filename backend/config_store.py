@@ -0,0 +1,163 @@
+"""
+Config Store
+Shared in-memory snapshots of the JSON configuration files (config.json,
+mb_list.json), so no request or sample reads or parses them from disk.
+
+A ConfigSnapshot is parsed once and never modified: save()/update() write
+the file atomically (temporary file + rename) and swap in a new snapshot,
+and a watcher thread reloads the file when its mtime or size changes (an
+edit by hand or by another process). Readers call `store.current()`, a
+plain attribute read, and must treat `snapshot.data` as read-only.
+
+Each snapshot keeps the file's bytes and an ETag, so endpoints can serve
+the body as-is and answer If-None-Match with 304.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 2.0
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    data: dict  # Parsed JSON (read-only by convention)
+    body: bytes  # The file content (or the serialized default)
+    etag: str
+    stat: Optional[Tuple[int, int]]  # (mtime_ns, size) of the file, None if it does not exist
+    version: int
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class ConfigStore:
+    def __init__(self, path, default=None, poll_seconds=DEFAULT_POLL_SECONDS):
+        """
+        - default: data used while the file does not exist
+        - poll_seconds: how often the watcher checks the file for changes
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.default = {} if default is None else default
+        self.poll_seconds = poll_seconds
+        self.lock = threading.RLock()  # Serializes writers and reloads
+        self.listeners = []
+        self._version = 0
+        self._bad_stat = None  # Stat of a file that failed to parse (logged once)
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            snapshot = self._read()
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read {self.name}: {e}")
+            snapshot = None
+        self._snapshot = snapshot or self._make(self.default, json.dumps(self.default).encode("utf-8"), None)
+
+    def current(self) -> ConfigSnapshot:
+        return self._snapshot
+
+    def subscribe(self, listener):
+        """Call listener(snapshot) after every swap (save, update or reload)"""
+        self.listeners.append(listener)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _make(self, data, body, stat):
+        self._version += 1
+        return ConfigSnapshot(data, body, _etag(body), stat, self._version)
+
+    def _read(self):
+        stat = self._stat()
+        if stat is None:
+            return None
+        with open(self.path, "rb") as f:
+            body = f.read()
+        return self._make(json.loads(body), body, stat)
+
+    def _swap(self, snapshot):
+        self._snapshot = snapshot
+        for listener in list(self.listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Error applying {self.name}: {e}")
+
+    def reload(self):
+        """Swap in the file's content if it changed on disk. Returns True if it did."""
+        with self.lock:
+            stat = self._stat()
+            if stat is None or stat == self._snapshot.stat or stat == self._bad_stat:
+                return False
+            try:
+                snapshot = self._read()
+            except (OSError, ValueError) as e:
+                # Keep serving the last good snapshot (e.g. a half-written manual edit)
+                logger.error(f"Ignoring unreadable {self.name}: {e}")
+                self._bad_stat = stat
+                return False
+            if snapshot is None:
+                return False
+            self._bad_stat = None
+            self._swap(snapshot)
+        logger.info(f"Reloaded {self.name} (changed on disk)")
+        return True
+
+    def save(self, data):
+        """Write data to the file atomically and swap it in. Returns (success, message)."""
+        body = json.dumps(data, indent=2).encode("utf-8")
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(body)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"Failed to save {self.name}: {e}")
+                return False, str(e)
+            self._swap(self._make(data, body, self._stat()))
+        return True, "Config saved successfully"
+
+    def update(self, changes):
+        """Save the current data with the given top-level keys replaced"""
+        with self.lock:
+            return self.save({**self._snapshot.data, **changes})
+
+    def start(self):
+        """Start watching the file for changes made outside this process"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name=f"config-watch-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error watching {self.name}: {e}")
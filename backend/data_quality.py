@@ -0,0 +1,309 @@
+"""
+Data Quality
+Per-MB data-quality counters, maintained at ingest and rolled up into
+hourly and daily rows of the data_quality table, so sensor-health reports
+never scan the measurements table.
+
+Per board and period:
+- lines: measurement lines received, present: lines with any value from the board
+- expected: lines expected from the measurement delay (CONFIG:DELAY) while
+  measuring and the dashboard was running; missing rate = 1 - present / expected
+- values / nan_count: field values received / missing (NaN) in those lines
+- out_of_range: values outside the plausible range of their field kind
+  (PLAUSIBLE_RANGES, overridable per field name in config.json
+  "dataQuality": {"ranges": {"Rssi": [-120, 0]}})
+- RSSI and BattS: sum, count, min and max (the mean per period gives the trend)
+
+Counters are NumPy arrays per board, updated with a few bincounts per
+sample. flush() adds them to the current hour and day rows (an UPSERT that
+sums, so restarts and partial hours just add up) and resets them; it runs
+from a watcher thread every FLUSH_SECONDS and when a sample crosses into
+the next hour.
+"""
+
+import logging
+import math
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = 60.0
+MIN_DELAY_SECONDS = 1.0
+
+# Plausible values per field kind: anything outside is a sensor or decoding error
+PLAUSIBLE_RANGES = {
+    "voltage": (-5.0, 1500.0),
+    "current": (-250.0, 250.0),
+    "temperature": (-40.0, 125.0),
+    "rssi": (-130.0, 0.0),
+    "battery": (0.0, 100.0),
+}
+
+COUNTERS = ("lines", "present", "expected", "fields", "nan_count", "out_of_range",
+            "rssi_sum", "rssi_n", "batt_sum", "batt_n")
+EXTREMES = ("rssi_min", "rssi_max", "batt_min", "batt_max")
+
+
+def field_kind(field_name):
+    """Field kind for the plausibility check (same prefixes as the power calculator)"""
+    if field_name in ("Rssi", "RSSI"):
+        return "rssi"
+    if field_name.startswith("Batt"):
+        return "battery"
+    if field_name.startswith("T_"):
+        return "temperature"
+    if field_name.startswith("V"):
+        return "voltage"
+    if field_name.startswith("I") or field_name.startswith("A"):
+        return "current"
+    return None
+
+
+def _hour(epoch):
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%dT%H:00:00")
+
+
+class DataQualityCollector:
+    def __init__(self, db_file, flush_seconds=FLUSH_SECONDS):
+        self.db_file = db_file
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.delay = 10.0
+        self.measuring = True
+        self.range_overrides = {}
+        self.columns = []
+        self.mb_ids = []
+        self._hour = None  # Hour the pending counters belong to
+        self._clock = None  # Up to when `expected` has been accrued
+        self._stop = threading.Event()
+        self._thread = None
+        self.set_columns([])
+
+    def set_columns(self, columns):
+        """Compile the per-column lookups for a new schema (pending counters are flushed first)"""
+        self.flush()
+        with self.lock:
+            self.columns = list(columns)
+            self.mb_ids = list(dict.fromkeys(mb_id for mb_id, _ in self.columns))
+            index = {mb_id: i for i, mb_id in enumerate(self.mb_ids)}
+            self.column_mb = np.array([index[mb_id] for mb_id, _ in self.columns], dtype=np.intp)
+            self._compile_ranges_locked()
+
+            def lookup(kind):
+                cols = np.full(len(self.mb_ids), -1, dtype=np.intp)
+                for i, (mb_id, field_name) in enumerate(self.columns):
+                    if field_kind(field_name) == kind and cols[index[mb_id]] < 0:
+                        cols[index[mb_id]] = i
+                return cols
+
+            self.rssi_cols = lookup("rssi")
+            self.batt_cols = lookup("battery")
+            self._reset_locked()
+
+    def _compile_ranges_locked(self):
+        low = np.full(len(self.columns), -np.inf)
+        high = np.full(len(self.columns), np.inf)
+        for i, (_, field_name) in enumerate(self.columns):
+            limits = self.range_overrides.get(field_name) or PLAUSIBLE_RANGES.get(field_kind(field_name))
+            if limits:
+                low[i], high[i] = limits
+        self.low, self.high = low, high
+
+    def configure(self, config):
+        """Measurement delay, measuring state and range overrides from config.json"""
+        try:
+            delay = float(config.get("measurementDelay") or 10)
+        except (TypeError, ValueError):
+            delay = 10.0
+        overrides = {}
+        for field_name, limits in ((config.get("dataQuality") or {}).get("ranges") or {}).items():
+            try:
+                low, high = limits
+                overrides[field_name] = (-math.inf if low is None else float(low),
+                                         math.inf if high is None else float(high))
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid data quality range for {field_name}: {limits!r}")
+        with self.lock:
+            self._accrue_locked(time.time())
+            self.delay = max(MIN_DELAY_SECONDS, delay)
+            self.measuring = bool(config.get("isMeasuring", True))
+            self.range_overrides = overrides
+            self._compile_ranges_locked()
+
+    def _reset_locked(self):
+        boards = len(self.mb_ids)
+        self.counters = {name: np.zeros(boards) for name in COUNTERS}
+        self.extremes = {name: np.full(boards, np.nan) for name in EXTREMES}
+        self._hour = None
+
+    def _accrue_locked(self, now):
+        """Add the lines expected since the last accrual (only while measuring)"""
+        if self._clock is not None and now > self._clock and self.measuring and len(self.mb_ids):
+            self.counters["expected"] += (now - self._clock) / self.delay
+        self._clock = now if self._clock is None else max(self._clock, now)
+
+    def update(self, row, now=None):
+        """Count one decoded sample (a row in schema column order)"""
+        now = time.time() if now is None else now
+        hour = _hour(now)
+        if self._hour is not None and hour != self._hour:
+            self.flush(now)
+        with self.lock:
+            if len(row) != len(self.columns):
+                return
+            self._accrue_locked(now)
+            self._hour = hour
+            boards = len(self.mb_ids)
+            c = self.counters
+            finite = np.isfinite(row)
+            with np.errstate(invalid="ignore"):
+                out = finite & ((row < self.low) | (row > self.high))
+            values = np.bincount(self.column_mb, weights=finite, minlength=boards)
+            c["lines"] += 1
+            c["present"] += values > 0
+            c["fields"] += np.bincount(self.column_mb, minlength=boards)
+            c["nan_count"] += np.bincount(self.column_mb, weights=~finite, minlength=boards)
+            c["out_of_range"] += np.bincount(self.column_mb, weights=out, minlength=boards)
+            for prefix, cols in (("rssi", self.rssi_cols), ("batt", self.batt_cols)):
+                sample = np.where(cols >= 0, row[cols], np.nan)
+                valid = np.isfinite(sample)
+                c[f"{prefix}_sum"] += np.where(valid, sample, 0.0)
+                c[f"{prefix}_n"] += valid
+                self.extremes[f"{prefix}_min"] = np.fmin(self.extremes[f"{prefix}_min"], sample)
+                self.extremes[f"{prefix}_max"] = np.fmax(self.extremes[f"{prefix}_max"], sample)
+
+    def flush(self, now=None):
+        """Add the pending counters to their hour and day rows"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self.mb_ids:
+                return
+            hour = self._hour or _hour(now)
+            if _hour(now) != hour:
+                # Expected lines up to the end of the pending hour; the rest belongs to the next one
+                end = datetime.fromisoformat(hour).timestamp() + 3600.0
+                self._accrue_locked(min(end, now))
+            else:
+                self._accrue_locked(now)
+            c, e = self.counters, self.extremes
+            if not c["expected"].any() and not c["lines"].any():
+                return
+            rows = []
+            for i, mb_id in enumerate(self.mb_ids):
+                counters = [float(c[name][i]) for name in COUNTERS]
+                extremes = [float(e[name][i]) if math.isfinite(e[name][i]) else None for name in EXTREMES]
+                for period, start in (("hour", hour), ("day", hour[:10])):
+                    rows.append((period, start, mb_id, *counters, *extremes))
+            self._reset_locked()
+        try:
+            self._write(rows)
+        except Exception as e:
+            logger.error(f"Error saving data quality counters: {e}")
+
+    def _write(self, rows):
+        columns = ("period", "start", "mb_id") + COUNTERS + EXTREMES
+        updates = [f"{name} = {name} + excluded.{name}" for name in COUNTERS]
+        updates += [f"{name} = {'MIN' if name.endswith('_min') else 'MAX'}("
+                    f"COALESCE({name}, excluded.{name}), COALESCE(excluded.{name}, {name}))" for name in EXTREMES]
+        conn = sqlite3.connect(self.db_file)
+        try:
+            with conn:
+                conn.executemany(f'''
+                    INSERT INTO data_quality ({", ".join(columns)})
+                    VALUES ({", ".join("?" * len(columns))})
+                    ON CONFLICT (period, start, mb_id) DO UPDATE SET {", ".join(updates)}
+                ''', rows)
+        finally:
+            conn.close()
+
+    def report(self, period="day", since=None, until=None, mb_id=None):
+        """
+        Rows of one period ('hour' or 'day') with their rates, oldest first,
+        and per-board RSSI/BattS trends (slope per day of the period means).
+        since/until are ISO timestamps compared with the period start.
+        """
+        if period not in ("hour", "day"):
+            raise ValueError("period must be 'hour' or 'day'")
+        self.flush()
+        where, params = ["period = ?"], [period]
+        if since:
+            where.append("start >= ?")
+            params.append(since[:10] if period == "day" else since)
+        if until:
+            where.append("start < ?")
+            params.append(until)
+        if mb_id:
+            where.append("mb_id = ?")
+            params.append(mb_id)
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(f'''
+                SELECT * FROM data_quality WHERE {" AND ".join(where)} ORDER BY start, mb_id
+            ''', params).fetchall()
+        finally:
+            conn.close()
+
+        def ratio(a, b):
+            return round(a / b, 4) if b else None
+
+        entries, series = [], {}
+        for row in rows:
+            rssi_mean = round(row["rssi_sum"] / row["rssi_n"], 2) if row["rssi_n"] else None
+            batt_mean = round(row["batt_sum"] / row["batt_n"], 3) if row["batt_n"] else None
+            values = row["fields"] - row["nan_count"]
+            entries.append({
+                "start": row["start"],
+                "mb_id": row["mb_id"],
+                "lines": int(row["lines"]),
+                "present": int(row["present"]),
+                "expected": round(row["expected"], 1),
+                "missing_rate": round(max(0.0, 1.0 - row["present"] / row["expected"]), 4) if row["expected"] >= 1 else None,
+                "nan_rate": ratio(row["nan_count"], row["fields"]),
+                "out_of_range_rate": ratio(row["out_of_range"], values),
+                "rssi": {"mean": rssi_mean, "min": row["rssi_min"], "max": row["rssi_max"]},
+                "batt": {"mean": batt_mean, "min": row["batt_min"], "max": row["batt_max"]},
+            })
+            t = datetime.fromisoformat(row["start"]).timestamp() / 86400.0
+            points = series.setdefault(row["mb_id"], {"rssi": [], "batt": []})
+            if rssi_mean is not None:
+                points["rssi"].append((t, rssi_mean))
+            if batt_mean is not None:
+                points["batt"].append((t, batt_mean))
+
+        def slope(points):
+            if len(points) < 2:
+                return None
+            t, v = np.array(points).T
+            return round(float(np.polyfit(t - t[0], v, 1)[0]), 4)
+
+        trends = {mb: {"rssi_per_day": slope(p["rssi"]), "batt_per_day": slope(p["batt"])}
+                  for mb, p in series.items()}
+        return {"period": period, "entries": entries, "trends": trends}
+
+    def start(self):
+        """Start flushing the counters every flush_seconds"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="data-quality-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 1)
+            self._thread = None
+        self.flush()
+
+    def _watch(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing data quality counters: {e}")
@@ -5,10 +5,17 @@ to detect anomalies and generate alerts.
 """
 
 import json
+import math
 import os
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import logging
+import time
+
+import numpy as np
+
+from diagnosis_rules import compile_rules, parse_rules
+from diagnosis_state import DebounceState, RollingStats
 
 logger = logging.getLogger(__name__)
 
@@ -41,14 +48,61 @@ class Alert:
             'resolved': self.resolved
         }
 
+# Comparators in the compiled rule plan
+ABOVE = 0  # Fires when value > limit
+BELOW = 1  # Fires when value < limit
+
+
+class AlertTemplate:
+    """Static part of an alert produced by one plan entry"""
+
+    def __init__(self, severity, category, title, message, component, threshold, mb=None):
+        self.severity = severity
+        self.category = category
+        self.title = title
+        self.message = message  # Format string with {value}, {threshold} and {mb}
+        self.component = component
+        self.threshold = threshold
+        self.mb = mb
+
+    def build(self, value):
+        try:
+            message = self.message.format(value=value, threshold=self.threshold, mb=self.mb)
+        except (KeyError, IndexError, ValueError, TypeError):
+            # User-defined message with a bad placeholder
+            message = self.message
+        return Alert(
+            severity=self.severity,
+            category=self.category,
+            title=self.title,
+            message=message,
+            component=self.component,
+            value=value,
+            threshold=self.threshold
+        )
+
+
 class DiagnosisEngine:
     def __init__(self):
         self.enabled = False
         self.config = {}
-        self.thresholds = self.load_default_thresholds()
-        self.thresholds = self.load_default_thresholds()
-        self.active_alerts = {}  # Key: alert signature, Value: alert_id
         self.sensor_categories = {} # Key: MB ID, Value: category (solar, battery, inverter, etc.)
+        self.columns = []  # List of (mb_id, field_name) in sample row order
+        self.rules = []  # User-defined rules (diagnosis_rules.Rule)
+        self.rule_specs = []  # ...and their JSON definitions
+        self.version = 0  # Incremented on every compile (used to sync the diagnosis worker)
+        self._thresholds = self.load_default_thresholds()
+        self._plan_state = self._nan_state = self._discrepancy_state = self._rule_state = None
+        self.compile()
+
+    @property
+    def thresholds(self):
+        return self._thresholds
+
+    @thresholds.setter
+    def thresholds(self, thresholds):
+        self._thresholds = thresholds
+        self.compile()
         
     def load_default_thresholds(self):
         """Load default threshold values (fallback only)"""
@@ -76,6 +130,11 @@ class DiagnosisEngine:
             },
             'communication': {
                 'min_rssi': -90
+            },
+            'debounce': {
+                'for_seconds': 30,  # Condition must hold this long before an alert fires (not disconnections)
+                'clear_seconds': 60,  # ...and be gone this long before it auto-resolves
+                'hysteresis_pct': 2  # Clear limit is this % of the limit back inside the range
             }
         }
     
@@ -122,7 +181,6 @@ class DiagnosisEngine:
         else:
             # Auto-calculate from inverter datasheet values
             logger.info("Auto-calculating thresholds from inverter datasheet")
-            logger.info("Auto-calculating thresholds from inverter datasheet")
             self.thresholds = self.auto_calculate_thresholds(config)
 
     def set_sensor_categories(self, config):
@@ -151,349 +209,493 @@ class DiagnosisEngine:
                 pass
                 
         logger.info(f"Sensor categories loaded: {self.sensor_categories}")
-    def analyze_measurement(self, data, calculations, invd_data):
+        self.compile()
+
+    def set_rules(self, rules):
+        """Set user-defined rules from their JSON definitions (raises diagnosis_rules.RuleError)"""
+        self.rules = parse_rules(rules)
+        self.rule_specs = list(rules or [])
+        self.compile()
+
+    def set_columns(self, columns):
+        """Set the sample row layout: a list of (mb_id, field_name) in order"""
+        self.columns = list(columns)
+        self.compile()
+
+    def snapshot(self):
+        """Everything compile() depends on, as plain data (see configure)"""
+        return {
+            'config': self.config,
+            'sensor_categories': dict(self.sensor_categories),
+            'columns': list(self.columns),
+            'thresholds': self._thresholds,
+            'rules': list(self.rule_specs),
+        }
+
+    def configure(self, snapshot):
+        """Apply a snapshot taken from another engine and compile once"""
+        self.config = snapshot['config']
+        self.sensor_categories = snapshot['sensor_categories']
+        self.columns = snapshot['columns']
+        self._thresholds = snapshot['thresholds']
+        self.rules = parse_rules(snapshot['rules'])
+        self.rule_specs = snapshot['rules']
+        self.compile()
+
+    @property
+    def calculation_keys(self):
+        """Calculations used by the checks (power discrepancy and user rules)"""
+        keys = ['total_pv_power', 'battery_power']
+        if self._rule_evaluator is not None:
+            keys.extend(k for k in self._rule_evaluator.calc_keys if k not in keys)
+        return keys
+
+    def _threshold(self, group, key):
+        """Configured threshold, falling back to the default when missing"""
+        try:
+            return self._thresholds[group][key]
+        except (KeyError, TypeError):
+            return self.load_default_thresholds()[group][key]
+
+    def compile(self):
+        """
+        Compile the checks for the current columns, categories and thresholds
+        into a flat plan: parallel arrays of (column index, comparator, limit,
+        guard, abs) plus one alert template per entry. An entry fires when
+        `value <comparator> limit` and `value > guard`.
+
+        Every entry also gets debounce timing and a clear limit (hysteresis);
+        debounce state is carried over for checks that still exist.
+        """
+        entries = []
+        for_seconds = float(self._threshold('debounce', 'for_seconds'))
+        clear_seconds = float(self._threshold('debounce', 'clear_seconds'))
+        hysteresis_pct = float(self._threshold('debounce', 'hysteresis_pct'))
+
+        def add(col, comparator, limit, template, guard=-math.inf, use_abs=False, timing=None):
+            limit = float(limit)
+            if timing is None:
+                timing = (for_seconds, clear_seconds, abs(limit) * hysteresis_pct / 100)
+            entries.append((col, comparator, limit, guard, use_abs, template, timing))
+
+        pv_min = self._threshold('voltage', 'pv_min')
+        pv_max = self._threshold('voltage', 'pv_max')
+        battery_min = self._threshold('voltage', 'battery_min')
+        battery_max = self._threshold('voltage', 'battery_max')
+        max_pv_current = self._threshold('current', 'max_pv_current')
+        max_battery_current = self._threshold('current', 'max_battery_current')
+        panel_max = self._threshold('temperature', 'panel_max')
+        ambient_max = self._threshold('temperature', 'ambient_max')
+        ambient_min = self._threshold('temperature', 'ambient_min')
+        min_rssi = self._threshold('communication', 'min_rssi')
+
+        mb_columns = {}
+        for col, (mb_id, field_name) in enumerate(self.columns):
+            mb_columns.setdefault(mb_id, {})[field_name] = col
+
+        # 1. Voltages and 2. currents from sensors
+        for mb_id, fields in mb_columns.items():
+            category = self.sensor_categories.get(mb_id, "other")
+            for field_name, col in fields.items():
+                if field_name.startswith('V') and 'D' in field_name:
+                    if category == 'solar' or category == 'other':
+                        # Unassigned boards are treated as PV above 100 V
+                        guard = -math.inf if category == 'solar' else 100
+                        add(col, ABOVE, pv_max, AlertTemplate(
+                            'WARNING', 'voltage', 'High PV Voltage',
+                            f'PV voltage from {mb_id} ' + '({value:.1f}V) exceeds maximum ({threshold}V)',
+                            mb_id, pv_max), guard)
+                        add(col, BELOW, pv_min, AlertTemplate(
+                            'WARNING', 'voltage', 'Low PV Voltage',
+                            f'PV voltage from {mb_id} ' + '({value:.1f}V) below minimum ({threshold}V)',
+                            mb_id, pv_min), max(guard, 10))
+                    elif category == 'battery':
+                        add(col, ABOVE, battery_max, AlertTemplate(
+                            'ERROR', 'voltage', 'High Battery Voltage',
+                            f'Battery voltage from {mb_id} ' + '({value:.1f}V) exceeds maximum ({threshold}V)',
+                            'battery', battery_max))  # Use category for UI mapping
+                        add(col, BELOW, battery_min, AlertTemplate(
+                            'WARNING', 'voltage', 'Low Battery Voltage',
+                            f'Battery voltage from {mb_id} ' + '({value:.1f}V) below minimum ({threshold}V)',
+                            'battery', battery_min), 10)
+                elif field_name.startswith('I') and 'D' in field_name:
+                    if category == 'solar':
+                        add(col, ABOVE, max_pv_current, AlertTemplate(
+                            'WARNING', 'current', 'High PV Current',
+                            f'PV current from {mb_id} ' + '({value:.1f}A) exceeds maximum ({threshold}A)',
+                            mb_id, max_pv_current))
+                    elif category == 'battery':
+                        add(col, ABOVE, max_battery_current, AlertTemplate(
+                            'WARNING', 'current', 'High Battery Current',
+                            f'Battery current from {mb_id} ' + '({value:.1f}A) exceeds maximum ({threshold}A)',
+                            'battery', max_battery_current))
+
+        # Inverter-reported values
+        invd = mb_columns.get('INVD', {})
+        for pv_num in [1, 2]:
+            if f'PV{pv_num}_V' in invd:
+                add(invd[f'PV{pv_num}_V'], ABOVE, pv_max, AlertTemplate(
+                    'WARNING', 'voltage', f'High Inverter PV{pv_num} Voltage',
+                    f'Inverter PV{pv_num} ' + 'voltage ({value:.1f}V) exceeds maximum ({threshold}V)',
+                    f'INVD_PV{pv_num}', pv_max))
+        if 'Vbat' in invd:
+            add(invd['Vbat'], ABOVE, battery_max, AlertTemplate(
+                'ERROR', 'voltage', 'High Battery Voltage',
+                'Battery voltage ({value:.1f}V) exceeds maximum ({threshold}V)',
+                'battery', battery_max))
+            add(invd['Vbat'], BELOW, battery_min, AlertTemplate(
+                'WARNING', 'voltage', 'Low Battery Voltage',
+                'Battery voltage ({value:.1f}V) below minimum ({threshold}V)',
+                'battery', battery_min))
+        if 'Ibat' in invd:
+            add(invd['Ibat'], ABOVE, max_battery_current, AlertTemplate(
+                'ERROR', 'current', 'High Battery Current',
+                'Battery current ({value:.1f}A) exceeds maximum ({threshold}A)',
+                'battery', max_battery_current), use_abs=True)
+
+        # 4. Temperature and 5. communication health
+        for mb_id, fields in mb_columns.items():
+            if 'T_m' in fields:
+                add(fields['T_m'], ABOVE, panel_max, AlertTemplate(
+                    'WARNING', 'temperature', 'High Panel Temperature',
+                    'Panel temperature ({value:.1f}°C) exceeds maximum ({threshold}°C)',
+                    mb_id, panel_max))
+            if 'T_amb' in fields:
+                add(fields['T_amb'], ABOVE, ambient_max, AlertTemplate(
+                    'INFO', 'temperature', 'High Ambient Temperature',
+                    'Ambient temperature ({value:.1f}°C) is very high',
+                    'environment', ambient_max))
+                add(fields['T_amb'], BELOW, ambient_min, AlertTemplate(
+                    'INFO', 'temperature', 'Low Ambient Temperature',
+                    'Ambient temperature ({value:.1f}°C) is very low',
+                    'environment', ambient_min))
+            rssi_key = 'Rssi' if 'Rssi' in fields else 'RSSI' if 'RSSI' in fields else None
+            if rssi_key:
+                add(fields[rssi_key], BELOW, min_rssi, AlertTemplate(
+                    'WARNING', 'communication', 'Weak Signal Strength',
+                    f'Measurement board {mb_id} ' + 'has weak signal (RSSI: {value})',
+                    mb_id, min_rssi))
+
+        # User-defined rules: simple comparisons join the plan, the rest share one evaluator
+        rule_plan, self._rule_evaluator = compile_rules(self.rules, self.columns, self._threshold, AlertTemplate)
+        for col, kind, limit, template, timing in rule_plan:
+            add(col, ABOVE if kind == "above" else BELOW, limit, template, timing=timing)
+
+        self._plan_cols = np.array([e[0] for e in entries], dtype=np.intp)
+        self._plan_above = np.array([e[1] == ABOVE for e in entries], dtype=bool)
+        self._plan_limits = np.array([e[2] for e in entries], dtype=np.float64)
+        self._plan_guards = np.array([e[3] for e in entries], dtype=np.float64)
+        self._plan_abs = np.array([e[4] for e in entries], dtype=bool)
+        self._plan_templates = [e[5] for e in entries]
+        self._any_abs = bool(self._plan_abs.any())
+        # Once active, an entry holds until the value is back past its clear limit
+        hysteresis = np.array([e[6][2] for e in entries], dtype=np.float64)
+        self._plan_clear_limits = np.where(self._plan_above, self._plan_limits - hysteresis,
+                                           self._plan_limits + hysteresis)
+        self._plan_state = DebounceState(
+            [e[6][0] for e in entries], [e[6][1] for e in entries],
+            [(e[0], e[1], e[5].category, e[5].title) for e in entries], self._plan_state)
+
+        # Per-MB column groups for the NaN/disconnection check
+        self._mb_ids = list(mb_columns)
+        self._mb_fields = [list(fields.items()) for fields in mb_columns.values()]
+        mb_index = {mb_id: i for i, mb_id in enumerate(self._mb_ids)}
+        self._column_mb = np.array([mb_index[mb_id] for mb_id, _ in self.columns], dtype=np.intp)
+        self._mb_sizes = np.bincount(self._column_mb, minlength=len(self._mb_ids))
+        mb_count = len(self._mb_ids)
+        # A disconnected MB is CRITICAL: alert on the first NaN sample, only the clear is debounced
+        self._nan_state = DebounceState([0.0] * mb_count, [clear_seconds] * mb_count,
+                                        self._mb_ids, self._nan_state)
+
+        # Inverter columns and threshold for the power discrepancy check
+        self._invd_columns = invd
+        self._max_discrepancy = self._threshold('power_discrepancy', 'max_percentage')
+        self._discrepancy_state = DebounceState([for_seconds] * 2, [clear_seconds] * 2,
+                                                ['pv', 'battery'], self._discrepancy_state)
+
+        evaluator = self._rule_evaluator
+        if evaluator is not None:
+            self._rule_state = DebounceState(evaluator.for_seconds, evaluator.clear_seconds,
+                                             evaluator.keys, self._rule_state)
+        self.version += 1
+
+    @property
+    def plan_size(self):
+        return len(self._plan_templates)
+
+    def row_from_data(self, data):
+        """Flatten {mb_id: {field: value}} into a sample row (non-numeric -> NaN)"""
+        row = np.full(len(self.columns), np.nan)
+        for col, (mb_id, field_name) in enumerate(self.columns):
+            value = data.get(mb_id, {}).get(field_name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[col] = value
+        return row
+    def analyze_measurement(self, data, calculations, invd_data, row=None, now=None):
         """
         Main analysis function called on each measurement
-        Returns list of new alerts
+        Returns the list of currently active alerts: a condition must hold
+        for the debounce time before its alert shows up here, and the alert
+        stays until the condition has cleared for the clear time.
+
+        - row: the sample as a float array in `columns` order (optional;
+          built from `data` when omitted)
+        - now: sample time in epoch seconds (default: current time)
         """
         if not self.enabled:
             return []
-        
-        alerts = []
+        if now is None:
+            now = time.time()
+
+        if row is None:
+            if invd_data and 'INVD' not in data:
+                data = dict(data, INVD=invd_data)
+            layout = [(mb_id, field_name) for mb_id, fields in data.items() for field_name in fields]
+            if layout != self.columns:
+                self.set_columns(layout)
+            row = self.row_from_data(data)
         
         # 0. NaN/Disconnection checks (highest priority)
-        alerts.extend(self.check_nan_values(data))
-        
-        # 1. Voltage checks
-        alerts.extend(self.check_voltages(data, invd_data))
-        
-        # 2. Current checks
-        alerts.extend(self.check_currents(data, invd_data))
-        
-        # 3. Power discrepancy (sensor vs inverter)
-        alerts.extend(self.check_power_discrepancy(calculations, invd_data))
-        
-        # 4. Temperature checks
-        alerts.extend(self.check_temperature(data))
-        
-        # 5. Communication health
-        alerts.extend(self.check_communication(data))
-        
-        return alerts
-    
-    def check_nan_values(self, data):
-        """Check for NaN values indicating disconnected or failing sensors"""
+        nan_mask = np.isnan(row)
         alerts = []
+        if not self._nan_state.idle or nan_mask.any():
+            nan_counts = np.bincount(self._column_mb[nan_mask], minlength=len(self._mb_ids))
+            alerts = self._debounced(self._nan_state, nan_counts > 0, now,
+                                     lambda m: self._nan_alert(m, int(nan_counts[m]), nan_mask))
+        
+        # 1-2, 4-5. Voltage, current, temperature, communication and simple user rules
+        if self._plan_templates:
+            values = row[self._plan_cols]
+            if self._any_abs:
+                values = np.where(self._plan_abs, np.abs(values), values)
+            limits = self._plan_limits
+            if not self._plan_state.idle:
+                limits = np.where(self._plan_state.active, self._plan_clear_limits, limits)
+            fired = np.where(self._plan_above, values > limits, values < limits)
+            fired &= values > self._plan_guards
+            alerts.extend(self._debounced(self._plan_state, fired, now,
+                                          lambda i: self._plan_templates[i].build(float(values[i]))))
         
-        for mb_id, fields in data.items():
-            nan_count = 0
-            total_fields = 0
-            nan_fields = []
-            
-            for field_name, value in fields.items():
-                total_fields += 1
-                # Check if value is NaN (string "NaN" or actual NaN)
-                if value == "NaN" or value == "nan" or (isinstance(value, str) and value.upper() == "NAN"):
-                    nan_count += 1
-                    nan_fields.append(field_name)
-            
-            # If all or most fields are NaN, the MB is likely disconnected
-            if nan_count > 0:
-                if nan_count == total_fields:
-                    # All fields are NaN - complete disconnection
-                    alerts.append(Alert(
-                        severity='CRITICAL',
-                        category='communication',
-                        title='Measurement Board Disconnected',
-                        message=f'Measurement board {mb_id} is completely disconnected - all fields returning NaN',
-                        component=mb_id,
-                        value=nan_count,
-                        threshold=0
-                    ))
-                else:
-                    # Partial NaN - sensor malfunction
-                    alerts.append(Alert(
-                        severity='ERROR',
-                        category='communication',
-                        title='Sensor Malfunction',
-                        message=f'Measurement board {mb_id} has {nan_count}/{total_fields} fields with NaN values ({", ".join(nan_fields)})',
-                        component=mb_id,
-                        value=nan_count,
-                        threshold=0
-                    ))
+        # 3. Power discrepancy (sensor vs inverter)
+        discrepancy = self.check_power_discrepancy(calculations, row)
+        alerts.extend(self._debounced(self._discrepancy_state,
+                                      np.array([alert is not None for alert in discrepancy]), now,
+                                      lambda i: discrepancy[i]))
+
+        # 6. User-defined rules that need the general evaluator
+        evaluator = self._rule_evaluator
+        if evaluator is not None:
+            try:
+                fired, rule_values = evaluator.evaluate(row, calculations or {}, now, self._rule_state.active)
+            except Exception as e:
+                # A broken rule must not cost the built-in checks or the measurement
+                logger.error("Error evaluating diagnosis rules: %s", e)
+            else:
+                alerts.extend(self._debounced(self._rule_state, fired, now,
+                                              lambda i: evaluator.templates[i].build(float(rule_values[i]))))
         
         return alerts
-    
-    def check_voltages(self, data, invd_data):
-        """Check voltage ranges for all components"""
+
+    def _debounced(self, state, raw, now, build):
+        """
+        Advance a debounce state with the raw conditions and return the alerts
+        of the active slots. build(i) makes the alert of a slot whose condition
+        currently holds; slots that are clearing keep their last alert.
+        """
         alerts = []
-        
-        # Check PV voltages from sensors
-        for mb_id, fields in data.items():
-            category = self.sensor_categories.get(mb_id, "other")
-            logger.info(f"Checking voltages for {mb_id}, category: {category}")
-            
-            for field_name, value in fields.items():
-                # Skip NaN values
-                if value == "NaN" or value == "nan" or (isinstance(value, str) and value.upper() == "NAN"):
-                    continue
-                    
-                if field_name.startswith('V') and 'D' in field_name and isinstance(value, (int, float)):
-                    # Logic based on category
-                    if category == 'solar' or (category == 'other' and value > 100): # Fallback for high voltage likely PV
-                        if value > self.thresholds['voltage']['pv_max']:
-                            alerts.append(Alert(
-                                severity='WARNING',
-                                category='voltage',
-                                title='High PV Voltage',
-                                message=f'PV voltage from {mb_id} ({value:.1f}V) exceeds maximum ({self.thresholds["voltage"]["pv_max"]}V)',
-                                component=mb_id,
-                                value=value,
-                                threshold=self.thresholds['voltage']['pv_max']
-                            ))
-                        elif value < self.thresholds['voltage']['pv_min'] and value > 10:
-                            alerts.append(Alert(
-                                severity='WARNING',
-                                category='voltage',
-                                title='Low PV Voltage',
-                                message=f'PV voltage from {mb_id} ({value:.1f}V) below minimum ({self.thresholds["voltage"]["pv_min"]}V)',
-                                component=mb_id,
-                                value=value,
-                                threshold=self.thresholds['voltage']['pv_min']
-                            ))
-                    
-                    elif category == 'battery':
-                        if value > self.thresholds['voltage']['battery_max']:
-                            alerts.append(Alert(
-                                severity='ERROR',
-                                category='voltage',
-                                title='High Battery Voltage',
-                                message=f'Battery voltage from {mb_id} ({value:.1f}V) exceeds maximum ({self.thresholds["voltage"]["battery_max"]}V)',
-                                component='battery',  # Use category for UI mapping
-                                value=value,
-                                threshold=self.thresholds['voltage']['battery_max']
-                            ))
-                        elif value < self.thresholds['voltage']['battery_min'] and value > 10:
-                            alerts.append(Alert(
-                                severity='WARNING',
-                                category='voltage',
-                                title='Low Battery Voltage',
-                                message=f'Battery voltage from {mb_id} ({value:.1f}V) below minimum ({self.thresholds["voltage"]["battery_min"]}V)',
-                                component='battery',  # Use category for UI mapping
-                                value=value,
-                                threshold=self.thresholds['voltage']['battery_min']
-                            ))
-        
-        # Check inverter-reported voltages
-        if invd_data:
-            for pv_num in [1, 2]:
-                v_key = f'PV{pv_num}_V'
-                if v_key in invd_data:
-                    value = invd_data[v_key]
-                    if isinstance(value, (int, float)) and value > self.thresholds['voltage']['pv_max']:
-                        alerts.append(Alert(
-                            severity='WARNING',
-                            category='voltage',
-                            title=f'High Inverter PV{pv_num} Voltage',
-                            message=f'Inverter PV{pv_num} voltage ({value:.1f}V) exceeds maximum ({self.thresholds["voltage"]["pv_max"]}V)',
-                            component=f'INVD_PV{pv_num}',
-                            value=value,
-                            threshold=self.thresholds['voltage']['pv_max']
-                        ))
-            
-            # Battery voltage
-            if 'Vbat' in invd_data:
-                value = invd_data['Vbat']
-                if isinstance(value, (int, float)):
-                    if value > self.thresholds['voltage']['battery_max']:
-                        alerts.append(Alert(
-                            severity='ERROR',
-                            category='voltage',
-                            title='High Battery Voltage',
-                            message=f'Battery voltage ({value:.1f}V) exceeds maximum ({self.thresholds["voltage"]["battery_max"]}V)',
-                            component='battery',
-                            value=value,
-                            threshold=self.thresholds['voltage']['battery_max']
-                        ))
-                    elif value < self.thresholds['voltage']['battery_min']:
-                        alerts.append(Alert(
-                            severity='WARNING',
-                            category='voltage',
-                            title='Low Battery Voltage',
-                            message=f'Battery voltage ({value:.1f}V) below minimum ({self.thresholds["voltage"]["battery_min"]}V)',
-                            component='battery',
-                            value=value,
-                            threshold=self.thresholds['voltage']['battery_min']
-                        ))
-        
+        if not len(state):
+            return alerts
+        active = state.update(raw, now)
+        for i in np.flatnonzero(active).tolist():
+            if raw[i]:
+                state.last_alerts[i] = build(i)
+            alerts.append(state.last_alerts[i])
         return alerts
     
-    def check_currents(self, data, invd_data):
-        """Check current values for anomalies"""
-        alerts = []
-        
-        # Check PV currents from sensors
-        for mb_id, fields in data.items():
-            category = self.sensor_categories.get(mb_id, "other")
-            
-            for field_name, value in fields.items():
-                # Skip NaN values
-                if value == "NaN" or value == "nan" or (isinstance(value, str) and value.upper() == "NAN"):
-                    continue
-                    
-                if field_name.startswith('I') and 'D' in field_name and isinstance(value, (int, float)):
-                    # Logic based on category
-                    if category == 'solar':
-                        if value > self.thresholds['current']['max_pv_current']:
-                            alerts.append(Alert(
-                                severity='WARNING',
-                                category='current',
-                                title='High PV Current',
-                                message=f'PV current from {mb_id} ({value:.1f}A) exceeds maximum ({self.thresholds["current"]["max_pv_current"]}A)',
-                                component=mb_id,
-                                value=value,
-                                threshold=self.thresholds['current']['max_pv_current']
-                            ))
-                    elif category == 'battery':
-                        if value > self.thresholds['current']['max_battery_current']:
-                            alerts.append(Alert(
-                                severity='WARNING',
-                                category='current',
-                                title='High Battery Current',
-                                message=f'Battery current from {mb_id} ({value:.1f}A) exceeds maximum ({self.thresholds["current"]["max_battery_current"]}A)',
-                                component='battery',  # Use category for UI mapping
-                                value=value,
-                                threshold=self.thresholds['current']['max_battery_current']
-                            ))
-        
-        # Check inverter-reported currents
-        if invd_data:
-            if 'Ibat' in invd_data:
-                value = abs(invd_data['Ibat'])
-                if isinstance(value, (int, float)) and value > self.thresholds['current']['max_battery_current']:
-                    alerts.append(Alert(
-                        severity='ERROR',
-                        category='current',
-                        title='High Battery Current',
-                        message=f'Battery current ({value:.1f}A) exceeds maximum ({self.thresholds["current"]["max_battery_current"]}A)',
-                        component='battery',
-                        value=value,
-                        threshold=self.thresholds['current']['max_battery_current']
-                    ))
-        
-        return alerts
+    def evaluate_block(self, rows, calculations, times, stats=None):
+        """
+        Evaluate every check over many samples at once (used by the backtest)
+
+        - rows: (samples, columns) matrix in `columns` order
+        - calculations: name -> (samples,) array
+        - times: (samples,) epoch seconds
+        - stats: dict carried between blocks (rolling statistics for rules)
+
+        Returns groups of slots: dicts with 'templates', 'on' and 'hold'
+        (slots x samples bool: the raising condition and the condition that
+        keeps an active alert), 'values', 'for_seconds' and 'clear_seconds'.
+        Debounce timing is applied by the caller (diagnosis_state.scan_debounce).
+        """
+        n = len(rows)
+        groups = []
+
+        def add(templates, on, hold, values, state):
+            groups.append({'templates': templates, 'on': on, 'hold': hold, 'values': values,
+                           'for_seconds': state.for_seconds, 'clear_seconds': state.clear_seconds})
+
+        # 0. NaN/Disconnection: one slot per MB for each of the two alerts
+        mb_count = len(self._mb_ids)
+        if mb_count:
+            nan_counts = np.isnan(rows).astype(np.float64) @ np.eye(mb_count)[self._column_mb]
+            disconnected = (nan_counts == self._mb_sizes).T
+            malfunction = ((nan_counts > 0).T & ~disconnected)
+            for on, severity, title in ((disconnected, 'CRITICAL', 'Measurement Board Disconnected'),
+                                        (malfunction, 'ERROR', 'Sensor Malfunction')):
+                templates = [AlertTemplate(severity, 'communication', title, title, mb_id, 0, mb_id)
+                             for mb_id in self._mb_ids]
+                add(templates, on, on, nan_counts.T, self._nan_state)
+
+        # 1-2, 4-5. The rule plan, with the clear limit as hold condition
+        if self._plan_templates:
+            values = rows[:, self._plan_cols].T
+            if self._any_abs:
+                values = np.where(self._plan_abs[:, None], np.abs(values), values)
+            above = self._plan_above[:, None]
+            guard = values > self._plan_guards[:, None]
+            on = np.where(above, values > self._plan_limits[:, None], values < self._plan_limits[:, None]) & guard
+            hold = np.where(above, values > self._plan_clear_limits[:, None],
+                            values < self._plan_clear_limits[:, None]) & guard
+            add(self._plan_templates, on, hold, values, self._plan_state)
+
+        # 3. Power discrepancy
+        if self._invd_columns and calculations:
+            def invd(field_name):
+                col = self._invd_columns.get(field_name)
+                return np.zeros(n) if col is None else np.nan_to_num(rows[:, col])
+
+            nan = np.full(n, np.nan)
+            max_percentage = self._max_discrepancy
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sensor_pv = calculations.get('total_pv_power', nan)
+                invd_pv = invd('PV1_V') * invd('PV1_I') + invd('PV2_V') * invd('PV2_I')
+                pv_diff = np.abs(sensor_pv - invd_pv) / np.maximum(sensor_pv, invd_pv) * 100
+                pv_on = (sensor_pv > 100) & (invd_pv > 100) & (pv_diff > max_percentage)
+                sensor_battery = np.abs(calculations.get('battery_power', nan))
+                invd_battery = np.abs(invd('Vbat') * invd('Ibat'))
+                battery_diff = np.abs(sensor_battery - invd_battery) / np.maximum(sensor_battery, invd_battery) * 100
+                battery_on = (sensor_battery > 100) & (invd_battery > 100) & (battery_diff > max_percentage)
+            templates = [
+                AlertTemplate('WARNING', 'discrepancy', 'PV Power Mismatch', 'PV Power Mismatch',
+                              'solar', max_percentage),
+                AlertTemplate('INFO', 'discrepancy', 'Battery Power Mismatch', 'Battery Power Mismatch',
+                              'battery', max_percentage),
+            ]
+            on = np.vstack([pv_on, battery_on])
+            add(templates, on, on, np.vstack([pv_diff, battery_diff]), self._discrepancy_state)
+
+        # 6. User-defined rules: the generated function works on whole series as well
+        evaluator = self._rule_evaluator
+        if evaluator is not None:
+            r = rows.T
+            c = np.array([calculations.get(key, np.full(n, np.nan)) for key in evaluator.calc_keys],
+                         dtype=np.float64).reshape(len(evaluator.calc_keys), n)
+            if evaluator.uses_stats:
+                stats = {} if stats is None else stats
+                stat_arrays = stats.setdefault('rows', RollingStats(len(r))).update_block(r, times) + \
+                    stats.setdefault('calculations', RollingStats(len(c))).update_block(c, times)
+            else:
+                stat_arrays = (None,) * 6
+            out = np.zeros((len(evaluator), n), dtype=bool)
+            hold = np.zeros((len(evaluator), n), dtype=bool)
+            vals = np.zeros((len(evaluator), n))
+            with np.errstate(all='ignore'):
+                evaluator.function(r, c, *stat_arrays, out, hold, vals)
+            hold = np.where(evaluator.has_hold[:, None], hold, out)
+            add(evaluator.templates, out, hold, vals, self._rule_state)
+
+        return groups
+
+    def check_nan_values(self, row):
+        """Check for NaN values indicating disconnected or failing sensors (no debounce)"""
+        nan_mask = np.isnan(row)
+        if not nan_mask.any():
+            return []
+        nan_counts = np.bincount(self._column_mb[nan_mask], minlength=len(self._mb_ids))
+        return [self._nan_alert(m, int(nan_counts[m]), nan_mask) for m in np.flatnonzero(nan_counts).tolist()]
+
+    def _nan_alert(self, m, nan_count, nan_mask):
+        mb_id = self._mb_ids[m]
+        total_fields = int(self._mb_sizes[m])
+        # If all or most fields are NaN, the MB is likely disconnected
+        if nan_count == total_fields:
+            # All fields are NaN - complete disconnection
+            return Alert(
+                severity='CRITICAL',
+                category='communication',
+                title='Measurement Board Disconnected',
+                message=f'Measurement board {mb_id} is completely disconnected - all fields returning NaN',
+                component=mb_id,
+                value=nan_count,
+                threshold=0
+            )
+        # Partial NaN - sensor malfunction
+        nan_fields = [name for name, col in self._mb_fields[m] if nan_mask[col]]
+        return Alert(
+            severity='ERROR',
+            category='communication',
+            title='Sensor Malfunction',
+            message=f'Measurement board {mb_id} has {nan_count}/{total_fields} fields with NaN values ({", ".join(nan_fields)})',
+            component=mb_id,
+            value=nan_count,
+            threshold=0
+        )
     
-    def check_power_discrepancy(self, calculations, invd_data):
-        """Compare sensor-measured power vs inverter-reported power"""
-        alerts = []
+    def _invd_value(self, row, field_name):
+        """Inverter-reported value from the sample row (missing/NaN -> 0)"""
+        col = self._invd_columns.get(field_name)
+        if col is None:
+            return 0
+        value = row[col]
+        return 0 if value != value else float(value)
+
+    def check_power_discrepancy(self, calculations, row):
+        """
+        Compare sensor-measured power vs inverter-reported power
+        Returns [PV alert or None, battery alert or None]
+        """
+        alerts = [None, None]
         
-        if not calculations or not invd_data:
+        if not calculations or not self._invd_columns:
             return alerts
+        max_percentage = self._max_discrepancy
         
         # PV Power comparison
         sensor_pv_power = calculations.get('total_pv_power', 0)
-        invd_pv1_power = invd_data.get('PV1_V', 0) * invd_data.get('PV1_I', 0)
-        invd_pv2_power = invd_data.get('PV2_V', 0) * invd_data.get('PV2_I', 0)
+        invd_pv1_power = self._invd_value(row, 'PV1_V') * self._invd_value(row, 'PV1_I')
+        invd_pv2_power = self._invd_value(row, 'PV2_V') * self._invd_value(row, 'PV2_I')
         invd_pv_power = invd_pv1_power + invd_pv2_power
         
         if sensor_pv_power > 100 and invd_pv_power > 100:  # Only compare if both have meaningful values
             diff_percentage = abs(sensor_pv_power - invd_pv_power) / max(sensor_pv_power, invd_pv_power) * 100
             
-            if diff_percentage > self.thresholds['power_discrepancy']['max_percentage']:
-                alerts.append(Alert(
+            if diff_percentage > max_percentage:
+                alerts[0] = Alert(
                     severity='WARNING',
                     category='discrepancy',
                     title='PV Power Mismatch',
                     message=f'Sensor PV power ({sensor_pv_power:.0f}W) differs from inverter ({invd_pv_power:.0f}W) by {diff_percentage:.1f}%',
                     component='solar',
                     value=diff_percentage,
-                    threshold=self.thresholds['power_discrepancy']['max_percentage']
-                ))
+                    threshold=max_percentage
+                )
         
         # Battery Power comparison
         sensor_battery_power = calculations.get('battery_power', 0)
-        invd_battery_power = invd_data.get('Vbat', 0) * invd_data.get('Ibat', 0)
+        invd_battery_power = self._invd_value(row, 'Vbat') * self._invd_value(row, 'Ibat')
         
         if abs(sensor_battery_power) > 100 and abs(invd_battery_power) > 100:
             diff_percentage = abs(abs(sensor_battery_power) - abs(invd_battery_power)) / max(abs(sensor_battery_power), abs(invd_battery_power)) * 100
             
-            if diff_percentage > self.thresholds['power_discrepancy']['max_percentage']:
-                alerts.append(Alert(
+            if diff_percentage > max_percentage:
+                alerts[1] = Alert(
                     severity='INFO',
                     category='discrepancy',
                     title='Battery Power Mismatch',
                     message=f'Sensor battery power ({sensor_battery_power:.0f}W) differs from inverter ({invd_battery_power:.0f}W) by {diff_percentage:.1f}%',
                     component='battery',
                     value=diff_percentage,
-                    threshold=self.thresholds['power_discrepancy']['max_percentage']
-                ))
-        
-        return alerts
-    
-    def check_temperature(self, data):
-        """Check temperature values"""
-        alerts = []
-        
-        for mb_id, fields in data.items():
-            # Panel temperature
-            if 'T_m' in fields:
-                value = fields['T_m']
-                if isinstance(value, (int, float)) and value > self.thresholds['temperature']['panel_max']:
-                    alerts.append(Alert(
-                        severity='WARNING',
-                        category='temperature',
-                        title='High Panel Temperature',
-                        message=f'Panel temperature ({value:.1f}°C) exceeds maximum ({self.thresholds["temperature"]["panel_max"]}°C)',
-                        component=mb_id,
-                        value=value,
-                        threshold=self.thresholds['temperature']['panel_max']
-                    ))
-            
-            # Ambient temperature
-            if 'T_amb' in fields:
-                value = fields['T_amb']
-                if isinstance(value, (int, float)):
-                    if value > self.thresholds['temperature']['ambient_max']:
-                        alerts.append(Alert(
-                            severity='INFO',
-                            category='temperature',
-                            title='High Ambient Temperature',
-                            message=f'Ambient temperature ({value:.1f}°C) is very high',
-                            component='environment',
-                            value=value,
-                            threshold=self.thresholds['temperature']['ambient_max']
-                        ))
-                    elif value < self.thresholds['temperature']['ambient_min']:
-                        alerts.append(Alert(
-                            severity='INFO',
-                            category='temperature',
-                            title='Low Ambient Temperature',
-                            message=f'Ambient temperature ({value:.1f}°C) is very low',
-                            component='environment',
-                            value=value,
-                            threshold=self.thresholds['temperature']['ambient_min']
-                        ))
-        
-        return alerts
-    
-    def check_communication(self, data):
-        """Check communication health (RSSI)"""
-        alerts = []
-        
-        for mb_id, fields in data.items():
-            if 'Rssi' in fields or 'RSSI' in fields:
-                rssi_key = 'Rssi' if 'Rssi' in fields else 'RSSI'
-                value = fields[rssi_key]
-                if isinstance(value, (int, float)) and value < self.thresholds['communication']['min_rssi']:
-                    alerts.append(Alert(
-                        severity='WARNING',
-                        category='communication',
-                        title='Weak Signal Strength',
-                        message=f'Measurement board {mb_id} has weak signal (RSSI: {value})',
-                        component=mb_id,
-                        value=value,
-                        threshold=self.thresholds['communication']['min_rssi']
-                    ))
+                    threshold=max_percentage
+                )
         
         return alerts
     
@@ -0,0 +1,310 @@
+"""
+Diagnosis Backtest
+Evaluates the diagnosis checks (built-in checks, thresholds and user
+rules) over stored measurements, to see how many alerts a configuration
+would have raised. The live `alerts` table is never touched.
+
+Measurements are read one chunk (default: one day) at a time, pivoted into
+a (samples x columns) matrix and evaluated with vectorized comparisons
+(DiagnosisEngine.evaluate_block). Debounce timing and hysteresis are
+applied per alert slot with run-length scans, carried across chunks.
+
+Usage (from backend/):
+    python diagnosis_backtest.py --start 2026-09-01 --end 2026-10-01
+        [--thresholds thresholds.json] [--rules rules.json] [--json]
+
+Thresholds and rules default to the stored diagnosis settings; sensor
+categories come from config.json.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+from diagnosis import DiagnosisEngine
+from diagnosis_state import new_scan_state, scan_debounce
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_DAYS = 1
+MAX_EXAMPLES = 5
+CALCULATION_FIELDS = ['total_pv_power', 'battery_soc', 'battery_voltage', 'battery_power', 'consumption_power']
+
+# (column index, value) rows, NULL as NaN
+VALUE_DTYPE = np.dtype([('idx', np.float64), ('value', np.float64)])
+
+# Epoch seconds from a stored (naive ISO) timestamp, computed in SQLite
+EPOCH_SQL = "(julianday({}) - 2440587.5) * 86400.0"
+
+
+def _iso(seconds):
+    """Inverse of EPOCH_SQL: the naive ISO timestamp"""
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat(timespec='seconds')
+
+
+def _day(value):
+    return date.fromisoformat(str(value)[:10])
+
+
+def load_columns(conn, start, end):
+    """(mb_id, field_name) pairs stored in the date range"""
+    # Candidates from the (mb_id, field_name) index, then a range probe each:
+    # much cheaper than a DISTINCT over every row of the range
+    cursor = conn.execute('''
+        SELECT mb_id, field_name FROM (SELECT DISTINCT mb_id, field_name FROM measurements) d
+        WHERE EXISTS (
+            SELECT 1 FROM measurements m INDEXED BY idx_timestamp
+            WHERE m.timestamp >= ? AND m.timestamp < ? AND m.mb_id = d.mb_id AND m.field_name = d.field_name
+        )
+        ORDER BY mb_id, field_name
+    ''', (start, end))
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def _epochs(conn, sql, bounds):
+    """First column of a query as epoch seconds (rounded to the millisecond), the rest as floats"""
+    data = np.array(conn.execute(sql, bounds).fetchall(), dtype=np.float64)
+    if len(data):
+        data[:, 0] = np.round(data[:, 0], 3)
+    return data
+
+
+def iter_chunks(conn, columns, start_day, end_day, chunk_days=DEFAULT_CHUNK_DAYS):
+    """
+    Yields (times, rows, calculations) per chunk of days in [start_day, end_day):
+    times (samples,), rows (samples x columns, NaN where missing) and
+    calculations name -> (samples,).
+    """
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS backtest_columns '
+                 '(mb_id TEXT, field_name TEXT, idx INTEGER, PRIMARY KEY (mb_id, field_name))')
+    conn.execute('DELETE FROM backtest_columns')
+    conn.executemany('INSERT INTO backtest_columns VALUES (?, ?, ?)',
+                     [(mb_id, field_name, i) for i, (mb_id, field_name) in enumerate(columns)])
+    conn.commit()
+
+    day = start_day
+    while day < end_day:
+        next_day = min(day + timedelta(days=chunk_days), end_day)
+        bounds = (day.isoformat(), next_day.isoformat())
+        day = next_day
+
+        # Values in timestamp order plus the number of values per timestamp:
+        # two narrow queries instead of repeating the timestamp on every row,
+        # in one read transaction so both see the same rows
+        conn.execute('BEGIN')
+        try:
+            samples = _epochs(conn, f'''
+                SELECT {EPOCH_SQL.format('timestamp')}, COUNT(*)
+                FROM measurements INDEXED BY idx_timestamp
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY timestamp ORDER BY timestamp
+            ''', bounds)
+            values = np.fromiter(conn.execute('''
+                SELECT c.idx, m.value
+                FROM measurements m INDEXED BY idx_timestamp
+                LEFT JOIN backtest_columns c ON m.mb_id = c.mb_id AND m.field_name = c.field_name
+                WHERE m.timestamp >= ? AND m.timestamp < ?
+                ORDER BY m.timestamp
+            ''', bounds), dtype=VALUE_DTYPE)
+        finally:
+            conn.rollback()
+        if not len(samples):
+            continue
+
+        # Stored timestamps that differ only below the millisecond fall in one sample
+        times, merged = np.unique(samples[:, 0], return_inverse=True)
+        sample_index = np.repeat(merged, samples[:, 1].astype(np.intp))
+        known = ~np.isnan(values['idx'])  # Columns first stored after the backtest started are ignored
+        rows = np.full((len(times), len(columns)), np.nan)
+        rows[sample_index[known], values['idx'][known].astype(np.intp)] = values['value'][known]
+        if not known.all():
+            present = np.zeros(len(times), dtype=bool)
+            present[sample_index[known]] = True
+            times, rows = times[present], rows[present]
+            if not len(times):
+                continue
+
+        calc_data = _epochs(conn, f'''
+            SELECT {EPOCH_SQL.format('timestamp')}, {', '.join(CALCULATION_FIELDS)}
+            FROM calculations WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp
+        ''', bounds)
+        calculations = {}
+        if len(calc_data):
+            pos = np.clip(np.searchsorted(calc_data[:, 0], times), 0, len(calc_data) - 1)
+            matched = calc_data[pos, 0] == times
+            for i, name in enumerate(CALCULATION_FIELDS, start=1):
+                calculations[name] = np.where(matched, calc_data[pos, i], np.nan)
+
+        yield times, rows, calculations
+
+
+def run_backtest(db_file, engine, start, end, chunk_days=DEFAULT_CHUNK_DAYS, max_examples=MAX_EXAMPLES):
+    """
+    Backtest the engine's checks over [start, end) (dates, end exclusive).
+    The engine must be configured (categories, thresholds, rules); its
+    columns are replaced by the stored ones.
+    """
+    started = time.perf_counter()
+    start_day, end_day = _day(start), _day(end)
+    conn = sqlite3.connect(db_file)
+    try:
+        columns = load_columns(conn, start_day.isoformat(), end_day.isoformat())
+        engine.set_columns(columns)
+
+        states = {}  # (group, slot) -> scan state
+        raised = {}  # Signature -> number of slots raising it (one alert while any does)
+        open_since = {}  # Signature -> activation time of the open alert
+        results = {}
+        stats = {}
+        samples = 0
+        last_time = None
+
+        def result(template):
+            signature = engine.get_alert_signature(template)
+            entry = results.get(signature)
+            if entry is None:
+                entry = results[signature] = {
+                    'signature': signature,
+                    'severity': template.severity,
+                    'category': template.category,
+                    'title': template.title,
+                    'component': template.component,
+                    'alerts': 0,
+                    'samples_over_limit': 0,
+                    'total_duration_s': 0.0,
+                    'max_duration_s': 0.0,
+                    'open_at_end': 0,
+                    'examples': [],
+                }
+            return entry
+
+        def close(entry, until):
+            duration = until - open_since.pop(entry['signature'])
+            entry['total_duration_s'] += duration
+            entry['max_duration_s'] = max(entry['max_duration_s'], duration)
+
+        for times, rows, calculations in iter_chunks(conn, columns, start_day, end_day, chunk_days):
+            samples += len(times)
+            last_time = float(times[-1])
+            events = []
+            for g, group in enumerate(engine.evaluate_block(rows, calculations, times, stats)):
+                over = group['on'].sum(axis=1)
+                for k in range(len(over)):
+                    state = states.get((g, k))
+                    if not over[k] and (state is None or not state['active']):
+                        if state is not None:
+                            state['on_since'] = np.nan
+                        continue
+                    if state is None:
+                        state = states[(g, k)] = new_scan_state()
+                    entry = result(group['templates'][k])
+                    entry['samples_over_limit'] += int(over[k])
+                    for event_time, active in scan_debounce(times, group['on'][k], group['hold'][k],
+                                                            group['for_seconds'][k], group['clear_seconds'][k],
+                                                            state):
+                        events.append((event_time, not active, entry))
+
+            # Slot transitions in time order (raises first), merged per signature
+            events.sort(key=lambda e: (e[0], e[1]))
+            for event_time, cleared, entry in events:
+                signature = entry['signature']
+                count = raised.get(signature, 0) + (-1 if cleared else 1)
+                raised[signature] = count
+                if count == 1 and not cleared:
+                    open_since[signature] = event_time
+                    entry['alerts'] += 1
+                    if len(entry['examples']) < max_examples:
+                        entry['examples'].append(_iso(event_time))
+                elif count == 0:
+                    close(entry, event_time)
+
+        # Alerts still active at the end of the range
+        for signature in list(open_since):
+            results[signature]['open_at_end'] += 1
+            close(results[signature], last_time)
+    finally:
+        conn.close()
+
+    checks = sorted((r for r in results.values() if r['alerts'] or r['samples_over_limit']),
+                    key=lambda r: (-r['alerts'], -r['samples_over_limit'], r['signature']))
+    for r in checks:
+        r['total_duration_s'] = round(r['total_duration_s'], 1)
+        r['max_duration_s'] = round(r['max_duration_s'], 1)
+    return {
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'samples': samples,
+        'columns': len(columns),
+        'alerts': sum(r['alerts'] for r in checks),
+        'checks': checks,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+
+def _load_settings(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        row = conn.execute('SELECT thresholds, rules FROM diagnosis_settings WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    if not row:
+        return None, []
+    return (json.loads(row[0]) if row[0] else None), (json.loads(row[1]) if row[1] else [])
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Backtest diagnosis checks over stored measurements")
+    parser.add_argument("--start", required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="day after the last one (YYYY-MM-DD)")
+    parser.add_argument("--db", default=os.path.join(base_dir, "pv_history.db"))
+    parser.add_argument("--config", default=os.path.join(base_dir, "config.json"))
+    parser.add_argument("--thresholds", help="JSON file with thresholds (default: stored settings)")
+    parser.add_argument("--rules", help="JSON file with a list of rules (default: stored settings)")
+    parser.add_argument("--chunk-days", type=int, default=DEFAULT_CHUNK_DAYS)
+    parser.add_argument("--json", action="store_true", help="print the full result as JSON")
+    args = parser.parse_args()
+
+    engine = DiagnosisEngine()
+    if os.path.exists(args.config):
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        engine.set_config(config)
+        engine.set_sensor_categories(config)
+    thresholds, rules = _load_settings(args.db)
+    if args.thresholds:
+        with open(args.thresholds, "r", encoding="utf-8") as f:
+            thresholds = json.load(f)
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    if thresholds:
+        engine.thresholds = thresholds
+    engine.set_rules(rules)
+
+    result = run_backtest(args.db, engine, args.start, args.end, args.chunk_days)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{result['samples']} samples, {result['columns']} columns, {result['alerts']} alerts "
+          f"({result['start']} to {result['end']}, {result['elapsed_s']}s)")
+    print(f"{'alerts':>6} {'over':>8} {'total h':>8} {'max min':>8}  check")
+    for r in result['checks']:
+        print(f"{r['alerts']:>6} {r['samples_over_limit']:>8} {r['total_duration_s'] / 3600:>8.1f} "
+              f"{r['max_duration_s'] / 60:>8.1f}  {r['title']} ({r['component']})"
+              + (f"  e.g. {', '.join(r['examples'][:2])}" if r['examples'] else ""))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,460 @@
+"""
+Declarative Diagnosis Rules
+User-defined checks stored in diagnosis_settings.rules (JSON list), e.g.
+
+    {
+        "id": "string_underperforming",
+        "when": "*.I1D < 0.5 * ID1.I1D and total_pv_power > 1000",
+        "severity": "WARNING",
+        "category": "custom",
+        "title": "String Underperforming",
+        "message": "{mb} current {value:.1f}A is below half of ID1"
+    }
+
+Expressions use Python syntax over:
+- MB fields: `VD1.V1D`; `*.V1D` applies the rule to every MB with that field
+  (one alert per MB, component defaults to the MB)
+- calculations: `total_pv_power`, `battery_soc`, ...
+- thresholds: `thresholds.voltage.pv_max`
+- numbers, + - * /, comparisons, and/or/not, abs(), min(), max()
+- rolling statistics of a field or calculation: mean(x) and std(x) (EWMA
+  over ~5 minutes) and rate(x) (change per second since the previous sample)
+
+`value` (optional expression) is reported in the alert; by default it is the
+left side of the first comparison. Messages may use {value}, {threshold} and {mb}.
+
+Timing and hysteresis (all optional):
+- "for": "60s"        the condition must hold this long before the alert fires
+- "clear_for": "2m"   ...and be false this long before it clears (default: "for")
+- "hysteresis": 5     for a single > or < comparison: once active, the alert
+                      holds until the value is back past the limit by this margin
+- "clear_when": expr  for any rule: once active, the alert holds until expr is true
+
+Rules are compiled together with the built-in checks: a single comparison of
+a field against a constant becomes an entry in the flat rule plan, anything
+else is translated into one generated NumPy function that evaluates every
+rule per sample in a single call.
+"""
+
+import ast
+import logging
+import re
+
+import numpy as np
+
+from diagnosis_state import RollingStats, parse_duration
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ("INFO", "WARNING", "ERROR", "CRITICAL")
+WILDCARD = "__each__"
+
+FUNCTIONS = {"abs": ("np.abs", 1), "min": ("np.minimum", 2), "max": ("np.maximum", 2)}
+# Rolling statistics: name -> suffix of the stats array in the generated code
+STAT_FUNCTIONS = {"mean": "m", "std": "s", "rate": "d"}
+COMPARE_OPS = {ast.Gt: ">", ast.Lt: "<", ast.GtE: ">=", ast.LtE: "<=", ast.Eq: "==", ast.NotEq: "!="}
+BINARY_OPS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+# Comparisons that can go into the flat rule plan (value above/below a limit)
+PLAN_OPS = {ast.Gt: "above", ast.Lt: "below"}
+FLIPPED = {ast.Gt: ast.Lt, ast.Lt: ast.Gt}
+
+
+class RuleError(ValueError):
+    """Invalid rule definition"""
+
+
+class MissingColumn(Exception):
+    """A rule references a field that is not in the current schema"""
+
+
+def _parse(expression, rule_id):
+    if not isinstance(expression, str) or not expression.strip():
+        raise RuleError(f"Rule '{rule_id}': expression must be a non-empty string")
+    source = re.sub(r"\*\s*\.", f"{WILDCARD}.", expression)
+    try:
+        return ast.parse(source, mode="eval").body
+    except SyntaxError as e:
+        raise RuleError(f"Rule '{rule_id}': invalid expression '{expression}': {e.msg}")
+
+
+class Rule:
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise RuleError("Each rule must be an object")
+        self.id = str(spec.get("id") or "").strip()
+        if not self.id:
+            raise RuleError("Rule is missing an 'id'")
+        self.enabled = bool(spec.get("enabled", True))
+        self.severity = str(spec.get("severity", "WARNING")).upper()
+        if self.severity not in SEVERITIES:
+            raise RuleError(f"Rule '{self.id}': severity must be one of {', '.join(SEVERITIES)}")
+        self.category = spec.get("category", "custom")
+        self.title = spec.get("title", self.id)
+        self.message = spec.get("message", f"{self.title} (value: {{value}})")
+        self.component = spec.get("component")
+        self.when = _parse(spec.get("when"), self.id)
+        self.custom_value = bool(spec.get("value"))
+        self.value = _parse(spec["value"], self.id) if self.custom_value else _first_operand(self.when)
+        try:
+            self.for_seconds = parse_duration(spec.get("for"))
+            self.clear_seconds = parse_duration(spec.get("clear_for", spec.get("for")))
+        except ValueError as e:
+            raise RuleError(f"Rule '{self.id}': {e}")
+        self.hysteresis = spec.get("hysteresis") or 0
+        if isinstance(self.hysteresis, bool) or not isinstance(self.hysteresis, (int, float)) or self.hysteresis < 0:
+            raise RuleError(f"Rule '{self.id}': hysteresis must be a non-negative number")
+        if self.hysteresis and _single_comparison(self.when) is None:
+            raise RuleError(f"Rule '{self.id}': hysteresis needs a single > or < comparison (use clear_when)")
+        self.clear_when = _parse(spec["clear_when"], self.id) if spec.get("clear_when") else None
+        for name, node in (("when", self.when), ("clear_when", self.clear_when)):
+            if node is not None and not _is_condition(node):
+                raise RuleError(f"Rule '{self.id}': '{name}' must be a comparison or a combination of comparisons")
+        # Validate names and functions up front (independent of the schema)
+        checker = _Translator({}, None, self.id, check_only=True)
+        checker.translate(self.when)
+        if self.value is not None:
+            checker.translate(self.value)
+        if self.clear_when is not None:
+            checker.translate(self.clear_when)
+
+
+def parse_rules(specs):
+    """Validate a list of rule definitions. Raises RuleError."""
+    if specs is None:
+        return []
+    if not isinstance(specs, list):
+        raise RuleError("Rules must be a list")
+    rules = [Rule(spec) for spec in specs]
+    ids = [rule.id for rule in rules]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise RuleError(f"Duplicate rule ids: {', '.join(duplicates)}")
+    return rules
+
+
+def _single_comparison(node):
+    """(op, left, right) if the expression is a single > or < comparison"""
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in PLAN_OPS:
+        return type(node.ops[0]), node.left, node.comparators[0]
+    return None
+
+
+def _is_condition(node):
+    """True if the expression is boolean: a comparison, and/or/not of conditions, or True/False"""
+    if isinstance(node, ast.Compare):
+        return True
+    if isinstance(node, ast.BoolOp):
+        return all(_is_condition(value) for value in node.values)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return _is_condition(node.operand)
+    return isinstance(node, ast.Constant) and isinstance(node.value, bool)
+
+
+def _first_operand(node):
+    """Left side of the first comparison in an expression"""
+    for child in ast.walk(node):
+        if isinstance(child, ast.Compare):
+            return child.left
+    return None
+
+
+class _Translator:
+    """Translates a rule AST into a NumPy expression over r (sample row) and c (calculations)"""
+
+    def __init__(self, column_index, threshold, rule_id, check_only=False, calc_keys=None, wildcard_prefix="w"):
+        self.column_index = column_index
+        self.threshold = threshold
+        self.rule_id = rule_id
+        self.check_only = check_only
+        self.calc_keys = [] if calc_keys is None else calc_keys  # Shared by all rules of an evaluator
+        self.wildcard_prefix = wildcard_prefix
+        self.wildcard_fields = []
+        self.uses_stats = False
+
+    def error(self, message):
+        return RuleError(f"Rule '{self.rule_id}': {message}")
+
+    def translate(self, node) -> str:
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool):
+                return "np.True_" if node.value else "np.False_"
+            if isinstance(node.value, (int, float)):
+                return repr(float(node.value))
+            raise self.error(f"unsupported constant {node.value!r}")
+        if isinstance(node, ast.Name):
+            if node.id == WILDCARD:
+                raise self.error("'*' must be followed by a field name")
+            if node.id not in self.calc_keys:
+                self.calc_keys.append(node.id)
+            return f"c[{self.calc_keys.index(node.id)}]"
+        if isinstance(node, ast.Attribute):
+            return self.attribute(node)
+        if isinstance(node, ast.BoolOp):
+            if not all(_is_condition(v) for v in node.values):
+                raise self.error("the operands of 'and'/'or' must be comparisons")
+            op = " & " if isinstance(node.op, ast.And) else " | "
+            return "(" + op.join(f"({self.translate(v)})" for v in node.values) + ")"
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                if not _is_condition(node.operand):
+                    raise self.error("the operand of 'not' must be a comparison")
+                return f"(~({self.translate(node.operand)}))"
+            if isinstance(node.op, ast.USub):
+                return f"(-({self.translate(node.operand)}))"
+            if isinstance(node.op, ast.UAdd):
+                return self.translate(node.operand)
+            raise self.error("unsupported unary operator")
+        if isinstance(node, ast.BinOp):
+            op = BINARY_OPS.get(type(node.op))
+            if op is None:
+                raise self.error("unsupported operator (use + - * /)")
+            return f"({self.translate(node.left)} {op} {self.translate(node.right)})"
+        if isinstance(node, ast.Compare):
+            parts = []
+            left = self.translate(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                symbol = COMPARE_OPS.get(type(op))
+                if symbol is None:
+                    raise self.error("unsupported comparison")
+                right = self.translate(comparator)
+                parts.append(f"({left} {symbol} {right})")
+                left = right
+            return "(" + " & ".join(parts) + ")"
+        if isinstance(node, ast.Call):
+            name = node.func.id if isinstance(node.func, ast.Name) else None
+            if name in STAT_FUNCTIONS and not node.keywords:
+                return self.statistic(name, node.args)
+            if name not in FUNCTIONS or node.keywords:
+                raise self.error(f"unsupported function (allowed: {', '.join(list(FUNCTIONS) + list(STAT_FUNCTIONS))})")
+            function, arity = FUNCTIONS[name]
+            if len(node.args) != arity:
+                raise self.error(f"{name}() takes {arity} argument(s)")
+            return f"{function}(" + ", ".join(self.translate(a) for a in node.args) + ")"
+        raise self.error(f"unsupported syntax '{type(node).__name__}'")
+
+    def statistic(self, name, args):
+        # mean/std/rate of a single series: index the matching stats array
+        if len(args) != 1 or not (isinstance(args[0], ast.Name) or
+                                  (isinstance(args[0], ast.Attribute) and not _is_threshold(args[0]))):
+            raise self.error(f"{name}() takes one field or calculation")
+        series = self.translate(args[0])
+        self.uses_stats = True
+        return series[0] + STAT_FUNCTIONS[name] + series[1:]
+
+    def attribute(self, node):
+        # thresholds.<group>.<key>
+        if (isinstance(node.value, ast.Attribute) and isinstance(node.value.value, ast.Name)
+                and node.value.value.id == "thresholds"):
+            if self.check_only:
+                return "0.0"
+            try:
+                return repr(float(self.threshold(node.value.attr, node.attr)))
+            except (KeyError, TypeError, ValueError):
+                raise self.error(f"unknown threshold thresholds.{node.value.attr}.{node.attr}")
+        if not isinstance(node.value, ast.Name):
+            raise self.error("fields are written as MB.field, *.field or thresholds.group.key")
+        mb_id, field_name = node.value.id, node.attr
+        if mb_id == WILDCARD:
+            if field_name not in self.wildcard_fields:
+                self.wildcard_fields.append(field_name)
+            return f"r[{self.wildcard_prefix}_{self.wildcard_fields.index(field_name)}]"
+        if self.check_only:
+            return "r[0]"
+        col = self.column_index.get((mb_id, field_name))
+        if col is None:
+            raise MissingColumn(f"{mb_id}.{field_name}")
+        return f"r[{col}]"
+
+
+class RuleEvaluator:
+    """All non-trivial rules compiled into one generated function"""
+
+    def __init__(self, source, namespace, calc_keys, slots, row_size, uses_stats):
+        self.source = source
+        exec(compile(source, "<diagnosis rules>", "exec"), namespace)
+        self.function = namespace["evaluate"]
+        self.calc_keys = calc_keys
+        # One output slot per rule (one per MB for wildcard rules)
+        self.templates = [slot["template"] for slot in slots]
+        self.keys = [slot["key"] for slot in slots]
+        self.for_seconds = np.array([slot["for"] for slot in slots], dtype=np.float64)
+        self.clear_seconds = np.array([slot["clear_for"] for slot in slots], dtype=np.float64)
+        self.has_hold = np.array([slot["hold"] for slot in slots], dtype=bool)
+        self.uses_stats = uses_stats
+        self.row_stats = RollingStats(row_size) if uses_stats else None
+        self.calc_stats = RollingStats(len(calc_keys)) if uses_stats else None
+        self._fired = np.zeros(len(slots), dtype=bool)
+        self._hold = np.zeros(len(slots), dtype=bool)
+        self._values = np.zeros(len(slots))
+
+    def __len__(self):
+        return len(self.templates)
+
+    def evaluate(self, row, calculations, now, active=None):
+        """
+        Evaluate every rule for one sample. Returns (fired, values) arrays
+        over the slots; for slots in `active` with hysteresis or clear_when,
+        `fired` is the hold condition instead.
+        """
+        calcs = np.array([_number(calculations.get(key)) for key in self.calc_keys], dtype=np.float64)
+        if self.uses_stats:
+            self.row_stats.update(row, now)
+            self.calc_stats.update(calcs, now)
+            rs, cs = self.row_stats, self.calc_stats
+            stats = (rs.mean, rs.std, rs.rate, cs.mean, cs.std, cs.rate)
+        else:
+            stats = (None,) * 6
+        with np.errstate(all="ignore"):
+            self.function(row, calcs, *stats, self._fired, self._hold, self._values)
+        fired = self._fired
+        if active is not None:
+            fired = np.where(active & self.has_hold, self._hold, fired)
+        return fired, self._values
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return np.nan
+
+
+def _template(make_template, rule, mb_id=None, threshold=None):
+    component = rule.component or (mb_id if mb_id else "system")
+    if mb_id and "{mb}" in component:
+        component = component.replace("{mb}", mb_id)
+    return make_template(
+        severity=rule.severity,
+        category=rule.category,
+        title=rule.title,
+        message=rule.message,
+        component=component,
+        threshold=threshold,
+        mb=mb_id,
+    )
+
+
+def _plan_entries(rule, column_index, mb_fields, threshold, make_template):
+    """
+    Entries for the flat rule plan if the rule is `field > const` / `field < const`
+    (either side). Returns None if the rule needs the general evaluator.
+    """
+    comparison = _single_comparison(rule.when)
+    if comparison is None or rule.clear_when is not None:
+        return None
+    op, left, right = comparison
+    if not isinstance(left, ast.Attribute) or _is_threshold(left):
+        op, left, right = FLIPPED[op], right, left
+    if not isinstance(left, ast.Attribute) or _is_threshold(left) or not isinstance(left.value, ast.Name):
+        return None
+    if rule.custom_value:
+        return None
+    translator = _Translator(column_index, threshold, rule.id)
+    try:
+        limit = float(eval(translator.translate(right), {"np": np, "__builtins__": {}}))
+    except (RuleError, MissingColumn, NameError, TypeError, ZeroDivisionError):
+        return None
+    if translator.calc_keys or translator.wildcard_fields:
+        return None
+
+    mb_id, field_name = left.value.id, left.attr
+    if mb_id == WILDCARD:
+        mbs = [mb for mb, fields in mb_fields.items() if field_name in fields]
+    else:
+        mbs = [mb_id] if (mb_id, field_name) in column_index else []
+    if not mbs:
+        logger.warning(f"Diagnosis rule '{rule.id}' skipped: no {mb_id}.{field_name} in the measurement schema")
+    timing = (rule.for_seconds, rule.clear_seconds, float(rule.hysteresis))
+    return [(column_index[(mb, field_name)], PLAN_OPS[op], limit,
+             _template(make_template, rule, mb if mb_id == WILDCARD else None, limit), timing)
+            for mb in mbs]
+
+
+def _is_threshold(node):
+    return (isinstance(node.value, ast.Attribute) and isinstance(node.value.value, ast.Name)
+            and node.value.value.id == "thresholds")
+
+
+def compile_rules(rules, columns, threshold, make_template=dict):
+    """
+    Compile rules against the sample layout.
+
+    - columns: list of (mb_id, field_name) in sample row order
+    - threshold: function (group, key) -> value
+    - make_template: builds the alert template from keyword arguments
+
+    Returns (plan entries, RuleEvaluator or None). Plan entries are
+    (column, "above"/"below", limit, template, (for, clear_for, hysteresis)).
+    """
+    column_index = {col: idx for idx, col in enumerate(columns)}
+    mb_fields = {}
+    for mb_id, field_name in columns:
+        mb_fields.setdefault(mb_id, set()).add(field_name)
+
+    plan = []
+    lines = []
+    namespace = {"np": np, "__builtins__": {}}
+    calc_keys = []
+    slots = []
+    uses_stats = False
+
+    for rule in rules:
+        if not rule.enabled:
+            continue
+        entries = _plan_entries(rule, column_index, mb_fields, threshold, make_template)
+        if entries is not None:
+            plan.extend(entries)
+            continue
+
+        prefix = f"w{len(lines)}"
+        translator = _Translator(column_index, threshold, rule.id, calc_keys=calc_keys, wildcard_prefix=prefix)
+        try:
+            condition = translator.translate(rule.when)
+            value = translator.translate(rule.value) if rule.value is not None else "np.nan"
+            hold = None
+            if rule.clear_when is not None:
+                hold = f"(~({translator.translate(rule.clear_when)}))"
+            elif rule.hysteresis:
+                # Hold while the value is within `hysteresis` of the limit
+                op, left, right = _single_comparison(rule.when)
+                margin = repr(float(rule.hysteresis))
+                if op is ast.Gt:
+                    hold = f"({translator.translate(left)} > ({translator.translate(right)} - {margin}))"
+                else:
+                    hold = f"({translator.translate(left)} < ({translator.translate(right)} + {margin}))"
+        except MissingColumn as e:
+            logger.warning(f"Diagnosis rule '{rule.id}' skipped: {e} is not in the measurement schema")
+            continue
+        except RuleError as e:
+            logger.warning(f"Diagnosis rule skipped: {e}")
+            continue
+
+        if translator.wildcard_fields:
+            mbs = [mb for mb, fields in mb_fields.items()
+                   if all(f in fields for f in translator.wildcard_fields)]
+            if not mbs:
+                continue
+            for j, field_name in enumerate(translator.wildcard_fields):
+                namespace[f"{prefix}_{j}"] = np.array([column_index[(mb, field_name)] for mb in mbs],
+                                                      dtype=np.intp)
+        else:
+            mbs = [None]
+        uses_stats = uses_stats or translator.uses_stats
+        # Each rule writes its result and value into its own slots of the output arrays
+        start, end = len(slots), len(slots) + len(mbs)
+        slots.extend({
+            "template": _template(make_template, rule, mb),
+            "key": (rule.id, mb),
+            "for": rule.for_seconds,
+            "clear_for": rule.clear_seconds,
+            "hold": hold is not None,
+        } for mb in mbs)
+        lines.append(f"    out[{start}:{end}] = {condition}")
+        if hold is not None:
+            lines.append(f"    hold[{start}:{end}] = {hold}")
+        lines.append(f"    vals[{start}:{end}] = {value}")
+
+    evaluator = None
+    if lines:
+        source = "def evaluate(r, c, rm, rs, rd, cm, cs, cd, out, hold, vals):\n" + "\n".join(lines) + "\n"
+        evaluator = RuleEvaluator(source, namespace, calc_keys, slots, len(columns), uses_stats)
+    return plan, evaluator
@@ -0,0 +1,244 @@
+"""
+Diagnosis State
+Per-series rolling statistics and per-alert debounce state, both kept as
+NumPy arrays so every update is O(1) per series with no Python loop.
+
+- RollingStats: time-aware EWMA mean and variance (West's incremental
+  update) and the rate of change per second of every series.
+- DebounceState: an alert slot becomes active only after its condition has
+  held for `for` seconds, and clears only after it has been false for
+  `clear_for` seconds.
+
+Both have block counterparts for evaluating stored history (backtest):
+RollingStats.update_block and scan_debounce.
+"""
+
+import math
+import re
+
+import numpy as np
+
+# Time constant of the rolling mean/variance
+DEFAULT_STATS_WINDOW_SECONDS = 300.0
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0, None: 1.0}
+
+
+def parse_duration(value) -> float:
+    """Seconds from a number or a string like '60s', '5m', '1h'"""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value < 0 or not math.isfinite(value):
+            raise ValueError(f"invalid duration {value!r}")
+        return float(value)
+    match = _DURATION.match(str(value))
+    if not match:
+        raise ValueError(f"invalid duration {value!r} (use e.g. 30, '30s', '5m', '1h')")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+class RollingStats:
+    def __init__(self, size, window_seconds=DEFAULT_STATS_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.mean = np.full(size, np.nan)
+        self.var = np.zeros(size)
+        self.rate = np.full(size, np.nan)  # Change per second since the previous sample
+        self.last = np.full(size, np.nan)
+        self.last_time = None
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def update(self, values, now):
+        """Fold one sample in (NaN values leave their series unchanged)"""
+        finite = np.isfinite(values)
+        dt = None if self.last_time is None else now - self.last_time
+        if dt is not None and dt > 0:
+            with np.errstate(invalid="ignore"):
+                self.rate = np.where(finite & np.isfinite(self.last), (values - self.last) / dt, np.nan)
+            alpha = 1.0 - math.exp(-dt / self.window_seconds)
+        else:
+            self.rate = np.full(len(values), np.nan)
+            alpha = 1.0
+
+        first = finite & np.isnan(self.mean)
+        update = finite & ~first
+        delta = np.where(update, values - self.mean, 0.0)
+        self.mean = np.where(first, values, self.mean + alpha * delta)
+        self.var = np.where(update, (1.0 - alpha) * (self.var + alpha * delta * delta), self.var)
+        self.last = np.where(finite, values, self.last)
+        self.last_time = now
+
+    def update_block(self, values, times):
+        """
+        update() for a block of samples at once: values is (series x samples).
+        Returns the mean, std and rate after every sample (series x samples).
+        """
+        size, n = values.shape
+        if n == 0:
+            return values.copy(), values.copy(), values.copy()
+        previous = np.concatenate(([np.nan if self.last_time is None else self.last_time], times[:-1]))
+        dt = times - previous
+        with np.errstate(invalid="ignore"):
+            step = dt > 0
+            alpha = np.where(step, -np.expm1(-dt / self.window_seconds), 1.0)
+        finite = np.isfinite(values)
+        x = np.where(finite, values, 0.0)
+
+        # Rate: against the latest finite value before each sample
+        extended = np.concatenate((self.last[:, None], values), axis=1)
+        index = np.where(np.isfinite(extended), np.arange(n + 1), 0)
+        filled = np.take_along_axis(extended, np.maximum.accumulate(index, axis=1), axis=1)
+        before = filled[:, :-1]
+        with np.errstate(invalid="ignore"):
+            rate = np.where(finite & np.isfinite(before) & step, (values - before) / np.where(step, dt, 1.0), np.nan)
+
+        # Mean and variance: y[t] = (1 - a[t]) * y[t-1] + u[t], a = 0 where the value is NaN.
+        # A series without a mean yet starts from its first value (so that update is exact).
+        a = np.where(finite, alpha, 0.0)
+        first = np.argmax(finite, axis=1)
+        fresh = np.isnan(self.mean)
+        start = np.where(fresh, np.where(finite.any(axis=1), x[np.arange(size), first], 0.0), self.mean)
+        mean = _linear_recurrence(1.0 - a, a * x, start)
+        delta = x - np.concatenate((start[:, None], mean[:, :-1]), axis=1)
+        var = _linear_recurrence(1.0 - a, (1.0 - a) * a * delta * delta, self.var)
+        mean[fresh[:, None] & ((np.arange(n) < first[:, None]) | ~finite.any(axis=1)[:, None])] = np.nan
+
+        self.mean = mean[:, -1].copy()
+        self.var = var[:, -1].copy()
+        self.rate = rate[:, -1].copy()
+        self.last = filled[:, -1].copy()
+        self.last_time = float(times[-1])
+        return mean, np.sqrt(var), rate
+
+
+def _linear_recurrence(decay, inputs, initial, block=16):
+    """
+    y[t] = decay[t] * y[t-1] + inputs[t] for every row, as
+    y[t] = P[t] * (y[0] + cumsum(inputs / P)[t]) with P the running product
+    of decays, restarted every `block` samples to keep 1/P finite.
+    Decays are floored at exp(-40) (a weight of 4e-18 for the past).
+    """
+    out = np.empty_like(inputs)
+    y = initial
+    log_decay = np.log(np.maximum(decay, math.exp(-40.0)))
+    for s in range(0, inputs.shape[1], block):
+        log_product = np.cumsum(log_decay[:, s:s + block], axis=1)
+        out[:, s:s + block] = np.exp(log_product) * (
+            y[:, None] + np.cumsum(np.exp(-log_product) * inputs[:, s:s + block], axis=1))
+        y = out[:, min(s + block, inputs.shape[1]) - 1]
+    return out
+
+
+class DebounceState:
+    def __init__(self, for_seconds, clear_seconds, keys, previous=None):
+        """
+        - keys: one hashable key per slot, used to carry state over from
+          `previous` when checks are recompiled (e.g. after a threshold change)
+        """
+        self.for_seconds = np.asarray(for_seconds, dtype=np.float64)
+        self.clear_seconds = np.asarray(clear_seconds, dtype=np.float64)
+        self.keys = list(keys)
+        size = len(self.keys)
+        self.active = np.zeros(size, dtype=bool)
+        self.on_since = np.full(size, np.nan)  # Condition true since (while pending or active)
+        self.off_since = np.full(size, np.nan)  # Condition false since (while active)
+        self.last_alerts = [None] * size  # Latest alert per slot, kept while clearing
+        self.idle = True  # Nothing pending or active: a quiet sample needs no update
+
+        if previous is not None and len(previous):
+            old_index = {key: i for i, key in enumerate(previous.keys)}
+            for i, key in enumerate(self.keys):
+                j = old_index.get(key)
+                if j is not None:
+                    self.active[i] = previous.active[j]
+                    self.on_since[i] = previous.on_since[j]
+                    self.off_since[i] = previous.off_since[j]
+                    self.last_alerts[i] = previous.last_alerts[j]
+            self.idle = not (self.active.any() or np.isfinite(self.on_since).any())
+
+    def __len__(self):
+        return len(self.active)
+
+    def update(self, raw, now) -> np.ndarray:
+        """Advance with the raw condition of every slot; returns the active mask"""
+        if self.idle and not raw.any():
+            return self.active
+        self.on_since = np.where(raw, np.where(np.isnan(self.on_since), now, self.on_since), np.nan)
+        self.off_since = np.where(raw | ~self.active, np.nan,
+                                  np.where(np.isnan(self.off_since), now, self.off_since))
+        activate = raw & ~self.active & (now - self.on_since >= self.for_seconds)
+        deactivate = ~raw & self.active & (now - self.off_since >= self.clear_seconds)
+        self.active = (self.active | activate) & ~deactivate
+        self.off_since[~self.active] = np.nan
+        self.idle = not (self.active.any() or raw.any())
+        return self.active
+
+
+def _qualified(times, condition, duration, carried_start):
+    """
+    For a block of samples: the start time of the run each sample belongs
+    to, and the samples where a run first reaches `duration`.
+    carried_start continues a run that was already going at the block start.
+    """
+    n = len(condition)
+    starts = condition & ~np.concatenate(([False], condition[:-1]))
+    run_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+    start_time = times[run_start]
+    if condition[0] and np.isfinite(carried_start):
+        start_time = np.where(run_start == 0, carried_start, start_time)
+    qualified = condition & (times - start_time >= duration)
+    first = qualified & ~np.concatenate(([False], qualified[:-1]))
+    return start_time, np.flatnonzero(first)
+
+
+def new_scan_state():
+    return {'active': False, 'on_since': np.nan, 'off_since': np.nan}
+
+
+def scan_debounce(times, on, hold, for_seconds, clear_seconds, state):
+    """
+    DebounceState.update for one slot over a block of samples at once.
+
+    - on: condition that raises the alert; hold: condition that keeps an
+      active alert (on itself, or the hysteresis / clear_when condition)
+    - state: from new_scan_state(), carried from block to block
+
+    Returns the transitions as [(time, active), ...].
+    """
+    if len(times) == 0:
+        return []
+    if not state['active'] and not on.any():
+        state['on_since'] = np.nan
+        return []
+
+    on_start, activations = _qualified(times, on, for_seconds,
+                                       np.nan if state['active'] else state['on_since'])
+    off = ~hold
+    off_start, deactivations = _qualified(times, off, clear_seconds,
+                                          state['off_since'] if state['active'] else np.nan)
+
+    # Alternate: next activation after the last deactivation and vice versa
+    events = []
+    active = state['active']
+    pos = -1
+    while True:
+        candidates = deactivations if active else activations
+        j = np.searchsorted(candidates, pos, side='right')
+        if j == len(candidates):
+            break
+        pos = int(candidates[j])
+        active = not active
+        events.append((float(times[pos]), active))
+
+    state['active'] = active
+    if active:
+        state['on_since'] = np.nan
+        state['off_since'] = float(off_start[-1]) if off[-1] else np.nan
+    else:
+        state['on_since'] = float(on_start[-1]) if on[-1] else np.nan
+        state['off_since'] = np.nan
+    return events
@@ -0,0 +1,252 @@
+"""
+Diagnosis Worker
+Runs the DiagnosisEngine in a separate process, so rule evaluation and
+alert formatting do not compete with serial parsing and WebSocket fan-out
+for the API process's GIL.
+
+The API process submits compact samples: the sample time, the float64 row
+and only the calculations the checks use. A feeder thread sends them to
+the worker over a pipe, one at a time. The worker replies with alert
+transitions: the alerts newly raised and the signatures that cleared.
+Engine configuration (columns, categories, thresholds, rules) is sent
+whenever the API-side engine recompiles.
+
+When diagnosis falls behind, the backlog policy decides what happens to
+waiting samples:
+- "latest": keep only the newest sample and skip the rest
+- "queue": keep up to queueSize samples in order (oldest dropped when full)
+
+A worker that dies, or does not answer a sample within resultTimeout
+seconds (hung without closing the pipe), is killed and restarted.
+
+Enabled in config.json:
+    "diagnosisWorker": {"enabled": true, "backlogPolicy": "latest", "queueSize": 300,
+                        "resultTimeout": 10}
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+from diagnosis import DiagnosisEngine
+
+logger = logging.getLogger(__name__)
+
+BACKLOG_POLICIES = ("latest", "queue")
+DEFAULT_QUEUE_SIZE = 300
+DEFAULT_RESULT_TIMEOUT = 10.0  # seconds for the worker to answer one sample
+POLL_SECONDS = 0.5  # Liveness check interval while waiting for a result
+
+
+def _worker_main(conn):
+    """Worker process: analyze samples, reply with alert transitions"""
+    engine = DiagnosisEngine()
+    engine.enabled = True
+    active = {}  # Signature -> alert currently raised
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        kind = message[0]
+        if kind == "configure":
+            _, snapshot, signatures = message
+            engine.configure(snapshot)
+            if signatures is not None:
+                # Alerts active in the API process, resolved if no longer raised
+                active = {signature: active.get(signature) for signature in signatures}
+        elif kind == "sample":
+            _, now, row, calculations = message
+            current = {}
+            for alert in engine.analyze_measurement({}, calculations, {}, row, now):
+                current.setdefault(engine.get_alert_signature(alert), alert)
+            created = [alert for signature, alert in current.items() if signature not in active]
+            resolved = [signature for signature in active if signature not in current]
+            active = current
+            conn.send((created, resolved))
+        elif kind == "stop":
+            break
+    conn.close()
+
+
+class DiagnosisWorker:
+    def __init__(self, engine, on_transitions, active_signatures):
+        """
+        - engine: the API-side DiagnosisEngine (source of configuration)
+        - on_transitions: function(created alerts, resolved signatures)
+        - active_signatures: function() -> signatures of the active alerts
+        """
+        self.engine = engine
+        self.on_transitions = on_transitions
+        self.active_signatures = active_signatures
+        self.policy = "latest"
+        self.queue_size = DEFAULT_QUEUE_SIZE
+        self.result_timeout = DEFAULT_RESULT_TIMEOUT
+        self.condition = threading.Condition()
+        self.backlog = deque()
+        self.running = False
+        self.process = None
+        self.conn = None
+        self.thread = None
+        self._sent_version = None
+        self._seed = True  # Send the active signatures with the next configuration
+        self.submitted = 0
+        self.processed = 0
+        self.skipped = 0
+        self.restarts = 0
+        self.timeouts = 0
+
+    def configure(self, settings):
+        """Apply the "diagnosisWorker" section of config.json (starts or stops the worker)"""
+        settings = settings or {}
+        policy = settings.get("backlogPolicy", "latest")
+        if policy not in BACKLOG_POLICIES:
+            logger.warning(f"Unknown diagnosis backlog policy '{policy}', using 'latest'")
+            policy = "latest"
+        try:
+            queue_size = max(1, int(settings.get("queueSize", DEFAULT_QUEUE_SIZE)))
+        except (TypeError, ValueError):
+            queue_size = DEFAULT_QUEUE_SIZE
+        try:
+            result_timeout = float(settings.get("resultTimeout", DEFAULT_RESULT_TIMEOUT))
+            if not result_timeout > 0:
+                raise ValueError(result_timeout)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid diagnosis worker resultTimeout {settings.get('resultTimeout')!r}, "
+                           f"using {DEFAULT_RESULT_TIMEOUT:g} s")
+            result_timeout = DEFAULT_RESULT_TIMEOUT
+        with self.condition:
+            self.policy = policy
+            self.queue_size = queue_size
+            self.result_timeout = result_timeout
+
+        if settings.get("enabled") and not self.running:
+            self.start()
+        elif not settings.get("enabled") and self.running:
+            self.stop()
+
+    def start(self):
+        self._spawn()
+        self.running = True
+        self.thread = threading.Thread(target=self._feed, name="diagnosis-feeder", daemon=True)
+        self.thread.start()
+        logger.info(f"Diagnosis worker started (backlog policy: {self.policy})")
+
+    def stop(self):
+        if not self.running and self.process is None:
+            return
+        with self.condition:
+            self.running = False
+            self.backlog.clear()
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self._terminate()
+        logger.info("Diagnosis worker stopped")
+
+    def _spawn(self):
+        # spawn: never fork the API process with its serial and event-loop threads
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,),
+                                       name="diagnosis-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._sent_version = None
+        self._seed = True
+
+    def _terminate(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=2)
+                if self.process.is_alive():
+                    self.process.kill()
+            self.process = None
+
+    def submit(self, now, row, calculations):
+        """Queue a sample for diagnosis (never blocks the caller)"""
+        sample = (now, row, {key: calculations.get(key) for key in self.engine.calculation_keys})
+        with self.condition:
+            if self.policy == "latest":
+                self.skipped += len(self.backlog)
+                self.backlog.clear()
+            elif len(self.backlog) >= self.queue_size:
+                self.backlog.popleft()
+                self.skipped += 1
+            self.backlog.append(sample)
+            self.submitted += 1
+            self.condition.notify()
+
+    def _receive(self):
+        """Wait for the worker's reply to a sample, checking that it is alive"""
+        deadline = time.monotonic() + self.result_timeout
+        while not self.conn.poll(POLL_SECONDS):
+            if not self.running:
+                raise EOFError("worker stopped")
+            if not self.process.is_alive():
+                raise EOFError(f"worker exited with code {self.process.exitcode}")
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                raise TimeoutError(f"no result within {self.result_timeout:g} s")
+        return self.conn.recv()
+
+    def _feed(self):
+        while True:
+            with self.condition:
+                while self.running and not self.backlog:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                now, row, calculations = self.backlog.popleft()
+
+            try:
+                version = self.engine.version
+                if version != self._sent_version:
+                    signatures = self.active_signatures() if self._seed else None
+                    self.conn.send(("configure", self.engine.snapshot(), signatures))
+                    self._sent_version = version
+                    self._seed = False
+                self.conn.send(("sample", now, row, calculations))
+                created, resolved = self._receive()
+            except (EOFError, OSError) as e:
+                if not self.running:
+                    return
+                logger.error(f"Diagnosis worker failed ({e}), restarting")
+                self._terminate()
+                self._spawn()
+                self.restarts += 1
+                continue
+
+            self.processed += 1
+            if created or resolved:
+                try:
+                    self.on_transitions(created, resolved)
+                except Exception as e:
+                    logger.error(f"Error applying diagnosis results: {e}")
+
+    def stats(self):
+        with self.condition:
+            return {
+                "running": self.running,
+                "pid": self.process.pid if self.process else None,
+                "backlog_policy": self.policy,
+                "queue_size": self.queue_size,
+                "backlog": len(self.backlog),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "restarts": self.restarts,
+                "timeouts": self.timeouts,
+            }
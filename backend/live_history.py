@@ -0,0 +1,187 @@
+"""
+Live History Ring Buffer
+Fixed-capacity, array-backed storage for today's live measurements.
+All series (MB fields and scalar calculations) share one preallocated
+float32 array of capacity x series, indexed by a monotonically increasing
+sequence number: a sample is one row written with a single slice
+assignment, memory stays constant all day, and clients can fetch only the
+samples they missed with a `since` cursor.
+
+The capacity covers one day at the measurement delay, capped by a byte
+budget; a new schema or delay reallocates the array and carries over the
+samples of the series that remain.
+"""
+
+import math
+import threading
+import warnings
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+DEFAULT_SAMPLE_INTERVAL = 10.0  # Seconds (measurementDelay)
+DEFAULT_BYTE_BUDGET = 64 * 1024 * 1024
+MIN_CAPACITY = 360
+
+
+def parse_timestamp(timestamp) -> float:
+    """Convert a measurement timestamp (ISO string) to epoch seconds"""
+    try:
+        return datetime.fromisoformat(str(timestamp)).timestamp()
+    except ValueError:
+        return datetime.now().timestamp()
+
+
+class LiveHistoryBuffer:
+    def __init__(self, sample_interval=DEFAULT_SAMPLE_INTERVAL, byte_budget=DEFAULT_BYTE_BUDGET, capacity=None):
+        """
+        - sample_interval: seconds between samples, sizes the buffer for one day
+        - byte_budget: upper bound for the sample array
+        - capacity: fixed number of samples (overrides the two above)
+        """
+        self.sample_interval = sample_interval
+        self.byte_budget = byte_budget
+        self.fixed_capacity = capacity
+        self.lock = threading.Lock()
+        self.next_seq = 0  # Sequence number of the next appended sample
+        self.oldest_seq = 0  # Oldest sequence number still in the buffer
+        self.names: List[str] = []
+        self.index = {}
+        self.capacity = self._capacity(0)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.values = np.full((self.capacity, 0), np.nan, dtype=np.float32)
+
+    def _capacity(self, width):
+        if self.fixed_capacity:
+            return self.fixed_capacity
+        day = math.ceil(DAY_SECONDS / max(1.0, self.sample_interval))
+        budget = self.byte_budget // (4 * max(1, width) + 8)
+        return max(MIN_CAPACITY, min(day, budget))
+
+    def set_schema(self, names: List[str]):
+        """Set the series of a sample row (values passed to append() follow this order)"""
+        with self.lock:
+            if list(names) != self.names:
+                self._resize_locked(list(names))
+
+    def set_sample_interval(self, seconds):
+        """Resize for one day of samples at this interval (measurementDelay)"""
+        try:
+            seconds = float(seconds)
+        except (TypeError, ValueError):
+            return
+        with self.lock:
+            if seconds > 0 and seconds != self.sample_interval:
+                self.sample_interval = seconds
+                self._resize_locked(self.names)
+
+    def _resize_locked(self, names):
+        capacity = self._capacity(len(names))
+        values = np.full((capacity, len(names)), np.nan, dtype=np.float32)
+        timestamps = np.zeros(capacity, dtype=np.float64)
+        # Carry over the newest samples of the series that remain
+        oldest = max(self.oldest_seq, self.next_seq - capacity)
+        seqs = np.arange(oldest, self.next_seq)
+        old_slots, new_slots = seqs % self.capacity, seqs % capacity
+        timestamps[new_slots] = self.timestamps[old_slots]
+        kept = [(i, self.index[name]) for i, name in enumerate(names) if name in self.index]
+        if kept and len(seqs):
+            new_cols, old_cols = (np.array(cols) for cols in zip(*kept))
+            values[np.ix_(new_slots, new_cols)] = self.values[np.ix_(old_slots, old_cols)]
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.capacity, self.values, self.timestamps = capacity, values, timestamps
+        self.oldest_seq = oldest
+
+    def append(self, timestamp, values) -> int:
+        """Append one sample (values in set_schema() order). Returns its sequence number."""
+        with self.lock:
+            if len(values) != len(self.names):
+                raise ValueError(f"Expected {len(self.names)} values, got {len(values)}")
+            seq = self.next_seq
+            slot = seq % self.capacity
+            self.timestamps[slot] = parse_timestamp(timestamp)
+            self.values[slot] = values
+            self.next_seq = seq + 1
+            self.oldest_seq = max(self.oldest_seq, self.next_seq - self.capacity)
+            return seq
+
+    def clear(self):
+        """Drop all samples (e.g. at midnight). Sequence numbers keep increasing."""
+        with self.lock:
+            self.oldest_seq = self.next_seq
+
+    def __len__(self):
+        return self.next_seq - self.oldest_seq
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def read(self, since: Optional[int] = None, fields: Optional[List[str]] = None,
+             max_points: Optional[int] = None) -> dict:
+        """
+        Read samples in columnar form.
+
+        - since: only return samples with seq > since
+        - fields: restrict to these series (default: all)
+        - max_points: down-sample by averaging fixed-size buckets
+        """
+        with self.lock:
+            start = self.oldest_seq
+            reset = False
+            if since is not None:
+                if since + 1 < self.oldest_seq or since >= self.next_seq:
+                    # Cursor fell out of the buffer (or predates a restart);
+                    # the client must replace its data
+                    reset = True
+                else:
+                    start = since + 1
+            end = self.next_seq
+            names = [f for f in fields if f in self.index] if fields else list(self.names)
+
+            slots = np.arange(start, end) % self.capacity
+            timestamps = self.timestamps[slots]
+            block = self.values[np.ix_(slots, [self.index[name] for name in names])]
+            columns = {name: block[:, i] for i, name in enumerate(names)}
+
+        bucket = 1
+        if max_points and len(slots) > max_points:
+            bucket = math.ceil(len(slots) / max_points)
+            timestamps = self._downsample(timestamps, bucket, last=True)
+            columns = {name: self._downsample(col, bucket) for name, col in columns.items()}
+
+        return {
+            "seq": end - 1,
+            "oldest_seq": self.oldest_seq,
+            "reset": reset,
+            "bucket": bucket,
+            "timestamps": (timestamps * 1000.0).round().astype(np.int64).tolist(),
+            "fields": {name: self._to_list(col) for name, col in columns.items()},
+        }
+
+    @staticmethod
+    def _downsample(values: np.ndarray, bucket: int, last=False) -> np.ndarray:
+        """Reduce values to one per bucket (mean, or last element for timestamps)"""
+        count = math.ceil(len(values) / bucket)
+        padded = np.full(count * bucket, np.nan, dtype=values.dtype)
+        padded[:len(values)] = values
+        padded = padded.reshape(count, bucket)
+        if last:
+            last_idx = np.full(count, bucket - 1)
+            last_idx[-1] = (len(values) - 1) % bucket
+            return padded[np.arange(count), last_idx]
+        with warnings.catch_warnings():
+            # All-NaN buckets are expected for series that were missing
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmean(padded, axis=1)
+
+    @staticmethod
+    def _to_list(values: np.ndarray) -> list:
+        """Convert to JSON-friendly list (NaN -> None, float32 rounded)"""
+        return [None if v != v else round(v, 4) for v in values.tolist()]
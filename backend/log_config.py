@@ -0,0 +1,205 @@
+"""
+Log Config
+Logging setup for the backend. Records are put on a queue by the thread
+that logs them and written by a single listener thread, so console and
+file I/O never happen on the serial reader or the event loop.
+
+config.json "logging" (applied on every config change):
+    {
+      "level": "INFO",
+      "levels": {"server.ingest": "DEBUG", "server.serial": "WARNING"},
+      "file": "pv_dashboard.log",
+      "rateLimit": {"seconds": 60, "burst": 5},
+      "sampleEvery": 100
+    }
+
+- level / levels: root level and per-subsystem levels by logger name. The
+  subsystems are the module loggers (server, streaming, diagnosis, ...) plus
+  server.serial (serial port I/O, echoes, command handshakes) and
+  server.ingest (per-measurement output).
+- file: also write to a rotating file (relative paths: the data directory)
+- rateLimit: the same message from the same call site is let through at
+  most `burst` times per `seconds`; the next one after the window carries
+  the number suppressed
+- sampleEvery: server.ingest DEBUG records are sampled, one in N
+
+Hot-path calls use lazy %-formatting (logger.debug("...: %s", msg)), so a
+disabled level costs one level check and nothing is formatted.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+SERIAL_LOGGER = "server.serial"
+INGEST_LOGGER = "server.ingest"
+CONSOLE_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+FILE_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s"
+FILE_MAX_BYTES = 10 * 1024 * 1024
+FILE_BACKUPS = 3
+DEFAULT_RATE_SECONDS = 60.0
+DEFAULT_BURST = 5
+MAX_TRACKED_MESSAGES = 1000
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of a message beyond `burst` per `seconds` (burst 0: no limit)"""
+
+    def __init__(self, seconds=DEFAULT_RATE_SECONDS, burst=DEFAULT_BURST):
+        super().__init__()
+        self.seconds = seconds
+        self.burst = burst
+        self.suppressed = 0  # Total dropped since startup
+        self._windows = {}  # Message key -> [window start, count, suppressed in window]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno,
+               record.msg if isinstance(record.msg, str) else None)
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.seconds:
+                window[1] += 1
+                if window[1] <= self.burst:
+                    return True
+                window[2] += 1
+                self.suppressed += 1
+                return False
+            if len(self._windows) >= MAX_TRACKED_MESSAGES:
+                self._windows = {k: w for k, w in self._windows.items() if now - w[0] < self.seconds}
+            self._windows[key] = [now, 1, 0]
+        if window is not None and window[2]:
+            record.msg = f"{record.msg} [{window[2]} similar messages suppressed]"
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Let one DEBUG record in `every` through (other levels always pass)"""
+
+    def __init__(self, every=1):
+        super().__init__()
+        self.every = every
+        self._count = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every <= 1:
+            return True
+        self._count += 1
+        return self._count % self.every == 1
+
+
+rate_limit = RateLimitFilter()
+sampler = SampleFilter()
+
+_queue = queue.SimpleQueue()
+_console = None
+_file_handler = None
+_listener = None
+_levels = {}  # Logger name -> level set from the config
+
+
+def setup(level=logging.INFO):
+    """Route all records through the queue listener (replaces logging.basicConfig)"""
+    global _console, _listener
+    if _listener is not None:
+        return
+    _console = logging.StreamHandler()
+    _console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handler = logging.handlers.QueueHandler(_queue)
+    handler.addFilter(rate_limit)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    logging.getLogger(INGEST_LOGGER).addFilter(sampler)
+    _listener = logging.handlers.QueueListener(_queue, _console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out what is queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _file_handler is not None:
+        _file_handler.close()
+
+
+def _level(value, default):
+    if value is None:
+        return default
+    level = logging.getLevelName(str(value).upper())
+    if not isinstance(level, int):
+        logger.warning(f"Unknown log level {value!r}, using {logging.getLevelName(default)}")
+        return default
+    return level
+
+
+def _set_file(path):
+    global _file_handler
+    current = _file_handler.baseFilename if _file_handler is not None else None
+    if (os.path.abspath(path) if path else None) == current:
+        return
+    if _file_handler is not None:
+        _file_handler.close()
+        _file_handler = None
+    if path:
+        try:
+            _file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=FILE_MAX_BYTES, backupCount=FILE_BACKUPS, encoding="utf-8")
+            _file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        except OSError as e:
+            logger.error(f"Cannot open log file {path}: {e}")
+    if _listener is not None:
+        _listener.handlers = tuple(h for h in (_console, _file_handler) if h is not None)
+
+
+def configure(settings, base_dir=None):
+    """Apply config.json "logging" (missing keys fall back to the defaults)"""
+    global _levels
+    settings = settings or {}
+    logging.getLogger().setLevel(_level(settings.get("level"), logging.INFO))
+
+    levels = {}
+    for name, value in (settings.get("levels") or {}).items():
+        levels[name] = _level(value, logging.NOTSET)
+    for name in _levels.keys() - levels.keys():
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    _levels = levels
+
+    limits = settings.get("rateLimit") or {}
+    try:
+        rate_limit.seconds = float(limits.get("seconds", DEFAULT_RATE_SECONDS))
+        rate_limit.burst = int(limits.get("burst", DEFAULT_BURST))
+        sampler.every = max(1, int(settings.get("sampleEvery") or 1))
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring invalid logging settings: {settings!r}")
+
+    path = settings.get("file")
+    if path and base_dir and not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    _set_file(path)
+    return status()
+
+
+def status():
+    return {
+        "level": logging.getLevelName(logging.getLogger().level),
+        "levels": {name: logging.getLevelName(level) for name, level in _levels.items()},
+        "file": _file_handler.baseFilename if _file_handler is not None else None,
+        "rateLimit": {"seconds": rate_limit.seconds, "burst": rate_limit.burst},
+        "sampleEvery": sampler.every,
+        "suppressed": rate_limit.suppressed,
+        "queued": _queue.qsize(),
+    }
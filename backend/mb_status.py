@@ -0,0 +1,215 @@
+"""
+MB Status
+Live health of every measurement board (MB), kept in memory from the
+decoded measurement lines so status requests never touch the database.
+
+Per schema column (mb_id, field), as NumPy arrays updated once per sample:
+- last_time / last_value: when the field last had a value, and that value
+- nan_streak: consecutive samples without a value
+- count: samples with a value
+- rate: received values per second, an exponentially decayed count
+  (time constant RATE_WINDOW_SECONDS)
+
+An MB is online while any of its fields had a value within `offline_after`
+seconds (OFFLINE_DELAY_FACTOR measurement delays, at least
+MIN_OFFLINE_SECONDS). State changes are passed to `on_change` as a list
+of events; a watcher thread also catches boards that time out while no
+lines arrive at all (e.g. the serial link is down).
+"""
+
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOW_SECONDS = 300.0
+OFFLINE_DELAY_FACTOR = 3.0
+MIN_OFFLINE_SECONDS = 30.0
+DEFAULT_CHECK_SECONDS = 5.0
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch).isoformat() if math.isfinite(epoch) else None
+
+
+class MBStatusIndex:
+    def __init__(self, on_change=None, check_seconds=DEFAULT_CHECK_SECONDS):
+        """
+        - on_change: called with [{mb_id, online, last_seen}, ...] when boards
+          come online or go offline (outside the lock, from the calling thread)
+        - check_seconds: how often the watcher looks for timed out boards
+        """
+        self.on_change = on_change
+        self.check_seconds = check_seconds
+        self.offline_after = MIN_OFFLINE_SECONDS
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.updated = None  # Time of the latest sample (the rates are decayed to it)
+        self.set_columns([])
+
+    def set_columns(self, columns):
+        """Switch to a new schema, keeping the state of columns and boards that remain"""
+        columns = list(columns)
+        mb_ids = list(dict.fromkeys(mb_id for mb_id, _ in columns))
+        with self.lock:
+            old = getattr(self, "column_index", {})
+            old_mbs = getattr(self, "mb_index", {})
+            size, boards = len(columns), len(mb_ids)
+            last_time = np.full(size, np.nan)
+            last_value = np.full(size, np.nan)
+            nan_streak = np.zeros(size, dtype=np.int64)
+            count = np.zeros(size, dtype=np.int64)
+            rate = np.zeros(size)
+            mb_last_seen = np.full(boards, np.nan)
+            mb_count = np.zeros(boards, dtype=np.int64)
+            online = np.zeros(boards, dtype=bool)
+            for i, key in enumerate(columns):
+                j = old.get(key)
+                if j is not None:
+                    last_time[i], last_value[i] = self.last_time[j], self.last_value[j]
+                    nan_streak[i], count[i], rate[i] = self.nan_streak[j], self.count[j], self.rate[j]
+            for i, mb_id in enumerate(mb_ids):
+                j = old_mbs.get(mb_id)
+                if j is not None:
+                    mb_last_seen[i], mb_count[i], online[i] = self.mb_last_seen[j], self.mb_count[j], self.online[j]
+
+            self.columns = columns
+            self.column_index = {key: i for i, key in enumerate(columns)}
+            self.mb_ids = mb_ids
+            self.mb_index = {mb_id: i for i, mb_id in enumerate(mb_ids)}
+            self.column_mb = np.array([self.mb_index[mb_id] for mb_id, _ in columns], dtype=np.intp)
+            self.last_time, self.last_value = last_time, last_value
+            self.nan_streak, self.count, self.rate = nan_streak, count, rate
+            self.mb_last_seen, self.mb_count, self.online = mb_last_seen, mb_count, online
+
+    def set_measurement_delay(self, delay_seconds):
+        """Derive the offline timeout from the configured measurement delay"""
+        try:
+            delay = float(delay_seconds) if delay_seconds else 0.0
+        except (TypeError, ValueError):
+            delay = 0.0
+        self.offline_after = max(MIN_OFFLINE_SECONDS, delay * OFFLINE_DELAY_FACTOR)
+
+    def _timeouts_locked(self, now):
+        """Boards online until now whose latest value is older than offline_after"""
+        with np.errstate(invalid="ignore"):
+            return self.online & ~(now - self.mb_last_seen <= self.offline_after)
+
+    def _events_locked(self, changed):
+        return [{
+            "mb_id": self.mb_ids[i],
+            "online": bool(self.online[i]),
+            "last_seen": _iso(self.mb_last_seen[i]),
+        } for i in np.flatnonzero(changed)]
+
+    def update(self, row, now=None):
+        """Fold in one decoded sample (a row in schema column order)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if len(row) != len(self.columns):
+                return
+            finite = np.isfinite(row)
+            if self.updated is not None and now > self.updated:
+                self.rate *= math.exp(-(now - self.updated) / RATE_WINDOW_SECONDS)
+            self.rate += finite / RATE_WINDOW_SECONDS
+            self.updated = now if self.updated is None else max(now, self.updated)
+            self.last_time[finite] = now
+            self.last_value[finite] = row[finite]
+            self.nan_streak = np.where(finite, 0, self.nan_streak + 1)
+            self.count += finite
+
+            present = np.bincount(self.column_mb, weights=finite, minlength=len(self.mb_ids)) > 0
+            self.mb_last_seen[present] = now
+            self.mb_count += present
+            changed = (present & ~self.online) | self._timeouts_locked(now)
+            if not changed.any():
+                return
+            self.online ^= changed
+            events = self._events_locked(changed)
+        self._notify(events)
+
+    def check(self, now=None):
+        """Mark boards offline that timed out since the latest sample"""
+        now = time.time() if now is None else now
+        with self.lock:
+            changed = self._timeouts_locked(now)
+            if not changed.any():
+                return
+            self.online &= ~changed
+            events = self._events_locked(changed)
+        self._notify(events)
+
+    def _notify(self, events):
+        for event in events:
+            logger.info(f"MB {event['mb_id']} is {'online' if event['online'] else 'offline'}")
+        if self.on_change is not None:
+            try:
+                self.on_change(events)
+            except Exception as e:
+                logger.error(f"Error publishing MB status: {e}")
+
+    def is_online(self, mb_id):
+        i = self.mb_index.get(mb_id)
+        return i is not None and bool(self.online[i])
+
+    def status(self, mb_id=None, now=None):
+        """
+        Status of every board (or only `mb_id`) with its fields:
+        [{mb_id, online, last_seen, age_s, samples, fields: {field: {...}}}, ...]
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            decay = math.exp(-(now - self.updated) / RATE_WINDOW_SECONDS) if self.updated and now > self.updated else 1.0
+            per_minute = self.rate * decay * 60.0
+            boards = {}
+            for i, board in enumerate(self.mb_ids):
+                if mb_id is not None and board != mb_id:
+                    continue
+                seen = self.mb_last_seen[i]
+                boards[board] = {
+                    "mb_id": board,
+                    "online": bool(self.online[i]),
+                    "last_seen": _iso(seen),
+                    "age_s": round(now - seen, 3) if math.isfinite(seen) else None,
+                    "samples": int(self.mb_count[i]),
+                    "fields": {},
+                }
+            for i, (board, field_name) in enumerate(self.columns):
+                if board not in boards:
+                    continue
+                seen, value = self.last_time[i], self.last_value[i]
+                boards[board]["fields"][field_name] = {
+                    "last_seen": _iso(seen),
+                    "value": float(value) if math.isfinite(value) else None,
+                    "nan_streak": int(self.nan_streak[i]),
+                    "samples": int(self.count[i]),
+                    "rate_per_min": round(float(per_minute[i]), 3),
+                }
+            return list(boards.values())
+
+    def start(self):
+        """Start the watcher that marks silent boards offline"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="mb-status-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.check_seconds + 1)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.check_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking MB status: {e}")
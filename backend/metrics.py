@@ -0,0 +1,241 @@
+"""
+Metrics
+Counters, gauges and histograms for the ingest pipeline, rendered in the
+Prometheus text exposition format (version 0.0.4) by GET /metrics.
+
+Hot-path updates take no lock: a counter or histogram bucket is a plain
+Python number incremented under the GIL. Each series has one writer
+thread in practice (the serial reader, or the event loop); a rare lost
+increment from a concurrent writer is acceptable for monitoring.
+Gauges that describe current state (queue depths, client counts) are
+callbacks evaluated only when /metrics is scraped.
+
+    LINES = Counter("pv_lines_total", "Measurement lines processed", ("source",))
+    LINES.labels("serial").inc()
+    with STAGE_SECONDS.labels("parse").time(): ...
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: 50 µs .. 5 s (pipeline stages, SQLite commits, event-loop lag)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_metrics = []
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """The child series for these label values (cache it on hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket (not cumulative); the last is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        counts = list(child.counts)
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    A gauge read when scraped: `callback()` returns a number, or with
+    labelnames a dict {label value or tuple of values: number}.
+    Without a callback, set() stores the value.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.callback() if self.callback else self.value
+        except Exception as e:
+            logger.error(f"Error reading metric {self.name}: {e}")
+            return lines
+        if self.labelnames:
+            for key, v in value.items():
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_format_value(v)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+def render():
+    """All registered metrics in the text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Pipeline metrics (see server.py for where they are updated; the broadcast stage in streaming.publish)
+LINES = Counter("pv_lines_total", "Measurement lines processed", ("source",))
+LINE_ERRORS = Counter("pv_line_errors_total", "Measurement lines that failed to parse")
+STAGE_SECONDS = Histogram("pv_stage_seconds", "Time per measurement line in each pipeline stage", ("stage",))
+DB_COMMIT_SECONDS = Histogram("pv_db_commit_seconds", "SQLite commit time of a measurement write")
+DB_BATCH_ROWS = Histogram("pv_db_batch_rows", "Rows written per measurement transaction", buckets=SIZE_BUCKETS)
+ALERT_TRANSITIONS = Counter("pv_alert_transitions_total", "Alert lifecycle events published", ("event",))
+LOOP_LAG_SECONDS = Histogram("pv_event_loop_lag_seconds", "Delay of the event loop in running a scheduled callback")
+LOOP_STALLS = Counter("pv_event_loop_stalls_total", "Event-loop stalls caught by the loop watchdog")
+
+# Children used on the hot path (created up front so they are exported from the start)
+SERIAL_LINES = LINES.labels("serial")
+SIMULATED_LINES = LINES.labels("simulate")
+PARSE_SECONDS = STAGE_SECONDS.labels("parse")
+CALCULATE_SECONDS = STAGE_SECONDS.labels("calculate")
+PERSIST_SECONDS = STAGE_SECONDS.labels("persist")
+DIAGNOSE_SECONDS = STAGE_SECONDS.labels("diagnose")
+BROADCAST_SECONDS = STAGE_SECONDS.labels("broadcast")
+DB_COMMIT = DB_COMMIT_SECONDS.labels()
+DB_BATCH = DB_BATCH_ROWS.labels()
+LINE_ERRORS.labels()
+LOOP_STALLS.labels()
+
+
+async def monitor_loop_lag(interval=0.5):
+    """Measure how late the event loop wakes up from a sleep (run as a task)"""
+    loop = asyncio.get_running_loop()
+    lag = LOOP_LAG_SECONDS.labels()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, loop.time() - start - interval))
@@ -0,0 +1,218 @@
+"""
+Vectorized Power and Energy Calculator
+Compiles the point assignments (config.json) and the measurement schema
+(stm_config.json) into index arrays once per configuration change, then
+computes power and energy for all points in a single NumPy pass per sample.
+"""
+
+import math
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Point categories (compiled once from sensor_categories / point ids)
+CATEGORY_OTHER = 0
+CATEGORY_SOLAR = 1
+CATEGORY_INVERTER = 2
+CATEGORY_BATTERY = 3
+
+# System-level calculation keys included in packed samples
+SUMMARY_KEYS = [
+    "total_pv_power",
+    "consumption_power",
+    "battery_power",
+    "battery_soc",
+    "battery_voltage",
+    "daily_energy",
+    "monthly_energy",
+    "total_energy",
+]
+
+# Intervals longer than this are treated as gaps and not integrated
+DEFAULT_MAX_GAP_SECONDS = 60.0
+GAP_DELAY_FACTOR = 3
+
+
+def parse_value(raw):
+    """Convert a raw CSV value to float, mapping NaN and non-numeric values to nan"""
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class PowerCalculator:
+    def __init__(self, max_gap_seconds=DEFAULT_MAX_GAP_SECONDS):
+        self.max_gap_seconds = max_gap_seconds
+        self.version = 0  # Incremented on every compile (sample layout version)
+        self.columns = []  # List of (mb_id, field_name) in schema order
+        self.column_index = {}  # Key: (mb_id, field_name), Value: column index
+        self.point_ids = []
+        self.energy = np.zeros(0)  # Cumulative energy per point (kWh)
+        self.last_power = np.zeros(0)
+        self.last_valid = np.zeros(0, dtype=bool)
+        self.last_time = None
+        self._voltage_idx = np.zeros(0, dtype=np.intp)
+        self._current_idx = np.zeros(0, dtype=np.intp)
+        self._categories = np.zeros(0, dtype=np.int8)
+        self._member_cols = np.zeros(0, dtype=np.intp)  # Columns of the assigned MBs, point by point
+        self._member_points = np.zeros(0, dtype=np.intp)  # ...and the point each belongs to
+        self._solar = np.zeros(0, dtype=bool)
+        self._battery_points = []
+
+    def compile(self, measurement_schema: List[Dict], assignments: Dict[str, List[str]],
+                sensor_categories: Dict[str, str]):
+        """Build per-point voltage/current column indices and categories"""
+        previous_energy = self.energy_totals
+
+        self.columns = []
+        for mb_config in measurement_schema:
+            for field_name in mb_config["fields"]:
+                self.columns.append((mb_config["mb_id"], field_name))
+        self.column_index = {col: idx for idx, col in enumerate(self.columns)}
+        mb_columns = {}
+        for idx, (mb_id, field_name) in enumerate(self.columns):
+            mb_columns.setdefault(mb_id, []).append((idx, field_name))
+
+        # Missing voltage/current columns point at a trailing zero sentinel
+        sentinel = len(self.columns)
+        self.point_ids = list(assignments.keys())
+        voltage_idx = []
+        current_idx = []
+        categories = []
+        member_cols = []
+        member_points = []
+
+        for p, point_id in enumerate(self.point_ids):
+            v_col = sentinel
+            i_col = sentinel
+            for mb_id in assignments[point_id]:
+                for idx, field_name in mb_columns.get(mb_id, []):
+                    member_cols.append(idx)
+                    member_points.append(p)
+                    if field_name.startswith("V") and "Batt" not in field_name:
+                        v_col = idx
+                    elif field_name.startswith("I") or field_name.startswith("A"):
+                        i_col = idx
+            voltage_idx.append(v_col)
+            current_idx.append(i_col)
+
+            category = sensor_categories.get(point_id, "other")
+            if "str" in point_id or category == "solar":
+                categories.append(CATEGORY_SOLAR)
+            elif category == "inverter":
+                categories.append(CATEGORY_INVERTER)
+            elif category == "battery":
+                categories.append(CATEGORY_BATTERY)
+            else:
+                categories.append(CATEGORY_OTHER)
+
+        self._voltage_idx = np.array(voltage_idx, dtype=np.intp)
+        self._current_idx = np.array(current_idx, dtype=np.intp)
+        self._categories = np.array(categories, dtype=np.int8)
+        self._member_cols = np.array(member_cols, dtype=np.intp)
+        self._member_points = np.array(member_points, dtype=np.intp)
+        self._solar = self._categories == CATEGORY_SOLAR
+        self._battery_points = [p for p, c in enumerate(categories) if c == CATEGORY_BATTERY]
+
+        self.energy = np.array([previous_energy.get(pid, 0.0) for pid in self.point_ids])
+        self.last_power = np.zeros(len(self.point_ids))
+        self.last_valid = np.zeros(len(self.point_ids), dtype=bool)
+        self.version += 1
+
+        logger.info(f"Compiled power calculator: {len(self.point_ids)} points over {len(self.columns)} columns")
+
+    @property
+    def energy_totals(self) -> Dict[str, float]:
+        """Cumulative energy per point (kWh)"""
+        return dict(zip(self.point_ids, self.energy.tolist()))
+
+    def set_energy_totals(self, totals: Dict[str, float]):
+        self.energy = np.array([totals.get(pid, 0.0) for pid in self.point_ids])
+
+    def set_measurement_delay(self, delay_seconds):
+        """Derive the gap cap from the configured measurement delay"""
+        if delay_seconds:
+            self.max_gap_seconds = float(delay_seconds) * GAP_DELAY_FACTOR
+        else:
+            self.max_gap_seconds = DEFAULT_MAX_GAP_SECONDS
+
+    def row_from_data(self, data) -> np.ndarray:
+        """Flatten structured {mb_id: {field: value}} data into a sample row"""
+        row = np.full(len(self.columns), np.nan)
+        for (mb_id, field_name), idx in self.column_index.items():
+            fields = data.get(mb_id)
+            if fields is not None and field_name in fields:
+                row[idx] = parse_value(fields[field_name])
+        return row
+
+    def compute(self, row: np.ndarray, now):
+        """
+        Compute power for all points and integrate energy (trapezoidal rule).
+        Returns (per-point arrays dict, energy increments per point in kWh).
+        """
+        finite = np.isfinite(row)
+        padded = np.append(np.where(finite, row, 0.0), 0.0)
+
+        voltage = padded[self._voltage_idx]
+        current = padded[self._current_idx]
+        power = voltage * current
+        # A point is valid if any column of its MBs has a value (cost: member columns, not points x columns)
+        valid = np.bincount(self._member_points, weights=finite[self._member_cols],
+                            minlength=len(self.point_ids)) > 0
+
+        # Trapezoidal integration, skipping intervals longer than the gap cap
+        increments = np.zeros(len(self.point_ids))
+        if self.last_time is not None:
+            dt_seconds = (now - self.last_time).total_seconds()
+            if 0 < dt_seconds <= self.max_gap_seconds:
+                both_valid = valid & self.last_valid & self._solar
+                increments = np.where(
+                    both_valid,
+                    (self.last_power + power) / 2.0 / 1000.0 * (dt_seconds / 3600.0),
+                    0.0
+                )
+                np.maximum(increments, 0.0, out=increments)
+                self.energy += increments
+        self.last_time = now
+        self.last_power = power
+        self.last_valid = valid
+
+        return {
+            "voltage": voltage,
+            "current": current,
+            "power": power,
+            "valid": valid,
+        }, increments
+
+    def sample_columns(self) -> List[str]:
+        """Names of the values in a packed sample, in order"""
+        return ([f"{mb_id}_{field_name}" for mb_id, field_name in self.columns]
+                + SUMMARY_KEYS
+                + [f"{point_id}_power" for point_id in self.point_ids])
+
+    def pack_sample(self, row: np.ndarray, calculations: Dict) -> np.ndarray:
+        """Pack raw values, summary calculations and per-point power into one float32 vector"""
+        summary = [calculations.get(key, np.nan) for key in SUMMARY_KEYS]
+        point_power = np.where(self.last_valid, self.last_power, np.nan)
+        return np.concatenate([row, np.array(summary, dtype=np.float64), point_power]).astype(np.float32)
+
+    def totals(self, result) -> Dict[str, float]:
+        """Sum power per category"""
+        power = np.where(result["valid"], result["power"], 0.0)
+        return {
+            "total_pv_power": float(power[self._solar].sum()),
+            "consumption_power": float(power[self._categories == CATEGORY_INVERTER].sum()),
+            "battery_power": float(power[self._categories == CATEGORY_BATTERY].sum()),
+        }
+
+    def battery_points(self, result) -> List[int]:
+        """Indices of battery points with valid data"""
+        valid = result["valid"]
+        return [p for p in self._battery_points if valid[p]]
+
+    def is_solar(self, p) -> bool:
+        return bool(self._solar[p])
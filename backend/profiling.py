@@ -0,0 +1,329 @@
+"""
+Profiling
+Runtime diagnostics for a running (possibly frozen) executable, toggled
+through the /api/debug endpoints without a restart.
+
+- LoopWatchdog (opt-in): a heartbeat task on the event loop and a watcher
+  thread. When the heartbeat is late by more than `threshold` seconds the
+  loop is blocked right now, so the watcher captures the loop thread's
+  stack (the coroutine that blocks it) and logs it once per stall.
+- ProfileSession: a cProfile window over the event loop thread and every
+  thread that calls checkpoint() (the serial reader, and the threads that
+  decode simulated lines), merged into one pstats report.
+- Tracemalloc snapshots: top allocations by line, compared with the
+  previous snapshot, and attributed to the modules owning the caches;
+  deep_sizeof() measures them directly without tracing.
+"""
+
+import asyncio
+import cProfile
+import inspect
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from collections.abc import Mapping
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAG_THRESHOLD_SECONDS = 0.25
+MAX_STALLS = 20
+MAX_PROFILE_SECONDS = 120.0
+
+
+def _coroutine_names(frame):
+    """Coroutines on a thread's stack, outermost first"""
+    names = []
+    while frame is not None:
+        if frame.f_code.co_flags & inspect.CO_COROUTINE:
+            names.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return names[::-1]
+
+
+class LoopWatchdog:
+    def __init__(self, threshold=DEFAULT_LAG_THRESHOLD_SECONDS, on_stall=None):
+        """
+        - threshold: heartbeat delay (seconds) reported as a stall
+        - on_stall: called with each captured stall (e.g. to count it)
+        """
+        self.threshold = threshold
+        self.on_stall = on_stall
+        self.stalls = deque(maxlen=MAX_STALLS)
+        self.enabled = False
+        self.max_lag = 0.0
+        self._beat = None  # Monotonic time of the latest heartbeat
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._current = None  # Stall in progress
+
+    @property
+    def interval(self):
+        return max(0.01, self.threshold / 4)
+
+    def configure(self, settings, loop=None):
+        """Apply config.json "loopWatchdog": {"enabled": true, "thresholdMs": 250}"""
+        settings = settings or {}
+        threshold = settings.get("thresholdMs")
+        if threshold:
+            self.threshold = max(0.02, float(threshold) / 1000.0)
+        if settings.get("enabled"):
+            self.start(loop)
+        else:
+            self.stop()
+
+    def start(self, loop=None):
+        """Start watching the given loop (default: the running loop)"""
+        if self.enabled:
+            return
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                logger.warning("Loop watchdog needs the event loop; not started")
+                return
+        self.enabled = True
+        self._stop.clear()
+        self._beat = time.monotonic()
+        loop.call_soon_threadsafe(self._start_heartbeat)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        if self._task is not None:
+            self._task.get_loop().call_soon_threadsafe(self._task.cancel)
+            self._task = None
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        logger.info("Loop watchdog stopped")
+
+    def _start_heartbeat(self):
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while self.enabled:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            lag = time.monotonic() - self._beat - self.interval
+            if lag > self.threshold:
+                if self._current is None:
+                    self._capture(lag)
+                else:
+                    self._current["lag_s"] = round(lag, 3)
+            elif self._current is not None:
+                stall, self._current = self._current, None
+                self.max_lag = max(self.max_lag, stall["lag_s"])
+                logger.warning(f"Event loop was blocked for {stall['lag_s'] * 1000:.0f} ms "
+                               f"in {stall['coroutine'] or 'unknown code'}")
+
+    def _capture(self, lag):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        coroutines = _coroutine_names(frame)
+        stack = traceback.format_stack(frame)
+        stall = {
+            "detected_at": datetime.now().isoformat(),
+            "lag_s": round(lag, 3),
+            "coroutine": coroutines[-1] if coroutines else None,
+            "coroutines": coroutines,
+            "stack": [line.rstrip() for line in stack],
+        }
+        self._current = stall
+        self.stalls.append(stall)
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms (still blocked) in "
+                       f"{stall['coroutine'] or 'unknown code'}:\n{''.join(stack[-8:])}")
+        if self.on_stall is not None:
+            self.on_stall(stall)
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": round(self.threshold * 1000),
+            "blocked_now": self._current is not None,
+            "max_lag_ms": round(self.max_lag * 1000),
+            "stalls": list(self.stalls)[::-1],
+        }
+
+
+class ProfileSession:
+    """A cProfile window; threads other than the caller join via checkpoint()"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.started_at = datetime.now().isoformat()
+        self.finished = False
+        self.profiles = {}  # Thread id -> [thread name, profile, still enabled]
+
+    def attach(self):
+        """Profile the calling thread until the window ends"""
+        ident = threading.get_ident()
+        with self.lock:
+            if self.finished or ident in self.profiles:
+                return
+            profile = cProfile.Profile()
+            self.profiles[ident] = [threading.current_thread().name, profile, True]
+        profile.enable()
+
+    def detach(self):
+        """Stop profiling the calling thread"""
+        with self.lock:
+            entry = self.profiles.get(threading.get_ident())
+            if entry is None or not entry[2]:
+                return
+            entry[2] = False
+        entry[1].disable()
+
+    def report(self, sort="cumulative", limit=40):
+        """pstats text of the threads that detached, merged"""
+        with self.lock:
+            done = [(name, profile) for name, profile, enabled in self.profiles.values() if not enabled]
+        if not done:
+            return {"threads": [], "stats": ""}
+        out = io.StringIO()
+        stats = pstats.Stats(done[0][1], stream=out)
+        for _, profile in done[1:]:
+            stats.add(profile)
+        stats.sort_stats(sort).print_stats(limit)
+        return {"threads": [name for name, _ in done], "stats": out.getvalue()}
+
+
+# The session in progress, and the session each thread is attached to
+session = None
+_local = threading.local()
+
+
+def checkpoint():
+    """
+    Hook for worker-thread loops (e.g. once per serial line): joins the
+    running profile window, or leaves it once it is over.
+    """
+    attached = getattr(_local, "session", None)
+    if attached is not None and attached.finished:
+        attached.detach()
+        _local.session = attached = None
+    current = session
+    if current is not None and attached is None and not current.finished:
+        current.attach()
+        _local.session = current
+
+
+async def profile_window(seconds, sort="cumulative", limit=40):
+    """Profile the event loop thread and checkpointing threads for `seconds`"""
+    global session
+    if session is not None:
+        raise RuntimeError("A profile is already running")
+    seconds = min(max(float(seconds), 0.1), MAX_PROFILE_SECONDS)
+    session = current = ProfileSession(seconds)
+    try:
+        current.attach()
+        await asyncio.sleep(seconds)
+        current.detach()
+    finally:
+        current.finished = True
+        # Let the other threads leave the window at their next checkpoint
+        for _ in range(20):
+            with current.lock:
+                if not any(enabled for _, _, enabled in current.profiles.values()):
+                    break
+            await asyncio.sleep(0.05)
+        session = None
+    result = current.report(sort, limit)
+    return {"started_at": current.started_at, "seconds": seconds, **result}
+
+
+_previous_snapshot = None  # Baseline of the "growth" in the next report
+
+
+def set_tracemalloc(enabled, frames=1):
+    global _previous_snapshot
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, int(frames)))
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        _previous_snapshot = None
+    return tracemalloc.is_tracing()
+
+
+def tracemalloc_report(limit=25, owners=None):
+    """
+    Top allocations by line, the growth since the previous report, and the
+    total per owner module (owners: {name: module file name}).
+    """
+    global _previous_snapshot
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+
+    def entry(stat):
+        frame = stat.traceback[0]
+        return {"location": f"{frame.filename}:{frame.lineno}", "bytes": stat.size, "count": stat.count}
+
+    result = {
+        "tracing": True,
+        "traced_bytes": tracemalloc.get_traced_memory()[0],
+        "peak_bytes": tracemalloc.get_traced_memory()[1],
+        "top": [entry(stat) for stat in snapshot.statistics("lineno")[:limit]],
+    }
+    if _previous_snapshot is not None:
+        result["growth"] = [dict(entry(stat), bytes_diff=stat.size_diff, count_diff=stat.count_diff)
+                            for stat in snapshot.compare_to(_previous_snapshot, "lineno")[:limit]]
+    if owners:
+        by_file = {}
+        for stat in snapshot.statistics("filename"):
+            name = os.path.basename(stat.traceback[0].filename)
+            by_file[name] = by_file.get(name, 0) + stat.size
+        result["owners"] = {owner: by_file.get(filename, 0) for owner, filename in owners.items()}
+    _previous_snapshot = snapshot
+    return result
+
+
+def deep_sizeof(obj, limit=200000):
+    """Approximate memory of an object graph (stops after `limit` objects)"""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack and len(seen) < limit:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        # Includes the data of arrays that own it (views count only their header)
+        total += sys.getsizeof(item)
+        if isinstance(item, np.ndarray):
+            continue
+        if isinstance(item, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(item, Mapping):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
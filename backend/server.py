@@ -7,16 +7,28 @@ import threading
 import time
 import logging
 import sqlite3
+import re
+import math
+import multiprocessing
 from datetime import datetime, timedelta
 from typing import List, Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File
+import numpy as np
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import queue
 
-# Setup Logging
-logging.basicConfig(level=logging.INFO)
+if __name__ == "__main__":
+    # Frozen builds: let diagnosis worker processes start before any server setup
+    multiprocessing.freeze_support()
+
+# Setup Logging (records are written by a listener thread; levels from config.json "logging")
+import log_config
+log_config.setup()
 logger = logging.getLogger(__name__)
+serial_logger = logging.getLogger(log_config.SERIAL_LOGGER) # Serial port I/O and command handshakes
+ingest_logger = logging.getLogger(log_config.INGEST_LOGGER) # Per-measurement output (sampled at DEBUG)
 
 app = FastAPI()
 
@@ -29,9 +41,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-import random
 from pydantic import BaseModel
-from diagnosis import DiagnosisEngine, Alert
+from diagnosis import DiagnosisEngine
+from diagnosis_rules import RuleError, parse_rules
+from alert_store import AlertStore
+from config_store import ConfigStore
+from config_history import ConfigHistory
+from mb_status import MBStatusIndex
+from data_quality import DataQualityCollector
+import metrics
+import profiling
+from diagnosis_worker import DiagnosisWorker
+from diagnosis_backtest import run_backtest
+from power_calc import PowerCalculator
+from live_history import LiveHistoryBuffer, parse_timestamp
+from streaming import ConnectionManager, MeasurementMessage, Subscription, SubscriptionError, parse_seq
 from fastapi.responses import FileResponse
 
 import sys
@@ -44,9 +68,7 @@ app = FastAPI()
 
 # ... (CORS setup)
 
-import random
 from pydantic import BaseModel
-from diagnosis import DiagnosisEngine, Alert
 
 # Determine if running as a script or frozen exe
 if getattr(sys, 'frozen', False):
@@ -59,31 +81,20 @@ else:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     BUNDLE_DIR = BASE_DIR
 
+# Optional override of where the config files and the database live (benchmarks, test rigs)
+BASE_DIR = os.environ.get("PV_DASHBOARD_DATA_DIR") or BASE_DIR
+
 CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
 HISTORY_FILE = os.path.join(BASE_DIR, "config_history.json")
 MB_LIST_FILE = os.path.join(BASE_DIR, "mb_list.json")
 STM_CONFIG_FILE = os.path.join(BASE_DIR, "stm_config.json")
 DB_FILE = os.path.join(BASE_DIR, "pv_history.db")
 
-# Global Connection Manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting: {e}")
+# Parsed once, swapped on save or when the file changes on disk (see config_store.py)
+config_store = ConfigStore(CONFIG_FILE)
+mb_list_store = ConfigStore(MB_LIST_FILE, default={"mb_list": []})
 
+# Global Connection Manager
 manager = ConnectionManager()
 
 # Database Helper Functions
@@ -125,7 +136,35 @@ def init_database():
     
     # Create index for calculations table
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_calc_timestamp ON calculations(timestamp)')
-    
+
+    # Create energy ledger table (one row per PV point and day, updated incrementally)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS energy_ledger (
+            point_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            array_id TEXT,
+            energy_kwh REAL NOT NULL DEFAULT 0,
+            samples INTEGER NOT NULL DEFAULT 0,
+            first_seen DATETIME,
+            last_seen DATETIME,
+            PRIMARY KEY (point_id, day)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_day ON energy_ledger(day)')
+
+    # Create config history table (append-only: full snapshots and JSON Patch deltas, see config_history.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            kind TEXT NOT NULL,
+            data TEXT NOT NULL,
+            changes INTEGER,
+            keys TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_config_history_timestamp ON config_history(timestamp)')
+
     # Create alerts table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS alerts (
@@ -167,6 +206,37 @@ def init_database():
         )
     ''')
     
+    # Migration: Add rules column (user-defined diagnosis rules, JSON list)
+    try:
+        cursor.execute('ALTER TABLE diagnosis_settings ADD COLUMN rules TEXT')
+    except sqlite3.OperationalError:
+        # Column likely already exists
+        pass
+    
+    # Create data_quality table (per-MB counters, rolled up per hour and per day; see data_quality.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_quality (
+            period TEXT NOT NULL,
+            start TEXT NOT NULL,
+            mb_id TEXT NOT NULL,
+            lines REAL DEFAULT 0,
+            present REAL DEFAULT 0,
+            expected REAL DEFAULT 0,
+            fields REAL DEFAULT 0,
+            nan_count REAL DEFAULT 0,
+            out_of_range REAL DEFAULT 0,
+            rssi_sum REAL DEFAULT 0,
+            rssi_n REAL DEFAULT 0,
+            rssi_min REAL,
+            rssi_max REAL,
+            batt_sum REAL DEFAULT 0,
+            batt_n REAL DEFAULT 0,
+            batt_min REAL,
+            batt_max REAL,
+            PRIMARY KEY (period, start, mb_id)
+        )
+    ''')
+    
     # Insert default diagnosis settings if not exists
     cursor.execute('INSERT OR IGNORE INTO diagnosis_settings (id, enabled) VALUES (1, 0)')
     
@@ -174,13 +244,14 @@ def init_database():
     conn.close()
     logger.info("Database initialized successfully")
 
-def save_measurement_to_db(timestamp, mb_data, calculations):
-    """Save a measurement to the database"""
+def save_measurement_to_db(timestamp, mb_data, calculations, ledger_entries=None):
+    """Save a measurement (and its energy ledger increments) to the database"""
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
         
         # Save raw MB data
+        rows = 1
         for mb_id, fields in mb_data.items():
             for field_name, value in fields.items():
                 if isinstance(value, (int, float)):
@@ -188,6 +259,7 @@ def save_measurement_to_db(timestamp, mb_data, calculations):
                         'INSERT INTO measurements (timestamp, mb_id, field_name, value) VALUES (?, ?, ?, ?)',
                         (timestamp, mb_id, field_name, value)
                     )
+                    rows += 1
         
         # Save calculations
         cursor.execute('''
@@ -206,11 +278,111 @@ def save_measurement_to_db(timestamp, mb_data, calculations):
             calculations.get('monthly_energy'),
             calculations.get('total_energy')
         ))
+
+        # Update energy ledger in the same transaction
+        if ledger_entries:
+            update_energy_ledger(cursor, ledger_entries)
+            rows += len(ledger_entries)
         
+        committing = time.perf_counter()
         conn.commit()
+        metrics.DB_COMMIT.observe(time.perf_counter() - committing)
+        metrics.DB_BATCH.observe(rows)
+        conn.close()
+    except Exception as e:
+        logger.error("Error saving to database: %s", e)
+
+def update_energy_ledger(cursor, ledger_entries):
+    """Add energy increments to the ledger.
+
+    ledger_entries: list of (point_id, day, array_id, energy_kwh, timestamp)
+    """
+    cursor.executemany('''
+        INSERT INTO energy_ledger (point_id, day, array_id, energy_kwh, samples, first_seen, last_seen)
+        VALUES (?, ?, ?, ?, 1, ?, ?)
+        ON CONFLICT(point_id, day) DO UPDATE SET
+            energy_kwh = energy_kwh + excluded.energy_kwh,
+            samples = samples + 1,
+            array_id = COALESCE(excluded.array_id, array_id),
+            last_seen = excluded.last_seen
+    ''', [
+        (point_id, day, array_id, energy_kwh, timestamp, timestamp)
+        for point_id, day, array_id, energy_kwh, timestamp in ledger_entries
+    ])
+
+def get_ledger_totals(day):
+    """Get per-point energy totals from the ledger for restoring counters after a restart.
+
+    Returns (daily_totals, monthly_totals, lifetime_totals), each a dict keyed by point_id.
+    """
+    daily, monthly, lifetime = {}, {}, {}
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT point_id,
+                   SUM(CASE WHEN day = ? THEN energy_kwh ELSE 0 END),
+                   SUM(CASE WHEN substr(day, 1, 7) = ? THEN energy_kwh ELSE 0 END),
+                   SUM(energy_kwh)
+            FROM energy_ledger
+            GROUP BY point_id
+        ''', (day, day[:7]))
+        for point_id, day_kwh, month_kwh, total_kwh in cursor.fetchall():
+            daily[point_id] = day_kwh or 0.0
+            monthly[point_id] = month_kwh or 0.0
+            lifetime[point_id] = total_kwh or 0.0
         conn.close()
     except Exception as e:
-        logger.error(f"Error saving to database: {e}")
+        logger.error(f"Error loading energy ledger totals: {e}")
+    return daily, monthly, lifetime
+
+def _next_period_key(period, key):
+    """Key of the day, month or year after `key` (YYYY-MM-DD, YYYY-MM or YYYY)"""
+    if period == 'day':
+        return (datetime.strptime(key, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    if period == 'month':
+        year, month = map(int, key.split('-'))
+        return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+    return f"{int(key) + 1:04d}"
+
+def get_energy_report(period, start, end, group='string'):
+    """Aggregate the energy ledger into daily, monthly or yearly yield per string or per array.
+
+    Parameters:
+    - period: 'day', 'month' or 'year'
+    - start, end: inclusive bounds in the period's format (YYYY-MM-DD, YYYY-MM or YYYY)
+    - group: 'string' (per point_id) or 'array' (per array_id)
+    """
+    key_length = {'day': 10, 'month': 7, 'year': 4}[period]
+    group_column = 'array_id' if group == 'array' else 'point_id'
+    # Compare whole day keys against [start, start of the period after end) so idx_ledger_day is used
+    end_exclusive = _next_period_key(period, end)
+
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT substr(day, 1, {key_length}) AS bucket,
+               COALESCE({group_column}, 'unassigned'),
+               SUM(energy_kwh)
+        FROM energy_ledger
+        WHERE day >= ? AND day < ?
+        GROUP BY bucket, 2
+        ORDER BY bucket
+    ''', (start, end_exclusive))
+    rows = cursor.fetchall()
+    conn.close()
+
+    results_map = {}
+    for bucket, group_id, energy in rows:
+        if bucket not in results_map:
+            results_map[bucket] = {'period': bucket, 'total_energy': 0.0, 'breakdown': {}}
+        results_map[bucket]['breakdown'][group_id] = round(energy or 0, 3)
+        results_map[bucket]['total_energy'] += energy or 0
+
+    for entry in results_map.values():
+        entry['total_energy'] = round(entry['total_energy'], 3)
+
+    return list(results_map.values())
 
 def get_historical_data(start_date, end_date, granularity='hour'):
     """Retrieve historical data from database with aggregation"""
@@ -287,6 +459,21 @@ def get_historical_data(start_date, end_date, granularity='hour'):
             
             results_map[time_bucket][f'INVD_{field}'] = round(val, 2) if val else 0
 
+        # 3. Energy per day or month from the ledger (exact yield instead of MAX(daily_energy),
+        #    matching /api/energy/report)
+        if granularity in ('day', 'month'):
+            key_length = 10 if granularity == 'day' else 7
+            cursor.execute(f'''
+                SELECT substr(day, 1, {key_length}) AS bucket, SUM(energy_kwh)
+                FROM energy_ledger
+                WHERE day >= substr(?, 1, 10) AND day < substr(?, 1, 10)
+                GROUP BY bucket
+            ''', (start_date, end_date))
+            for bucket, energy in cursor.fetchall():
+                if bucket not in results_map:
+                    results_map[bucket] = {'timestamp': bucket}
+                results_map[bucket]['daily_energy'] = round(energy, 2) if energy else 0
+
         conn.close()
         
         # Convert map to list and sort
@@ -301,35 +488,17 @@ def get_historical_data(start_date, end_date, granularity='hour'):
 # Initialize database on startup
 init_database()
 
+# Config history (imports a legacy config_history.json once)
+config_history = ConfigHistory(DB_FILE)
+try:
+    config_history.migrate_json(HISTORY_FILE)
+except Exception as e:
+    logger.error(f"Failed to migrate config history: {e}")
+
+# Per-MB data-quality counters, rolled up per hour and per day
+data_quality = DataQualityCollector(DB_FILE)
+
 # Alert Management Functions
-def save_alert_to_db(alert: Alert):
-    """Save an alert to the database"""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO alerts 
-            (timestamp, severity, category, title, message, component, value, threshold)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            alert.timestamp,
-            alert.severity,
-            alert.category,
-            alert.title,
-            alert.message,
-            alert.component,
-            alert.value,
-            alert.threshold
-        ))
-        
-        alert_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return alert_id
-    except Exception as e:
-        logger.error(f"Error saving alert: {e}")
-        return None
 
 def get_alerts_from_db(limit=50, severity=None, unread_only=False):
     """Retrieve alerts from database"""
@@ -378,66 +547,13 @@ def get_alerts_from_db(limit=50, severity=None, unread_only=False):
         logger.error(f"Error retrieving alerts: {e}")
         return []
 
-def auto_resolve_alerts(alert_signature):
-    """Auto-resolve alerts when the issue is fixed"""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Mark as resolved if not already
-        cursor.execute('''
-            UPDATE alerts 
-            SET resolved = 1, resolved_at = ? 
-            WHERE resolved = 0 
-            AND (title || '_' || COALESCE(component, '')) = ?
-        ''', (datetime.now().isoformat(), alert_signature))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        logger.error(f"Error auto-resolving alerts: {e}")
-
-def acknowledge_alert_in_db(alert_id):
-    """Acknowledge an alert"""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE alerts 
-            SET acknowledged = 1, acknowledged_at = ? 
-            WHERE id = ?
-        ''', (datetime.now().isoformat(), alert_id))
-        
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        logger.error(f"Error acknowledging alert: {e}")
-        return False
-
-def get_unread_alert_count():
-    """Get count of unread alerts"""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM alerts WHERE acknowledged = 0 AND resolved = 0')
-        count = cursor.fetchone()[0]
-        
-        conn.close()
-        return count
-    except Exception as e:
-        logger.error(f"Error getting unread count: {e}")
-        return 0
-
 def get_diagnosis_settings():
     """Get diagnosis settings from database"""
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
         
-        cursor.execute('SELECT enabled, thresholds, notifications_enabled FROM diagnosis_settings WHERE id = 1')
+        cursor.execute('SELECT enabled, thresholds, notifications_enabled, rules FROM diagnosis_settings WHERE id = 1')
         row = cursor.fetchone()
         
         conn.close()
@@ -446,15 +562,16 @@ def get_diagnosis_settings():
             return {
                 'enabled': bool(row[0]),
                 'thresholds': json.loads(row[1]) if row[1] else None,
-                'notifications_enabled': bool(row[2]) if len(row) > 2 else True
+                'notifications_enabled': bool(row[2]) if len(row) > 2 else True,
+                'rules': json.loads(row[3]) if row[3] else []
             }
-        return {'enabled': False, 'thresholds': None, 'notifications_enabled': True}
+        return {'enabled': False, 'thresholds': None, 'notifications_enabled': True, 'rules': []}
     except Exception as e:
         logger.error(f"Error getting diagnosis settings: {e}")
-        return {'enabled': False, 'thresholds': None}
+        return {'enabled': False, 'thresholds': None, 'rules': []}
 
-def save_diagnosis_settings(enabled, thresholds=None, notifications_enabled=True):
-    """Save diagnosis settings to database"""
+def save_diagnosis_settings(enabled, thresholds=None, notifications_enabled=True, rules=None):
+    """Save diagnosis settings to database (rules are left unchanged when None)"""
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
@@ -466,6 +583,8 @@ def save_diagnosis_settings(enabled, thresholds=None, notifications_enabled=True
             SET enabled = ?, thresholds = ?, notifications_enabled = ?
             WHERE id = 1
         ''', (enabled, thresholds_json, notifications_enabled))
+        if rules is not None:
+            cursor.execute('UPDATE diagnosis_settings SET rules = ? WHERE id = 1', (json.dumps(rules),))
         
         conn.commit()
         conn.close()
@@ -480,6 +599,27 @@ settings = get_diagnosis_settings()
 diagnosis_engine.enabled = settings['enabled']
 if settings['thresholds']:
     diagnosis_engine.thresholds = settings['thresholds']
+try:
+    diagnosis_engine.set_rules(settings.get('rules'))
+except RuleError as e:
+    logger.error(f"Ignoring stored diagnosis rules: {e}")
+
+# Alert lifecycle: active/unread state in memory, transitions written per sample in one transaction
+def publish_alerts(message):
+    for event in message.get("events", []):
+        metrics.ALERT_TRANSITIONS.labels(event.get("event")).inc()
+    manager.broadcast_threadsafe(message)
+
+alert_store = AlertStore(DB_FILE, diagnosis_engine.get_alert_signature, publish=publish_alerts)
+
+# Optional out-of-process diagnosis (config.json "diagnosisWorker")
+diagnosis_worker = DiagnosisWorker(diagnosis_engine, alert_store.apply, alert_store.active_signatures)
+
+# Opt-in event-loop stall detector (config.json "loopWatchdog", or /api/debug/watchdog)
+loop_watchdog = profiling.LoopWatchdog(on_stall=lambda stall: metrics.LOOP_STALLS.inc())
+
+# Live per-MB health from the decoded lines; state changes are pushed as "mb_status" messages
+mb_status = MBStatusIndex(on_change=lambda events: manager.broadcast_threadsafe({"type": "mb_status", "events": events}))
 
 # Serial Manager
 class SerialManager:
@@ -488,6 +628,7 @@ class SerialManager:
         self.running = False
         self.thread: Optional[threading.Thread] = None
         self.port = None
+        self.port_override = os.environ.get("PV_DASHBOARD_SERIAL_PORT") # Fixed port instead of auto-detection (virtual MASTER, test rigs)
         self.baudrate = 9600
         self.loop = None # Reference to main event loop
         self.serial_lock = threading.Lock() # Lock for thread safety
@@ -495,8 +636,7 @@ class SerialManager:
         self.measurement_schema = [] # Schema for parsing CSV data
         self.assignments = {}
         self.sensor_categories = {}
-        self.energy_totals = {}
-        self.last_calculation_time = None
+        self.calculator = PowerCalculator() # Compiled from schema and assignments
         
         # Energy tracking for today, month, and total
         self.daily_energy = 0.0  # kWh generated today
@@ -504,16 +644,23 @@ class SerialManager:
         self.total_energy = 0.0  # kWh generated all time
         self.current_day = datetime.now().day
         self.current_month = datetime.now().month
-        self.daily_history = [] # In-memory buffer for current day measurements
+        self.daily_history = LiveHistoryBuffer() # Ring buffer for current day measurements
+        self.history_fields = [] # Ring buffer series names for the raw schema columns
+        self.history_calc_keys = [] # ...followed by the scalar calculations
+        self.point_arrays = {} # Key: point_id, Value: array id (e.g. "arr-1")
+        self.ledger_entries = [] # Energy ledger increments from the last calculation
 
     def find_stm32_port(self):
         """Auto-detect STM32 port, prioritizing COM7"""
+        if self.port_override:
+            return self.port_override
+
         ports = list(serial.tools.list_ports.comports())
         
         # Priority 1: Check for COM7 explicitly
         for p in ports:
             if p.device.upper() == "COM7":
-                logger.info("Found COM7, using it.")
+                serial_logger.info("Found COM7, using it.")
                 return "COM7"
                 
         # Priority 2: Check for description
@@ -536,33 +683,34 @@ class SerialManager:
         try:
             self.ser = serial.Serial(port, self.baudrate, timeout=1)
             self.port = port
-            logger.info(f"Connected to STM32 on {port}")
+            serial_logger.info(f"Connected to STM32 on {port}")
             self.start_reading()
             
             # Broadcast Status
             if self.loop:
                 msg = {"type": "stm32_status", "status": "connected", "port": port}
-                asyncio.run_coroutine_threadsafe(manager.broadcast(msg), self.loop)
+                manager.broadcast_threadsafe(msg)
                 
             return True
         except Exception as e:
-            logger.error(f"Failed to connect to serial: {e}")
+            serial_logger.error(f"Failed to connect to serial: {e}")
             # Broadcast Failure
             if self.loop:
                 msg = {"type": "stm32_status", "status": "disconnected"}
-                asyncio.run_coroutine_threadsafe(manager.broadcast(msg), self.loop)
+                manager.broadcast_threadsafe(msg)
             return False
 
     def start_reading(self):
         if self.running:
             return
         self.running = True
-        self.loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
         self.thread = threading.Thread(target=self._read_loop, daemon=True)
         self.thread.start()
 
     def _read_loop(self):
-        logger.info("Starting Serial Read Loop")
+        serial_logger.info("Starting Serial Read Loop")
     def load_measurement_schema(self):
         """Load measurement schema from stm_config.json"""
         config_path = STM_CONFIG_FILE
@@ -594,28 +742,68 @@ class SerialManager:
         except Exception as e:
             logger.error(f"Failed to load measurement schema: {e}")
             self.measurement_schema = []
+        self.compile_calculator()
 
     def load_assignments(self):
-        """Load assignments from config.json"""
-        config_path = CONFIG_FILE
-        if os.path.exists(config_path):
+        """Load assignments from the config.json snapshot"""
+        snapshot = config_store.current()
+        if snapshot.stat is not None:
             try:
-                with open(config_path, "r", encoding="utf-8") as f:
-                    config = json.load(f)
-                    self.assignments = config.get("assignments", {})
-                    
-                    # Load sensor categories
-                    self.sensor_categories = {}
-                    for sensor in config.get("sensors", []):
-                        if "id" in sensor and "category" in sensor:
-                            self.sensor_categories[sensor["id"]] = sensor["category"]
-                            
-                    logger.info(f"Loaded assignments: {self.assignments}")
-                    logger.info(f"Loaded categories: {self.sensor_categories}")
+                config = snapshot.data
+                self.assignments = config.get("assignments", {})
+                self.calculator.set_measurement_delay(config.get("measurementDelay"))
+                mb_status.set_measurement_delay(config.get("measurementDelay"))
+                self.daily_history.set_sample_interval(config.get("measurementDelay"))
+                data_quality.configure(config)
+                loop_watchdog.configure(config.get("loopWatchdog"), self.loop)
+                log_config.configure(config.get("logging"), BASE_DIR)
+                diagnosis_worker.configure(config.get("diagnosisWorker"))
+                
+                # Load sensor categories
+                self.sensor_categories = {}
+                sensor_arrays = {}
+                for sensor in config.get("sensors", []):
+                    if "id" in sensor and "category" in sensor:
+                        self.sensor_categories[sensor["id"]] = sensor["category"]
+                    if "id" in sensor and sensor.get("arrayId") is not None:
+                        sensor_arrays[sensor["id"]] = f"arr-{sensor['arrayId']}"
+
+                # Map each point to its PV array (for per-array energy reports)
+                self.point_arrays = {}
+                for point_id in self.assignments:
+                    match = re.match(r"(arr-\d+)-str-", point_id)
+                    if match:
+                        self.point_arrays[point_id] = match.group(1)
+                    elif point_id in sensor_arrays:
+                        self.point_arrays[point_id] = sensor_arrays[point_id]
+                        
+                logger.info(f"Loaded assignments: {self.assignments}")
+                logger.info(f"Loaded categories: {self.sensor_categories}")
             except Exception as e:
                 logger.error(f"Failed to load assignments: {e}")
                 self.assignments = {}
                 self.sensor_categories = {}
+        self.compile_calculator()
+
+    def compile_calculator(self):
+        """Recompile the power calculator after a schema or assignment change"""
+        self.calculator.compile(self.measurement_schema, self.assignments, self.sensor_categories)
+        self.history_fields = [f"{mb_id}_{field_name}" for mb_id, field_name in self.calculator.columns]
+        self.daily_history.set_schema(self.history_fields + self.history_calc_keys)
+        manager.set_schema(self.calculator.version, self.calculator.sample_columns())
+        diagnosis_engine.set_columns(self.calculator.columns)
+        mb_status.set_columns(self.calculator.columns)
+        data_quality.set_columns(self.calculator.columns)
+
+    def load_energy_totals(self):
+        """Restore daily, monthly and total energy counters from the energy ledger"""
+        daily, monthly, lifetime = get_ledger_totals(datetime.now().date().isoformat())
+        self.calculator.set_energy_totals(lifetime)
+        self.daily_energy = sum(daily.values())
+        self.monthly_energy = sum(monthly.values())
+        self.total_energy = sum(lifetime.values())
+        logger.info(f"Restored energy totals: daily={self.daily_energy:.3f} kWh, "
+                    f"monthly={self.monthly_energy:.3f} kWh, total={self.total_energy:.3f} kWh")
 
     def estimate_soc(self, voltage):
         """Estimate SoC based on voltage (assuming 48V system for now, can be adjusted)"""
@@ -637,102 +825,47 @@ class SerialManager:
         if voltage > 54: return 100
         return (voltage - 42) / (54 - 42) * 100
 
-    def calculate_power_energy(self, data):
-        """Calculate Power and Energy based on assignments"""
+    def calculate_power_energy(self, data, row=None):
+        """Calculate Power and Energy based on assignments
+
+        row: sample values in schema column order (built from data if not given)
+        """
         calculations = {}
         
         # Current time for energy calculation
         now = datetime.now()
-        time_diff_hours = 0
-        if self.last_calculation_time:
-            time_diff_hours = (now - self.last_calculation_time).total_seconds() / 3600.0
-        self.last_calculation_time = now
         
         # Check if day or month has changed (reset counters)
         if now.day != self.current_day:
             logger.info(f"Day changed. Daily energy was: {self.daily_energy:.3f} kWh")
             self.daily_energy = 0.0
             self.current_day = now.day
-            self.daily_history = [] # Clear history for new day
+            self.daily_history.clear() # Clear history for new day
         
         if now.month != self.current_month:
             logger.info(f"Month changed. Monthly energy was: {self.monthly_energy:.3f} kWh")
             self.monthly_energy = 0.0
             self.current_month = now.month
 
+        self.ledger_entries = []
         if not self.assignments:
             return {}
 
-        total_pv_power = 0
-        consumption_power = 0
-        battery_power = 0
-        battery_soc = 0
-        battery_voltage = 0
-        
-        # Track energy increment for this calculation cycle
-        pv_energy_increment = 0.0
-        
-        for point_id, mb_ids in self.assignments.items():
-            # e.g. point_id="arr-1-str-1", mb_ids=["VD1", "ID1"]
-            
-            voltage = 0
-            current = 0
-            has_valid_data = False
-            
-            for mb_id in mb_ids:
-                if mb_id in data:
-                    mb_data = data[mb_id]
-                    # Find voltage field (starts with V, not Batt)
-                    for k, v in mb_data.items():
-                        # Skip NaN values
-                        if v == "NaN" or v == "nan" or (isinstance(v, str) and v.upper() == "NAN"):
-                            continue
-                            
-                        if isinstance(v, (int, float)):
-                            has_valid_data = True
-                            if k.startswith("V") and "Batt" not in k:
-                                voltage = v
-                            elif k.startswith("I") or k.startswith("A"):
-                                current = v
-            
-            # Only calculate power if we have valid data (not NaN)
-            if has_valid_data:
-                # Calculate Power (W)
-                power = voltage * current
-                calculations[point_id] = {
-                    "voltage": voltage,
-                    "current": current,
-                    "power": power
-                }
-                
-                category = self.sensor_categories.get(point_id, "other")
-                
-                # Accumulate Energy (kWh) if it's a PV string
-                if "str" in point_id or category == "solar":
-                    total_pv_power += power
-                    # Initialize energy if not exists
-                    if point_id not in self.energy_totals:
-                        self.energy_totals[point_id] = 0.0
-                    
-                    # Add energy (kW * h)
-                    energy_increment = (power / 1000.0) * time_diff_hours
-                    if energy_increment > 0:
-                        self.energy_totals[point_id] += energy_increment
-                        pv_energy_increment += energy_increment
-                    calculations[point_id]["energy"] = self.energy_totals[point_id]
-                
-                elif category == "inverter":
-                    # Assuming Inverter category represents Consumption/Grid for now based on user request
-                    # "Consumption power represent the AC voltage and current"
-                    consumption_power += power
-                
-                elif category == "battery":
-                    battery_power += power
-                    battery_voltage = voltage
-                    # Estimate SoC
-                    battery_soc = self.estimate_soc(voltage)
-                    calculations[point_id]["soc"] = battery_soc
-            else:
+        calculator = self.calculator
+        if row is None:
+            row = calculator.row_from_data(data)
+        result, increments = calculator.compute(row, now)
+
+        voltages = result["voltage"].tolist()
+        currents = result["current"].tolist()
+        powers = result["power"].tolist()
+        valid = result["valid"].tolist()
+        energies = calculator.energy.tolist()
+        ledger_day = now.date().isoformat()
+        ledger_timestamp = now.isoformat()
+
+        for p, point_id in enumerate(calculator.point_ids):
+            if not valid[p]:
                 # Mark as no data available
                 calculations[point_id] = {
                     "voltage": None,
@@ -740,16 +873,39 @@ class SerialManager:
                     "power": None,
                     "status": "disconnected"
                 }
+                continue
+
+            calculations[point_id] = {
+                "voltage": voltages[p],
+                "current": currents[p],
+                "power": powers[p]
+            }
+            if calculator.is_solar(p):
+                calculations[point_id]["energy"] = energies[p]
+                self.ledger_entries.append((
+                    point_id,
+                    ledger_day,
+                    self.point_arrays.get(point_id),
+                    float(increments[p]),
+                    ledger_timestamp
+                ))
+
+        # Battery voltage and SoC come from the last battery point with data
+        battery_soc = 0
+        battery_voltage = 0
+        for p in calculator.battery_points(result):
+            battery_voltage = voltages[p]
+            battery_soc = self.estimate_soc(battery_voltage)
+            calculations[calculator.point_ids[p]]["soc"] = battery_soc
         
         # Update daily, monthly, and total energy
+        pv_energy_increment = float(increments.sum())
         if pv_energy_increment > 0:
             self.daily_energy += pv_energy_increment
             self.monthly_energy += pv_energy_increment
             self.total_energy += pv_energy_increment
 
-        calculations["total_pv_power"] = total_pv_power
-        calculations["consumption_power"] = consumption_power
-        calculations["battery_power"] = battery_power
+        calculations.update(calculator.totals(result))
         calculations["battery_soc"] = battery_soc
         calculations["battery_voltage"] = battery_voltage
         
@@ -760,12 +916,25 @@ class SerialManager:
         
         return calculations
 
+    def record_history(self, timestamp, row, calcs):
+        """Append raw values and scalar calculations to today's ring buffer"""
+        calc_keys = [key for key, value in calcs.items() if isinstance(value, (int, float))]
+        if calc_keys != self.history_calc_keys:
+            self.history_calc_keys = calc_keys
+            self.daily_history.set_schema(self.history_fields + calc_keys)
+        values = np.empty(len(row) + len(calc_keys))
+        values[:len(row)] = row
+        values[len(row):] = [calcs[key] for key in calc_keys]
+        self.daily_history.append(timestamp, values)
+
     def process_measurement_line(self, line: str):
         """Process a raw CSV line and return the structured message."""
         if "," not in line:
             return None
             
+        profiling.checkpoint()
         try:
+            started = time.perf_counter()
             parts = [p.strip() for p in line.split(",")]
             
             # Check if first part is timestamp
@@ -788,6 +957,7 @@ class SerialManager:
             if self.measurement_schema:
                 # Use schema to structure data
                 data = {}
+                row = []
                 value_idx = 0
                 
                 for mb_config in self.measurement_schema:
@@ -802,67 +972,69 @@ class SerialManager:
                                 val = values[value_idx].strip()
                                 if val.upper() == "NAN":
                                     mb_data[field_name] = "NaN"
+                                    row.append(math.nan)
                                 else:
                                     mb_data[field_name] = float(val)
+                                    row.append(mb_data[field_name])
                             except ValueError:
                                 mb_data[field_name] = values[value_idx]
+                                row.append(math.nan)
                             value_idx += 1
+                        else:
+                            row.append(math.nan)
                     
                     data[mb_id] = mb_data
                 
                 # Calculate Power & Energy
-                calcs = self.calculate_power_energy(data)
+                row = np.array(row)
+                parsed = time.perf_counter()
+                metrics.PARSE_SECONDS.observe(parsed - started)
+                mb_status.update(row)
+                data_quality.update(row)
+                calcs = self.calculate_power_energy(data, row)
                 
-                msg = {
-                    "type": "measurement",
-                    "timestamp": timestamp,
-                    "data": data,
-                    "calculations": calcs
-                }
-                self.daily_history.append(msg)
+                msg = MeasurementMessage(
+                    {
+                        "type": "measurement",
+                        "timestamp": timestamp,
+                        "data": data,
+                        "calculations": calcs
+                    },
+                    sample=self.calculator.pack_sample(row, calcs),
+                    timestamp_s=parse_timestamp(timestamp)
+                )
+                self.record_history(timestamp, row, calcs)
+                calculated = time.perf_counter()
+                metrics.CALCULATE_SECONDS.observe(calculated - parsed)
                 
                 # Save to database
-                save_measurement_to_db(timestamp, data, calcs)
+                save_measurement_to_db(timestamp, data, calcs, self.ledger_entries)
+                metrics.PERSIST_SECONDS.observe(time.perf_counter() - calculated)
                 
                 # Run diagnosis if enabled
                 if diagnosis_engine.enabled:
-                    # Load config for diagnosis engine
+                    diagnosing = time.perf_counter()
+                    # Load config for diagnosis engine (from the in-memory snapshot)
                     if not diagnosis_engine.config:
-                        config_path = os.path.join(os.path.dirname(__file__), "config.json")
-                        if os.path.exists(config_path):
-                            with open(config_path, 'r') as f:
-                                config_data = json.load(f)
-                                diagnosis_engine.set_config(config_data)
-                                # Also set sensor categories
-                                diagnosis_engine.set_sensor_categories(config_data)
-                    
-                    # Extract INVD data
-                    invd_data = data.get('INVD', {})
+                        config_data = config_store.current().data
+                        if config_data:
+                            diagnosis_engine.set_config(config_data)
+                            # Also set sensor categories
+                            diagnosis_engine.set_sensor_categories(config_data)
                     
-                    # Analyze and generate alerts
-                    new_alerts = diagnosis_engine.analyze_measurement(data, calcs, invd_data)
-                    
-                    # Save new alerts and check for auto-resolve
-                    for alert in new_alerts:
-                        alert_sig = diagnosis_engine.get_alert_signature(alert)
+                    if diagnosis_worker.running:
+                        # Analyzed in the worker process; transitions come back to alert_store
+                        diagnosis_worker.submit(msg.timestamp_s, row, calcs)
+                    else:
+                        # Extract INVD data
+                        invd_data = data.get('INVD', {})
                         
-                        # Check if this type of alert already exists and is unresolved
-                        if alert_sig not in diagnosis_engine.active_alerts:
-                            # New alert - save it
-                            alert_id = save_alert_to_db(alert)
-                            if alert_id:
-                                diagnosis_engine.active_alerts[alert_sig] = alert_id
-                                logger.info(f"New alert generated: {alert.title}")
-                    
-                    # Auto-resolve: Check if previously active alerts should be resolved
-                    # (i.e., the condition that triggered them no longer exists)
-                    current_alert_sigs = {diagnosis_engine.get_alert_signature(a) for a in new_alerts}
-                    for sig in list(diagnosis_engine.active_alerts.keys()):
-                        if sig not in current_alert_sigs:
-                            # This alert type is no longer being triggered - auto-resolve it
-                            auto_resolve_alerts(sig)
-                            del diagnosis_engine.active_alerts[sig]
-                            logger.info(f"Auto-resolved alert: {sig}")
+                        # Analyze and generate alerts (debounced: only alerts that are active)
+                        new_alerts = diagnosis_engine.analyze_measurement(data, calcs, invd_data, row, msg.timestamp_s)
+                        
+                        # Create new alerts and auto-resolve cleared ones (one transaction)
+                        alert_store.update(new_alerts)
+                    metrics.DIAGNOSE_SECONDS.observe(time.perf_counter() - diagnosing)
                 
                 return msg
             else:
@@ -880,12 +1052,14 @@ class SerialManager:
                     "values": float_values
                 }
         except Exception as e:
-            logger.error(f"Error processing measurement line: {e}")
+            metrics.LINE_ERRORS.inc()
+            ingest_logger.error("Error processing measurement line: %s", e)
             return None
 
     def _read_loop(self):
-        logger.info("Starting Serial Read Loop")
+        serial_logger.info("Starting Serial Read Loop")
         while self.running and self.ser and self.ser.is_open:
+            profiling.checkpoint()
             try:
                 with self.serial_lock:
                     if self.ser.in_waiting:
@@ -896,32 +1070,29 @@ class SerialManager:
                 if line:
                     # Ignore echo lines but NOT status lines (needed for command confirmation)
                     if line.startswith("CONFIG:") or line.startswith("CMD:") or line.startswith("WAITING"):
-                        logger.info(f"STM32 Echo: {line}")
+                        serial_logger.debug("STM32 Echo: %s", line)
                         continue
                     
                     # Queue STATUS: lines for command confirmation
                     if line.startswith("STATUS:"):
-                        logger.info(f"Queueing status: {line}")
+                        serial_logger.info("Queueing status: %s", line)
                         self.status_queue.put(line)
                         continue
                         
                     # Process measurement line
+                    metrics.SERIAL_LINES.inc()
                     msg = self.process_measurement_line(line)
                     if msg:
-                        logger.info(f"Broadcasting structured data: {msg}")
-                        # Note: asyncio.run() can only be called from a non-async function if there's no running event loop.
-                        # If this method is called from a thread, and the main thread has an event loop,
-                        # asyncio.run_coroutine_threadsafe is usually preferred.
-                        # For simplicity and following the instruction, using asyncio.run here.
-                        # If this causes issues, consider re-introducing asyncio.run_coroutine_threadsafe.
-                        asyncio.run(manager.broadcast(msg))
+                        ingest_logger.debug("Broadcasting structured data: %s", msg)
+                        # Hand off to the event loop; per-client sender tasks do the sending
+                        manager.broadcast_threadsafe(msg)
             except Exception as e:
-                logger.error(f"Serial read error: {e}")
+                serial_logger.error("Serial read error: %s", e)
                 time.sleep(1)
             
             # Yield lock to allow sending threads to run
             time.sleep(0.01)
-        logger.info("Serial Read Loop Stopped")
+        serial_logger.info("Serial Read Loop Stopped")
 
     def send_raw(self, text: str):
         """Send raw string to STM32"""
@@ -930,13 +1101,13 @@ class SerialManager:
                 if not text.endswith("\n"):
                     text += "\n"
                 self.ser.write(text.encode('utf-8'))
-                logger.info(f"Sent to STM32: {text.strip()}")
+                serial_logger.debug("Sent to STM32: %s", text.strip())
                 return True
             except Exception as e:
-                logger.error(f"Failed to send serial data: {e}")
+                serial_logger.error("Failed to send serial data: %s", e)
                 return False
         else:
-            logger.warning("Serial not connected. Cannot send data.")
+            serial_logger.warning("Serial not connected. Cannot send data.")
             return False
 
     def send_with_echo(self, text: str, timeout=2.0):
@@ -951,17 +1122,13 @@ class SerialManager:
             return False, "Not connected"
             
         try:
-            logger.info(f"Attempting to send command: {command.strip()} (waiting for {expected_response})")
             with self.serial_lock:
-                logger.info("Serial lock acquired")
                 if not command.endswith("\n"):
                     command += "\n"
                     
                 self.ser.reset_input_buffer()
-                logger.info("Input buffer reset")
-                
                 self.ser.write(command.encode('utf-8'))
-                logger.info(f"Sent Command (Sync): {command.strip()}")
+                serial_logger.debug("Sent command %s (waiting for %s)", command.strip(), expected_response)
                 
                 # Give STM32 time to process (increased to 0.5s to match send_with_echo)
                 time.sleep(0.5)
@@ -971,9 +1138,9 @@ class SerialManager:
                     # Check queue first (messages from read loop)
                     try:
                         resp = self.status_queue.get(timeout=0.05)
-                        logger.info(f"Response from queue: {resp}")
+                        serial_logger.debug("Response from queue: %s", resp)
                         if expected_response in resp:
-                            logger.info("Expected response matched!")
+                            serial_logger.info("%s confirmed (%s)", command.strip(), resp)
                             return True, "Confirmed"
                     except queue.Empty:
                         pass
@@ -982,15 +1149,15 @@ class SerialManager:
                     if self.ser.in_waiting:
                         resp = self.ser.readline().decode(errors='ignore').strip()
                         if resp:
-                            logger.info(f"Response from serial: {resp}")
+                            serial_logger.debug("Response from serial: %s", resp)
                             if expected_response in resp:
-                                logger.info("Expected response matched!")
+                                serial_logger.info("%s confirmed (%s)", command.strip(), resp)
                                 return True, "Confirmed"
             
-            logger.warning("Timeout waiting for confirmation")
+            serial_logger.warning("Timeout waiting for %s after %s", expected_response, command.strip())
             return False, "Timeout waiting for confirmation"
         except Exception as e:
-            logger.error(f"Command failed: {e}")
+            serial_logger.error("Command %s failed: %s", command.strip(), e)
             return False, str(e)
 
     def send_config_lines(self, config_data: dict):
@@ -1030,7 +1197,7 @@ class SerialManager:
             self.send_raw("CONFIG:END")
             return True
         except Exception as e:
-            logger.error(f"Error sending config lines: {e}")
+            serial_logger.error(f"Error sending config lines: {e}")
             return False
             
     def start_mock_mode(self):
@@ -1039,14 +1206,28 @@ class SerialManager:
 
 serial_manager = SerialManager()
 
+def apply_config(snapshot):
+    """Push a new config.json snapshot to the serial manager and the diagnosis engine"""
+    serial_manager.load_assignments()
+    if diagnosis_engine.config:
+        # Categories follow the config; thresholds stay as tuned (see set_config)
+        diagnosis_engine.config = snapshot.data
+        diagnosis_engine.set_sensor_categories(snapshot.data)
+
+config_store.subscribe(apply_config)
+
 # Helper Functions
 def save_config_to_file(config_data: dict):
-    try:
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config_data, f, indent=2)
-        return True, "Config saved successfully"
-    except Exception as e:
-        return False, str(e)
+    return config_store.save(config_data)
+
+def snapshot_response(request: Request, snapshot, body: bytes = None):
+    """JSON response carrying the snapshot's ETag (304 when the client already has it)"""
+    headers = {"ETag": snapshot.etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or
+                          snapshot.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body if body is None else body, media_type="application/json", headers=headers)
 
     return {}
 
@@ -1061,8 +1242,10 @@ class SimulationRequest(BaseModel):
 async def simulate_measurement(request: SimulationRequest):
     """Inject a simulated measurement line."""
     try:
-        logger.info(f"Simulating data: {request.line}")
-        msg = serial_manager.process_measurement_line(request.line)
+        ingest_logger.debug("Simulating data: %s", request.line)
+        metrics.SIMULATED_LINES.inc()
+        # Parsing, DB writes and diagnosis run off the event loop
+        msg = await asyncio.to_thread(serial_manager.process_measurement_line, request.line)
         if msg:
             await manager.broadcast(msg)
             return {"status": "success", "message": "Data injected"}
@@ -1073,31 +1256,42 @@ async def simulate_measurement(request: SimulationRequest):
 
 @app.get("/api/mb_list")
 def get_mb_list():
-    if os.path.exists(MB_LIST_FILE):
-        try:
-            with open(MB_LIST_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                mb_list = data.get("mb_list", [])
-                # Simulate online status check
-                for mb in mb_list:
-                    # Randomly assign True/False for simulation
-                    mb["online"] = random.choice([True, False])
-                return mb_list
-        except Exception as e:
-            logger.error(f"Failed to read mb_list: {e}")
-            return []
-    return []
+    # Copies: the snapshot is shared
+    mb_list = [dict(mb) for mb in mb_list_store.current().get("mb_list", [])]
+    # Online: the MB sent a value within its timeout (see mb_status)
+    for mb in mb_list:
+        mb["online"] = mb_status.is_online(mb.get("id"))
+    return mb_list
+
+@app.get("/api/mb_status")
+def get_mb_status(mb_id: Optional[str] = None):
+    """Last-seen status of every MB in the measurement schema and its fields (from memory)"""
+    return {
+        "offline_after_s": mb_status.offline_after,
+        "boards": mb_status.status(mb_id),
+    }
+
+@app.get("/api/data_quality")
+def get_data_quality(period: str = "day", since: Optional[str] = None, until: Optional[str] = None,
+                     mb_id: Optional[str] = None):
+    """Per-MB NaN, out-of-range and missing-sample rates and RSSI/BattS trends per hour or day"""
+    try:
+        return data_quality.report(period, since, until, mb_id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        logger.error(f"Error reading data quality: {e}")
+        return {"status": "error", "message": str(e)}
 
 @app.post("/api/mb_selection")
 def save_mb_selection(selection: MBSelection):
-    if not os.path.exists(MB_LIST_FILE):
+    mb_snapshot = mb_list_store.current()
+    if mb_snapshot.stat is None:
         return {"status": "error", "message": "MB List file not found"}
         
     try:
         # Read Master List
-        with open(MB_LIST_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            master_list = data.get("mb_list", [])
+        master_list = mb_snapshot.get("mb_list", [])
             
         # Filter selected MBs and generate CSV lines
         csv_lines = []
@@ -1123,19 +1317,13 @@ def save_mb_selection(selection: MBSelection):
         csv_lines.append("CONFIG:END")
         
         # Update config.json with selected MBs and Delay
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    config_data = json.load(f)
-                
-                config_data["mbInventory"] = selected_mbs_full
-                config_data["measurementDelay"] = selection.delay
-                
-                with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                    json.dump(config_data, f, indent=2)
+        if config_store.current().stat is not None:
+            success, msg = config_store.update({"mbInventory": selected_mbs_full,
+                                                "measurementDelay": selection.delay})
+            if success:
                 logger.info("Updated config.json with new MB selection and delay")
-            except Exception as e:
-                logger.error(f"Failed to update config.json: {e}")
+            else:
+                logger.error(f"Failed to update config.json: {msg}")
                 
         # Save to stm_config.json (as text/csv content)
         with open(STM_CONFIG_FILE, "w", encoding="utf-8") as f:
@@ -1184,102 +1372,219 @@ def get_stm_config():
     return ""
 
 @app.get("/api/config")
-def get_config():
-    config_path = CONFIG_FILE
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to read config: {e}")
-            return {}
-    return {}
+def get_config(request: Request):
+    return snapshot_response(request, config_store.current())
 
 @app.get("/api/measurement_state")
-def get_measurement_state():
+def get_measurement_state(request: Request):
     """Get the current measurement state from config.json"""
-    config_path = os.path.join(os.path.dirname(__file__), "config.json")
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                config_data = json.load(f)
-                return {"isMeasuring": config_data.get("isMeasuring", False)}
-        except Exception as e:
-            logger.error(f"Failed to read measurement state: {e}")
-    return {"isMeasuring": False}
+    snapshot = config_store.current()
+    body = json.dumps({"isMeasuring": snapshot.get("isMeasuring", False)}).encode("utf-8")
+    return snapshot_response(request, snapshot, body)
 
 @app.post("/api/measurement_state")
 def set_measurement_state(state: dict):
     """Save measurement state to config.json"""
-    config_path = os.path.join(os.path.dirname(__file__), "config.json")
-    try:
-        # Read existing config
-        config_data = {}
-        if os.path.exists(config_path):
-            with open(config_path, "r", encoding="utf-8") as f:
-                config_data = json.load(f)
-        
-        # Update state
-        config_data["isMeasuring"] = state.get("isMeasuring", False)
-        
-        # Write back
-        with open(config_path, "w", encoding="utf-8") as f:
-            json.dump(config_data, f, indent=2)
-        
+    success, msg = config_store.update({"isMeasuring": state.get("isMeasuring", False)})
+    if success:
         return {"status": "success"}
+    logger.error(f"Failed to save measurement state: {msg}")
+    return {"status": "error", "message": msg}
+
+def append_to_history(config_data: dict):
+    return config_history.append(config_data) is not None
+
+@app.get("/api/config/history")
+def get_config_history(limit: int = 20, before: Optional[int] = None,
+                       since: Optional[str] = None, until: Optional[str] = None):
+    """
+    Config saves, newest first, one page at a time
+
+    Parameters:
+    - limit: entries per page (max 200)
+    - before: the 'next_before' of the previous page
+    - since / until: ISO timestamp range
+    """
+    try:
+        return config_history.list(limit, before, since, until)
     except Exception as e:
-        logger.error(f"Failed to save measurement state: {e}")
+        logger.error(f"Error reading config history: {e}")
         return {"status": "error", "message": str(e)}
 
-def append_to_history(config_data: dict):
-    entry = {
-        "timestamp": datetime.now().isoformat(),
-        "config": config_data
-    }
-    history = []
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                content = f.read()
-                if content:
-                    history = json.loads(content)
-                    if not isinstance(history, list): history = []
-        except Exception:
-            pass
-    history.append(entry)
+@app.get("/api/config/history/{entry_id}")
+def get_config_history_entry(entry_id: int):
+    """The full config as saved in a history entry"""
     try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
-        return True
-    except Exception:
-        return False
+        entry = config_history.get(entry_id)
+    except Exception as e:
+        logger.error(f"Error reading config history: {e}")
+        return {"status": "error", "message": str(e)}
+    if entry is None:
+        return {"status": "error", "message": "History entry not found"}
+    return entry
+
+@app.get("/api/config/history/{entry_id}/diff")
+def get_config_history_diff(entry_id: int, against: Optional[int] = None):
+    """JSON Patch from entry `against` (default: the previous save) to entry_id"""
+    try:
+        diff = config_history.diff(entry_id, against)
+    except Exception as e:
+        logger.error(f"Error reading config history: {e}")
+        return {"status": "error", "message": str(e)}
+    if diff is None:
+        return {"status": "error", "message": "History entry not found"}
+    return diff
 
 @app.on_event("startup")
 async def startup_event():
     # Try to connect to serial on startup
     # We need to wait a bit for the loop to be ready if we use it
     await asyncio.sleep(1)
+    serial_manager.loop = asyncio.get_running_loop()
+    manager.loop = serial_manager.loop
     serial_manager.connect()
     # Load schemas on startup
     serial_manager.load_measurement_schema()
     serial_manager.load_assignments()
+    serial_manager.load_energy_totals()
+    alert_store.load()
+    config_store.start()
+    mb_list_store.start()
+    mb_status.start()
+    data_quality.start()
+    # Keep a reference: the loop only holds tasks weakly
+    app.state.loop_lag_task = asyncio.create_task(metrics.monitor_loop_lag())
 
 @app.on_event("shutdown")
 def shutdown_event():
     serial_manager.running = False
+    config_store.stop()
+    mb_list_store.stop()
+    mb_status.stop()
+    data_quality.stop()
+    diagnosis_worker.stop()
+    alert_store.flush()
+
+# State gauges, read when /metrics is scraped
+metrics.Gauge("pv_websocket_clients", "Connected WebSocket clients", callback=lambda: len(manager.clients))
+metrics.Gauge("pv_websocket_client_backlog", "Frames queued for a WebSocket client", ("client",),
+              callback=lambda: {f"{c.websocket.client.host}:{c.websocket.client.port}" if c.websocket.client else str(id(c)):
+                                c.backlog for c in list(manager.clients.values())})
+metrics.Gauge("pv_websocket_dropped_frames", "Frames dropped for slow WebSocket clients (connected clients)",
+              callback=lambda: sum(c.dropped for c in list(manager.clients.values())))
+metrics.Gauge("pv_writer_queue_depth", "Work queued for a background writer", ("writer",),
+              callback=lambda: {"alerts": alert_store.pending(), "diagnosis_worker": len(diagnosis_worker.backlog)})
+metrics.Gauge("pv_mb_online", "Measurement boards currently online",
+              callback=lambda: int(mb_status.online.sum()))
+
+@app.get("/metrics")
+def get_metrics():
+    """Pipeline metrics in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Runtime diagnostics (no restart needed)
+class WatchdogSettings(BaseModel):
+    enabled: bool
+    threshold_ms: Optional[int] = None
+
+class TracemallocSettings(BaseModel):
+    enabled: bool
+    frames: int = 1  # Traceback depth per allocation
+
+class LoggingSettings(BaseModel):
+    level: Optional[str] = None
+    levels: Optional[dict] = None  # Logger name -> level, e.g. {"server.ingest": "DEBUG"}
+    sample_every: Optional[int] = None  # server.ingest DEBUG: one record in N
+
+@app.get("/api/debug/watchdog")
+def get_loop_watchdog():
+    """Watchdog state and the latest event-loop stalls with their stacks"""
+    return loop_watchdog.status()
+
+@app.post("/api/debug/watchdog")
+async def set_loop_watchdog(settings: WatchdogSettings):
+    """Enable or disable the watchdog until the next restart or config change"""
+    loop_watchdog.configure({"enabled": settings.enabled, "thresholdMs": settings.threshold_ms})
+    return loop_watchdog.status()
+
+@app.post("/api/debug/profile")
+async def run_profile(seconds: float = 10.0, sort: str = "cumulative", limit: int = 40):
+    """cProfile the event loop and the threads decoding lines for `seconds`; returns pstats text"""
+    if sort not in ("cumulative", "tottime", "calls", "ncalls", "time"):
+        return {"status": "error", "message": f"Unknown sort key: {sort}"}
+    try:
+        return await profiling.profile_window(seconds, sort, limit)
+    except RuntimeError as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/api/debug/tracemalloc")
+def toggle_tracemalloc(settings: TracemallocSettings):
+    """Start or stop tracing allocations (tracing slows allocations down noticeably)"""
+    return {"tracing": profiling.set_tracemalloc(settings.enabled, settings.frames)}
+
+@app.get("/api/debug/logging")
+def get_logging():
+    """Log levels, rate limit and sampling in effect, and the messages suppressed so far"""
+    return log_config.status()
+
+@app.post("/api/debug/logging")
+def set_logging(settings: LoggingSettings):
+    """Change log levels or sampling until the next restart or config change"""
+    current = dict((config_store.current().data or {}).get("logging") or {})
+    if settings.level is not None:
+        current["level"] = settings.level
+    if settings.levels is not None:
+        current["levels"] = settings.levels
+    if settings.sample_every is not None:
+        current["sampleEvery"] = settings.sample_every
+    return log_config.configure(current, BASE_DIR)
+
+@app.get("/api/debug/memory")
+def get_memory(limit: int = 25):
+    """Size of the in-memory caches, and the top allocations while tracemalloc is on"""
+    history = serial_manager.daily_history
+    clients = list(manager.clients.values())
+    structures = {
+        "daily_history": {"bytes": history.nbytes, "samples": len(history), "series": len(history.names)},
+        "replay_buffer": {"bytes": profiling.deep_sizeof(list(manager.replay.entries)),
+                          "items": len(manager.replay.entries)},
+        "websocket_queues": {"bytes": sum(profiling.deep_sizeof(list(c.queue) + list(c.control)) for c in clients),
+                             "items": sum(c.backlog for c in clients)},
+        "config_snapshots": {"bytes": sum(len(store.current().body) + profiling.deep_sizeof(store.current().data)
+                                          for store in (config_store, mb_list_store))},
+        "config_history_base": {"bytes": profiling.deep_sizeof(config_history._last)},
+        "alert_store": {"bytes": profiling.deep_sizeof([alert_store.active, alert_store.unread]),
+                        "items": len(alert_store.active)},
+        "diagnosis_engine": {"bytes": profiling.deep_sizeof(diagnosis_engine)},
+        "mb_status": {"bytes": profiling.deep_sizeof(mb_status)},
+        "data_quality": {"bytes": profiling.deep_sizeof(data_quality)},
+    }
+    owners = {
+        "daily_history": "live_history.py",
+        "streaming": "streaming.py",
+        "config": "config_store.py",
+        "diagnosis": "diagnosis.py",
+        "alerts": "alert_store.py",
+        "server": "server.py",
+    }
+    return {"structures": structures, "tracemalloc": profiling.tracemalloc_report(limit, owners)}
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, encoding: str = "json", resume_from: Optional[int] = None):
+    # encoding: 'json' (default), or 'binary' / 'msgpack' for schema-positional float32 frames
+    # resume_from: last seq seen before a reconnect; missed messages are replayed
+    await manager.connect(websocket, encoding=encoding)
     print("Client connected")
     
     # Send current STM32 status
     status = "connected" if serial_manager.ser and serial_manager.ser.is_open else "disconnected"
-    await websocket.send_json({
+    await manager.send(websocket, {
         "type": "stm32_status", 
         "status": status,
         "port": serial_manager.port if status == "connected" else None
     })
+    if resume_from is not None:
+        manager.resume(websocket, resume_from)
     
     try:
         while True:
@@ -1288,6 +1593,8 @@ async def websocket_endpoint(websocket: WebSocket):
                 message = json.loads(data)
             except json.JSONDecodeError:
                 continue
+            if not isinstance(message, dict):
+                continue
                 
             # Handle Commands
             cmd = message.get("command")
@@ -1299,7 +1606,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 # Return empty result if not connected, or wait for serial response in real implementation
                 # For now, we return empty list to indicate no data found immediately
-                await websocket.send_json({
+                await manager.send(websocket, {
                     "type": "scan_result",
                     "data": [],
                     "timestamp": datetime.now().isoformat()
@@ -1307,17 +1614,19 @@ async def websocket_endpoint(websocket: WebSocket):
                 
             elif cmd == "start_measurement":
                 print("Starting measurement...")
-                success, msg = serial_manager.send_command_wait_response("CMD:START", "STATUS:RUNNING")
+                # Blocks for up to 3.5 s waiting for the STM32: keep it off the event loop
+                success, msg = await asyncio.to_thread(
+                    serial_manager.send_command_wait_response, "CMD:START", "STATUS:RUNNING")
                 
                 if success:
-                    await websocket.send_json({
+                    await manager.send(websocket, {
                         "type": "command_ack", 
                         "command": "start", 
                         "status": "success",
                         "message": "Measurement started successfully"
                     })
                 else:
-                    await websocket.send_json({
+                    await manager.send(websocket, {
                         "type": "command_ack", 
                         "command": "start", 
                         "status": "error", 
@@ -1326,37 +1635,73 @@ async def websocket_endpoint(websocket: WebSocket):
                 
             elif cmd == "stop_measurement":
                 print("Stopping measurement...")
-                success, msg = serial_manager.send_command_wait_response("CMD:STOP", "STATUS:STOPPED")
+                success, msg = await asyncio.to_thread(
+                    serial_manager.send_command_wait_response, "CMD:STOP", "STATUS:STOPPED")
                 
                 if success:
-                    await websocket.send_json({
+                    await manager.send(websocket, {
                         "type": "command_ack", 
                         "command": "stop", 
                         "status": "success",
                         "message": "Measurement stopped successfully"
                     })
                 else:
-                    await websocket.send_json({
+                    await manager.send(websocket, {
                         "type": "command_ack", 
                         "command": "stop", 
                         "status": "error", 
                         "message": f"Failed to stop: {msg}"
                     })
                 
+            elif cmd == "subscribe":
+                # Pick message types, MBs, fields and calculations (optionally as deltas)
+                try:
+                    subscription = Subscription.from_message(message)
+                    resume_from = message.get("resume_from")
+                    if resume_from is not None:
+                        resume_from = parse_seq(resume_from)
+                except SubscriptionError as e:
+                    await manager.send(websocket, {"type": "error", "command": cmd, "message": str(e)})
+                    continue
+                manager.subscribe(websocket, subscription)
+                await manager.send(websocket, {
+                    "type": "subscribed",
+                    "subscription": subscription.to_dict()
+                })
+                if resume_from is not None:
+                    manager.resume(websocket, resume_from)
+
+            elif cmd == "resume":
+                # Replay messages missed since the given seq (or ask for a resync)
+                try:
+                    resume_from = parse_seq(message.get("resume_from", 0))
+                except SubscriptionError as e:
+                    await manager.send(websocket, {"type": "error", "command": cmd, "message": str(e)})
+                    continue
+                manager.resume(websocket, resume_from)
+
+            elif cmd == "unsubscribe":
+                # Back to the default full stream
+                manager.subscribe(websocket, Subscription())
+                await manager.send(websocket, {
+                    "type": "subscribed",
+                    "subscription": Subscription().to_dict()
+                })
+
             elif cmd == "save_config":
                 # Explicit Config Save
                 print("Received config update")
                 config_data = message.get("data", {})
                 
-                # 1. Save to file
-                success, msg = save_config_to_file(config_data)
+                # 1. Save to file (fsync, and the listeners recompile: off the event loop)
+                success, msg = await asyncio.to_thread(save_config_to_file, config_data)
                 
                 # 2. Save to history
                 if success:
-                    append_to_history(config_data)
+                    await asyncio.to_thread(append_to_history, config_data)
                     
-                    # 3. Send to STM32
-                    serial_manager.send_config_lines(config_data)
+                    # 3. Send to STM32 (paced with sleeps)
+                    await asyncio.to_thread(serial_manager.send_config_lines, config_data)
                     
                     response = {
                         "type": "save_confirm",
@@ -1369,21 +1714,30 @@ async def websocket_endpoint(websocket: WebSocket):
                         "status": "error", 
                         "message": f"Failed to save: {msg}"
                     }
-                await websocket.send_json(response)
+                await manager.send(websocket, response)
                 
             else:
                 # Ignore unknown commands or messages without command
                 pass
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
         print("Client disconnected")
+    finally:
+        manager.disconnect(websocket)
 
 # History Endpoints
 @app.get("/api/history/today")
-def get_history_today():
-    """Get all measurements for the current day"""
-    return serial_manager.daily_history
+def get_history_today(since: Optional[int] = None, fields: Optional[str] = None, max_points: Optional[int] = None):
+    """
+    Get measurements for the current day in columnar form
+
+    Parameters:
+    - since: only return samples after this sequence number (the 'seq' of a previous response)
+    - fields: comma-separated series names (e.g. 'total_pv_power,VD1_V1D'), default all
+    - max_points: down-sample to at most this many points
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    return serial_manager.daily_history.read(since=since, fields=field_list, max_points=max_points)
 
 @app.get("/api/history/range")
 def get_history_range(start: str, end: str, granularity: str = 'hour'):
@@ -1413,6 +1767,57 @@ def get_history_range(start: str, end: str, granularity: str = 'hour'):
         return {"error": str(e)}
 
 
+# Energy Ledger Endpoints
+ENERGY_PERIOD_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+
+def _energy_report_response(period, start, end, group):
+    try:
+        fmt = ENERGY_PERIOD_FORMATS[period]
+        datetime.strptime(start, fmt)
+        datetime.strptime(end, fmt)
+        if group not in ('string', 'array'):
+            return {"error": f"Invalid group: {group}"}
+        return get_energy_report(period, start, end, group)
+    except ValueError as e:
+        return {"error": f"Invalid date format: {e}"}
+    except Exception as e:
+        logger.error(f"Error retrieving energy report: {e}")
+        return {"error": str(e)}
+
+@app.get("/api/energy/daily")
+def get_energy_daily(start: str, end: str, group: str = 'string'):
+    """
+    Get daily energy yield from the energy ledger
+
+    Parameters:
+    - start, end: YYYY-MM-DD (inclusive)
+    - group: 'string' or 'array'
+    """
+    return _energy_report_response('day', start, end, group)
+
+@app.get("/api/energy/monthly")
+def get_energy_monthly(start: str, end: str, group: str = 'string'):
+    """
+    Get monthly energy yield from the energy ledger
+
+    Parameters:
+    - start, end: YYYY-MM (inclusive)
+    - group: 'string' or 'array'
+    """
+    return _energy_report_response('month', start, end, group)
+
+@app.get("/api/energy/yearly")
+def get_energy_yearly(start: str, end: str, group: str = 'string'):
+    """
+    Get yearly energy yield from the energy ledger
+
+    Parameters:
+    - start, end: YYYY (inclusive)
+    - group: 'string' or 'array'
+    """
+    return _energy_report_response('year', start, end, group)
+
+
 # Alert Endpoints
 @app.get("/api/alerts")
 def get_alerts(limit: int = 50, severity: str = None):
@@ -1424,13 +1829,13 @@ def get_alerts(limit: int = 50, severity: str = None):
 @app.get("/api/alerts/unread")
 def get_unread_alerts():
     """Get count of unread alerts"""
-    count = get_unread_alert_count()
+    count = alert_store.unread_count()
     return {"count": count}
 
 @app.post("/api/alerts/{alert_id}/acknowledge")
 def acknowledge_alert(alert_id: int):
     """Acknowledge an alert"""
-    success = acknowledge_alert_in_db(alert_id)
+    success = alert_store.acknowledge(alert_id)
     if success:
         return {"status": "success", "message": "Alert acknowledged"}
     return {"status": "error", "message": "Failed to acknowledge alert"}
@@ -1439,18 +1844,17 @@ def acknowledge_alert(alert_id: int):
 def delete_alert(alert_id: int):
     """Delete an alert (Soft Delete)"""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        # Soft delete: mark as deleted AND resolved (so it leaves the active view)
-        cursor.execute('UPDATE alerts SET deleted = 1, resolved = 1, resolved_at = ? WHERE id = ?', 
-                      (datetime.now().isoformat(), alert_id))
-        conn.commit()
-        conn.close()
+        alert_store.delete(alert_id)
         return {"status": "success", "message": "Alert deleted"}
     except Exception as e:
         logger.error(f"Error deleting alert: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/diagnosis/worker")
+def get_diagnosis_worker_stats():
+    """Diagnosis worker process state and backlog counters"""
+    return diagnosis_worker.stats()
+
 # Diagnosis Settings Endpoints
 @app.get("/api/diagnosis/settings")
 def get_diagnosis_settings_api():
@@ -1463,19 +1867,30 @@ class DiagnosisSettingsUpdate(BaseModel):
     enabled: bool
     notifications_enabled: bool = True
     thresholds: dict = None
+    rules: list = None  # User-defined rules (see diagnosis_rules.py); None keeps the current rules
 
 @app.post("/api/diagnosis/settings")
 def update_diagnosis_settings_api(settings: DiagnosisSettingsUpdate):
     """Update diagnosis settings"""
     try:
+        # Validate rules before saving anything
+        if settings.rules is not None:
+            try:
+                parse_rules(settings.rules)
+            except RuleError as e:
+                return {"status": "error", "message": f"Invalid rules: {e}"}
+
         # Update database
-        success = save_diagnosis_settings(settings.enabled, settings.thresholds, settings.notifications_enabled)
+        success = save_diagnosis_settings(settings.enabled, settings.thresholds, settings.notifications_enabled,
+                                          settings.rules)
         
         if success:
             # Update diagnosis engine
             diagnosis_engine.enabled = settings.enabled
             if settings.thresholds:
                 diagnosis_engine.thresholds = settings.thresholds
+            if settings.rules is not None:
+                diagnosis_engine.set_rules(settings.rules)
             
             return {"status": "success", "message": "Diagnosis settings updated"}
         return {"status": "error", "message": "Failed to save settings"}
@@ -1483,6 +1898,39 @@ def update_diagnosis_settings_api(settings: DiagnosisSettingsUpdate):
         logger.error(f"Error updating diagnosis settings: {e}")
         return {"status": "error", "message": str(e)}
 
+class DiagnosisBacktestRequest(BaseModel):
+    start: str  # First day (YYYY-MM-DD)
+    end: str  # Day after the last one
+    thresholds: dict = None  # None: the current thresholds
+    rules: list = None  # None: the current rules
+
+@app.post("/api/diagnosis/backtest")
+def backtest_diagnosis_api(request: DiagnosisBacktestRequest):
+    """Count the alerts the given thresholds/rules would have raised over stored data (alerts table untouched)"""
+    try:
+        if request.rules is not None:
+            try:
+                parse_rules(request.rules)
+            except RuleError as e:
+                return {"status": "error", "message": f"Invalid rules: {e}"}
+
+        # A separate engine: the live one keeps its configuration and debounce state
+        engine = DiagnosisEngine()
+        snapshot = diagnosis_engine.snapshot()
+        if request.thresholds:
+            snapshot['thresholds'] = request.thresholds
+        if request.rules is not None:
+            snapshot['rules'] = request.rules
+        engine.configure(snapshot)
+
+        result = run_backtest(DB_FILE, engine, request.start, request.end)
+        return {"status": "success", **result}
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid date range: {e}"}
+    except Exception as e:
+        logger.error(f"Error running diagnosis backtest: {e}")
+        return {"status": "error", "message": str(e)}
+
 # Serve React Static Files
 # Mount the 'static' folder from the build directory
 # We assume the build folder is renamed to 'static' and placed in BUNDLE_DIR
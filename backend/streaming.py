@@ -0,0 +1,793 @@
+"""
+WebSocket Fan-out
+Each connected client gets a bounded outgoing queue and its own sender task,
+so broadcasting never waits on a slow client. A client whose send times out
+is evicted (a cancelled send may have written part of a frame). Messages are encoded to a JSON text frame once and the same
+frame is queued for every client.
+
+Clients may subscribe to a subset of message types, MBs, fields and
+calculations, optionally receiving only changed values after a keyframe.
+Clients with identical subscriptions share a group, so each distinct
+subscription is filtered and encoded once per message.
+
+Binary encoding (opt-in with /ws?encoding=binary or /ws?encoding=msgpack):
+the server first sends a text frame
+    {"type": "schema", "version": N, "columns": [...], "encoding": ...}
+and then each measurement as a binary frame of float32 values in `columns`
+order. "binary" frames are a 24-byte little-endian header (magic b"PVS2",
+uint16 schema version, uint16 column count, uint64 seq, float64 epoch
+seconds) followed by the float32 values. "msgpack" frames are a map
+{"v": version, "s": seq, "t": epoch seconds, "d": float32 bytes}.
+A new schema frame is sent whenever the column layout changes.
+
+Rate limiting: a subscription with max_rate (messages per second) or
+interval (seconds) receives at most one measurement per interval, either the
+latest sample (coalesce="latest") or the min/max/avg of the samples in the
+interval (coalesce="stats").
+
+Resuming: every broadcast message carries a monotonically increasing "seq"
+(seeded from the start time in milliseconds, so it also increases across
+server restarts) and the last messages are kept in a bounded replay buffer.
+The seq is assigned on the event loop thread when a message is published,
+so clients receive messages in seq order whichever thread produced them.
+A reconnecting client passes the last seq it saw (/ws?resume_from=<seq>, or
+"resume_from" in a subscribe/resume command) and receives exactly the missed
+messages followed by {"type": "resumed", ...}, or {"type": "resync", ...}
+when they are no longer available and it must reload from the REST API.
+Clients should ignore messages whose seq they have already seen.
+"""
+
+import asyncio
+import json
+import math
+import struct
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Optional, Set
+
+import numpy as np
+from fastapi import WebSocket
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack encoding falls back to the struct format
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Queue policies
+DROP_OLDEST = "drop_oldest"  # Keep the most recent `max_queue` messages
+LATEST_ONLY = "latest_only"  # Keep only the newest broadcast message
+
+DEFAULT_MAX_QUEUE = 50
+DEFAULT_SEND_TIMEOUT = 5.0  # seconds per send
+FLOAT_DIGITS = 4  # Decimal places kept for floats in outgoing frames
+DEFAULT_KEYFRAME_INTERVAL = 60  # Delta messages between full keyframes
+DEFAULT_REPLAY_SIZE = 300  # Broadcast messages kept for resuming clients (~10 min at 2 s)
+
+# Coalescing modes for rate-limited subscriptions
+COALESCE_LATEST = "latest"
+COALESCE_STATS = "stats"
+
+# Wire encodings
+ENCODING_JSON = "json"
+ENCODING_BINARY = "binary"
+ENCODING_MSGPACK = "msgpack"
+
+# magic, schema version, column count, seq, timestamp (epoch seconds)
+BINARY_MAGIC = b"PVS2"  # PVS1 had a uint32 seq, too narrow for the millisecond-seeded seq
+BINARY_HEADER = struct.Struct("<4sHHQd")
+
+
+def trim_floats(value, digits=FLOAT_DIGITS):
+    """Round floats (round-half-even) and map NaN/inf to None, recursively"""
+    if isinstance(value, float):
+        if math.isfinite(value):
+            return round(value, digits)
+        return None
+    if isinstance(value, dict):
+        return {k: trim_floats(v, digits) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [trim_floats(v, digits) for v in value]
+    return value
+
+
+def encode_message(message, trim=True) -> str:
+    """Encode a message into a JSON text frame (once, for all clients)"""
+    if trim:
+        message = trim_floats(message)
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, separators=(",", ":"), default=str)
+
+
+def _with_seq(frame: str, seq: int) -> str:
+    """Add "seq" to a JSON object frame encoded without it"""
+    return f'{{"seq":{seq},{frame[1:]}' if frame != "{}" else f'{{"seq":{seq}}}'
+
+
+class MeasurementMessage(dict):
+    """A measurement message that also carries its packed float32 sample"""
+
+    def __init__(self, *args, sample=None, timestamp_s=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sample = sample
+        self.timestamp_s = timestamp_s
+
+
+class SampleSchema:
+    """Column layout for binary measurement frames"""
+
+    def __init__(self, version=0, columns=None):
+        self.version = version
+        self.columns = list(columns or [])
+
+    def to_message(self, encoding):
+        return {
+            "type": "schema",
+            "version": self.version,
+            "encoding": encoding,
+            "columns": self.columns,
+        }
+
+
+def encode_binary_sample(schema: SampleSchema, seq: int, message: MeasurementMessage, encoding: str) -> bytes:
+    """Encode one packed sample as a binary frame"""
+    payload = message.sample.astype("<f4", copy=False).tobytes()
+    timestamp = message.timestamp_s or 0.0
+    if encoding == ENCODING_MSGPACK and msgpack is not None:
+        return msgpack.packb({"v": schema.version, "s": seq, "t": timestamp, "d": payload})
+    header = BINARY_HEADER.pack(BINARY_MAGIC, schema.version & 0xFFFF, len(message.sample) & 0xFFFF,
+                                seq, timestamp)
+    return header + payload
+
+
+class SubscriptionError(ValueError):
+    """Invalid subscribe/resume command from a client"""
+
+
+def _optional_set(values):
+    return None if values is None else frozenset(values)
+
+
+def _string_list(message, key):
+    """A list of strings from a client command, or None when absent"""
+    values = message.get(key)
+    if values is None:
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise SubscriptionError(f"'{key}' must be a list of strings")
+    return values
+
+
+def _number(message, key, default, positive=False):
+    """A finite number (> 0 if positive, else >= 0) from a client command"""
+    value = message.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) \
+            or value < 0 or (positive and value == 0):
+        raise SubscriptionError(f"'{key}' must be a {'positive' if positive else 'non-negative'} number")
+    return value
+
+
+def parse_seq(value):
+    """A client's resume_from seq (non-negative integer)"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise SubscriptionError("'resume_from' must be a non-negative integer")
+    return value
+
+
+class Subscription:
+    """
+    What a client wants to receive. None means "everything".
+
+    - types: message types (e.g. "measurement", "stm32_status")
+    - mbs: MB IDs kept in measurement `data`
+    - fields: field names kept in measurement `data`
+    - calculations: keys kept in measurement `calculations`
+    - deltas: after a keyframe, only send values that changed
+    - interval: minimum seconds between measurements (0 = every sample)
+    - coalesce: "latest" or "stats" (min/max/avg) for rate-limited streams
+    """
+
+    def __init__(self, types=None, mbs=None, fields=None, calculations=None,
+                 deltas=False, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 interval=0.0, coalesce=COALESCE_LATEST):
+        self.types = _optional_set(types)
+        self.mbs = _optional_set(mbs)
+        self.fields = _optional_set(fields)
+        self.calculations = _optional_set(calculations)
+        self.deltas = bool(deltas)
+        self.keyframe_interval = max(1, int(keyframe_interval or DEFAULT_KEYFRAME_INTERVAL))
+        self.interval = max(0.0, float(interval or 0.0))
+        self.coalesce = COALESCE_STATS if coalesce == COALESCE_STATS else COALESCE_LATEST
+
+    @classmethod
+    def from_message(cls, message: dict) -> "Subscription":
+        """Subscription from a client's subscribe command. Raises SubscriptionError."""
+        interval = _number(message, "interval", 0.0)
+        max_rate = _number(message, "max_rate", None, positive=True)
+        if max_rate:
+            interval = max(interval, 1.0 / max_rate)
+        deltas = message.get("deltas", False)
+        if not isinstance(deltas, bool):
+            raise SubscriptionError("'deltas' must be true or false")
+        keyframe_interval = message.get("keyframe_interval", DEFAULT_KEYFRAME_INTERVAL)
+        if isinstance(keyframe_interval, bool) or not isinstance(keyframe_interval, int) or keyframe_interval < 1:
+            raise SubscriptionError("'keyframe_interval' must be a positive integer")
+        coalesce = message.get("coalesce", COALESCE_LATEST)
+        if coalesce not in (COALESCE_LATEST, COALESCE_STATS):
+            raise SubscriptionError(f"'coalesce' must be '{COALESCE_LATEST}' or '{COALESCE_STATS}'")
+        return cls(
+            types=_string_list(message, "types"),
+            mbs=_string_list(message, "mbs"),
+            fields=_string_list(message, "fields"),
+            calculations=_string_list(message, "calculations"),
+            deltas=deltas,
+            keyframe_interval=keyframe_interval,
+            interval=interval,
+            coalesce=coalesce,
+        )
+
+    @property
+    def key(self):
+        return (self.types, self.mbs, self.fields, self.calculations, self.deltas, self.keyframe_interval,
+                self.interval, self.coalesce)
+
+    @property
+    def is_default(self):
+        return self.mbs is None and self.fields is None and self.calculations is None and not self.deltas
+
+    def accepts(self, message_type) -> bool:
+        return self.types is None or message_type in self.types
+
+    def filter_measurement(self, message: dict) -> dict:
+        """Restrict a measurement message to the subscribed MBs, fields and calculations"""
+        filtered = dict(message)
+        if "data" in message and (self.mbs is not None or self.fields is not None):
+            data = {}
+            for mb_id, fields in message["data"].items():
+                if self.mbs is not None and mb_id not in self.mbs:
+                    continue
+                if self.fields is not None:
+                    fields = {k: v for k, v in fields.items() if k in self.fields}
+                data[mb_id] = fields
+            filtered["data"] = data
+        if "calculations" in message and self.calculations is not None:
+            filtered["calculations"] = {k: v for k, v in message["calculations"].items() if k in self.calculations}
+        return filtered
+
+    def to_dict(self):
+        return {
+            "types": sorted(self.types) if self.types is not None else None,
+            "mbs": sorted(self.mbs) if self.mbs is not None else None,
+            "fields": sorted(self.fields) if self.fields is not None else None,
+            "calculations": sorted(self.calculations) if self.calculations is not None else None,
+            "deltas": self.deltas,
+            "keyframe_interval": self.keyframe_interval,
+            "interval": self.interval,
+            "coalesce": self.coalesce,
+        }
+
+
+DEFAULT_SUBSCRIPTION = Subscription()
+
+
+class Coalescer:
+    """Collapses the measurements of one interval into a single message"""
+
+    def __init__(self, subscription: Subscription):
+        self.subscription = subscription
+        self.mode = subscription.coalesce
+        self.latest = None
+        self.count = 0
+        self.stats: Dict[tuple, list] = {}  # Key: ("data", mb, field) or ("calculations", key)
+        self.sample_sum = None  # Running sum of the finite values of packed samples (binary clients get the average)
+        self.sample_count = None  # Finite values summed per column
+
+    def add(self, message: dict):
+        self.latest = message
+        self.count += 1
+        if self.mode != COALESCE_STATS:
+            return
+        filtered = self.subscription.filter_measurement(message)
+        for mb_id, fields in filtered.get("data", {}).items():
+            for field_name, value in fields.items():
+                self._add_value(("data", mb_id, field_name), value)
+        for key, value in filtered.get("calculations", {}).items():
+            self._add_value(("calculations", key), value)
+        sample = getattr(message, "sample", None)
+        if sample is not None:
+            finite = np.isfinite(sample)
+            values = np.where(finite, sample, 0.0)
+            if self.sample_sum is None or len(self.sample_sum) != len(sample):
+                self.sample_sum = values.astype(np.float64)
+                self.sample_count = finite.astype(np.int64)
+            else:
+                self.sample_sum += values
+                self.sample_count += finite
+
+    def _add_value(self, key, value):
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value != value:
+            return
+        entry = self.stats.get(key)
+        if entry is None:
+            self.stats[key] = [value, value, value, 1]
+        else:
+            if value < entry[0]:
+                entry[0] = value
+            if value > entry[1]:
+                entry[1] = value
+            entry[2] += value
+            entry[3] += 1
+
+    def take(self):
+        """Return the coalesced message for the interval and reset"""
+        latest, count = self.latest, self.count
+        if latest is None:
+            return None
+        if self.mode == COALESCE_STATS:
+            message = MeasurementMessage(
+                {
+                    "type": "measurement",
+                    "seq": latest.get("seq"),
+                    "timestamp": latest.get("timestamp"),
+                    "data": {mb_id: dict(fields) for mb_id, fields in latest.get("data", {}).items()},
+                    "calculations": dict(latest.get("calculations", {})),
+                    "samples": count,
+                    "stats": {},
+                },
+                sample=getattr(latest, "sample", None),
+                timestamp_s=getattr(latest, "timestamp_s", None),
+            )
+            for key, (low, high, total, n) in self.stats.items():
+                avg = total / n
+                if key[0] == "data":
+                    # The MB may be missing from the latest line (dropped out, MB list changed)
+                    message["data"].setdefault(key[1], {})[key[2]] = avg
+                    stats_key = f"{key[1]}.{key[2]}"
+                else:
+                    message["calculations"][key[1]] = avg
+                    stats_key = key[1]
+                message["stats"][stats_key] = {"min": low, "max": high, "avg": avg}
+            if self.sample_sum is not None:
+                # Columns with no finite value in the interval stay NaN
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    message.sample = (self.sample_sum / self.sample_count).astype(np.float32)
+        else:
+            message = latest
+        self.latest = None
+        self.count = 0
+        self.stats = {}
+        self.sample_sum = None
+        self.sample_count = None
+        return message
+
+
+class SubscriptionGroup:
+    """Clients sharing one subscription, with the delta state for that subscription"""
+
+    def __init__(self, subscription: Subscription):
+        self.subscription = subscription
+        self.members: Set["ClientConnection"] = set()
+        self.last_data: Dict[str, dict] = {}
+        self.last_calculations: Dict[str, object] = {}
+        self.since_keyframe = 0
+        self.coalescer = Coalescer(subscription) if subscription.interval else None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.last_flush = 0.0
+
+    def measurement_frames(self, message: dict, full_frame):
+        """
+        Build the frames for one measurement.
+        Returns (frame, keyframe): `frame` is what up-to-date members get,
+        `keyframe()` returns the full filtered frame for members that need a resync.
+        """
+        sub = self.subscription
+        if sub.is_default:
+            return full_frame(), full_frame
+
+        filtered = trim_floats(sub.filter_measurement(message))
+        if not sub.deltas:
+            frame = encode_message(filtered, trim=False)
+            return frame, lambda: frame
+
+        cached = []
+
+        def keyframe():
+            if not cached:
+                cached.append(encode_message(dict(filtered, keyframe=True), trim=False))
+            return cached[0]
+
+        data = filtered.get("data", {})
+        calculations = filtered.get("calculations", {})
+        self.since_keyframe += 1
+        if self.since_keyframe >= sub.keyframe_interval:
+            # Periodic keyframe for everyone
+            self.since_keyframe = 0
+            frame = keyframe()
+        else:
+            changed_data = {}
+            for mb_id, fields in data.items():
+                previous = self.last_data.get(mb_id, {})
+                changed = {k: v for k, v in fields.items() if previous.get(k, _MISSING) != v}
+                if changed:
+                    changed_data[mb_id] = changed
+            changed_calcs = {k: v for k, v in calculations.items()
+                             if self.last_calculations.get(k, _MISSING) != v}
+            frame = encode_message({
+                "type": "measurement_delta",
+                "seq": filtered.get("seq"),
+                "timestamp": filtered.get("timestamp"),
+                "data": changed_data,
+                "calculations": changed_calcs,
+            }, trim=False)
+
+        for mb_id, fields in data.items():
+            self.last_data.setdefault(mb_id, {}).update(fields)
+        self.last_calculations.update(calculations)
+        return frame, keyframe
+
+
+_MISSING = object()
+
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, max_queue=DEFAULT_MAX_QUEUE, policy=DROP_OLDEST,
+                 encoding=ENCODING_JSON):
+        self.websocket = websocket
+        self.policy = policy
+        self.encoding = encoding
+        self.schema_version = None  # Last schema version sent (binary encodings)
+        self.queue = deque(maxlen=1 if policy == LATEST_ONLY else max_queue)
+        self.control = deque()  # Direct replies (command acks etc.), never dropped
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.sent = 0
+        self.group: Optional[SubscriptionGroup] = None
+        self.needs_keyframe = False  # Next measurement must be a full keyframe
+
+    @property
+    def backlog(self):
+        return len(self.queue) + len(self.control)
+
+    def enqueue(self, frame):
+        """Queue a broadcast frame, dropping the oldest one if the queue is full"""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            # A dropped delta would leave the client out of sync
+            self.needs_keyframe = True
+        self.queue.append(frame)
+        self.wakeup.set()
+
+    def enqueue_control(self, frame):
+        self.control.append(frame)
+        self.wakeup.set()
+
+    def next_frame(self):
+        if self.control:
+            return self.control.popleft()
+        if self.queue:
+            return self.queue.popleft()
+        return None
+
+
+class ReplayBuffer:
+    """Bounded buffer of the last broadcast messages, keyed by seq"""
+
+    def __init__(self, size=DEFAULT_REPLAY_SIZE):
+        self.lock = threading.Lock()
+        self.seq = int(time.time() * 1000)  # Last assigned seq
+        self.floor = self.seq  # Messages with seq <= floor are no longer available
+        self.entries = deque(maxlen=size)  # (seq, message, schema version)
+
+    def add(self, message: dict, schema_version: int) -> int:
+        """Assign the next seq to a message and keep it for replay"""
+        with self.lock:
+            self.seq += 1
+            message["seq"] = self.seq
+            if len(self.entries) == self.entries.maxlen:
+                self.floor = max(self.floor, self.entries[0][0])
+            self.entries.append((self.seq, message, schema_version))
+            return self.seq
+
+    def since(self, seq: int):
+        """Messages after `seq` in order, or None if some of them were evicted"""
+        with self.lock:
+            if seq < self.floor or seq > self.seq:
+                return None
+            missed = [entry for entry in self.entries if entry[0] > seq]
+        missed.sort(key=lambda entry: entry[0])
+        return missed
+
+
+class ConnectionManager:
+    def __init__(self, max_queue=DEFAULT_MAX_QUEUE, send_timeout=DEFAULT_SEND_TIMEOUT,
+                 policy=DROP_OLDEST, replay_size=DEFAULT_REPLAY_SIZE):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.policy = policy
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.groups: Dict[tuple, SubscriptionGroup] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.schema = SampleSchema()
+        self.replay = ReplayBuffer(replay_size)
+
+    @property
+    def active_connections(self):
+        return list(self.clients.keys())
+
+    async def connect(self, websocket: WebSocket, policy: Optional[str] = None,
+                      encoding: str = ENCODING_JSON) -> ClientConnection:
+        await websocket.accept()
+        self.loop = asyncio.get_running_loop()
+        if encoding not in (ENCODING_BINARY, ENCODING_MSGPACK):
+            encoding = ENCODING_JSON
+        client = ClientConnection(websocket, self.max_queue, policy or self.policy, encoding)
+        self.clients[websocket] = client
+        self._join(client, DEFAULT_SUBSCRIPTION)
+        client.task = asyncio.create_task(self._sender(client))
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        """Remove a client (safe to call more than once)"""
+        client = self.clients.pop(websocket, None)
+        if client:
+            self._leave(client)
+        if client and client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def _join(self, client: ClientConnection, subscription: Subscription):
+        group = self.groups.get(subscription.key)
+        if group is None:
+            group = self.groups[subscription.key] = SubscriptionGroup(subscription)
+        group.members.add(client)
+        client.group = group
+        client.needs_keyframe = True
+
+    def _leave(self, client: ClientConnection):
+        group = client.group
+        if group is not None:
+            group.members.discard(client)
+            if not group.members:
+                if group.flush_handle is not None:
+                    group.flush_handle.cancel()
+                del self.groups[group.subscription.key]
+        client.group = None
+
+    def subscribe(self, websocket: WebSocket, subscription: Subscription):
+        """Move a client to the group for `subscription`"""
+        client = self.clients.get(websocket)
+        if client:
+            self._leave(client)
+            self._join(client, subscription)
+
+    async def _evict(self, client: ClientConnection, reason: str):
+        logger.warning(f"Evicting WebSocket client: {reason}")
+        self.disconnect(client.websocket)
+        try:
+            await asyncio.wait_for(client.websocket.close(code=1011), timeout=1.0)
+        except Exception:
+            pass
+
+    async def _sender(self, client: ClientConnection):
+        """Per-client sender task: drains the client's queue"""
+        try:
+            while client.websocket in self.clients:
+                frame = client.next_frame()
+                if frame is None:
+                    client.wakeup.clear()
+                    await client.wakeup.wait()
+                    continue
+                try:
+                    if isinstance(frame, bytes):
+                        send = client.websocket.send_bytes(frame)
+                    else:
+                        send = client.websocket.send_text(frame)
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                    client.sent += 1
+                except asyncio.TimeoutError:
+                    # The frame may be half written: the connection cannot be reused
+                    await self._evict(client, f"send timed out after {self.send_timeout:g} s")
+                    return
+                except Exception as e:
+                    await self._evict(client, f"send failed: {e}")
+                    return
+        except asyncio.CancelledError:
+            pass
+
+    def set_schema(self, version: int, columns):
+        """Update the binary column layout; binary clients get the new schema before the next sample"""
+        self.schema = SampleSchema(version, columns)
+
+    def _binary_frames(self, message):
+        """Lazily encode a measurement once per binary encoding"""
+        cache = {}
+        schema = self.schema
+        seq = message.get("seq", 0)
+
+        def frame(encoding):
+            if encoding not in cache:
+                cache[encoding] = encode_binary_sample(schema, seq, message, encoding)
+            return cache[encoding]
+
+        return frame
+
+    def _enqueue_binary(self, client: ClientConnection, binary_frame):
+        if client.schema_version != self.schema.version:
+            client.enqueue_control(encode_message(self.schema.to_message(client.encoding)))
+            client.schema_version = self.schema.version
+        client.enqueue(binary_frame(client.encoding))
+
+    def publish(self, message: dict, frame: Optional[str] = None, encode_seconds: float = 0.0):
+        """Queue a message for every subscribed client (must run on the event loop thread)
+
+        frame: the message already encoded in full, without its seq (optional)
+        encode_seconds: time the caller spent encoding `frame`, counted in the
+        broadcast stage metric with the fan-out below
+        """
+        started = time.perf_counter()
+        seq = self.replay.add(message, self.schema.version)
+        if not self.clients:
+            return
+        if frame is not None:
+            frame = _with_seq(frame, seq)
+        full_frame = self._full_frame(message, frame)
+        message_type = message.get("type")
+        binary_frame = None
+        if message_type == "measurement" and getattr(message, "sample", None) is not None:
+            if any(c.encoding != ENCODING_JSON for c in self.clients.values()):
+                binary_frame = self._binary_frames(message)
+        for group in list(self.groups.values()):
+            if not group.subscription.accepts(message_type):
+                continue
+            if message_type == "measurement" and group.coalescer is not None:
+                group.coalescer.add(message)
+                self._schedule_flush(group)
+                continue
+            self._deliver(group, message, full_frame, binary_frame)
+        if message_type == "measurement":
+            metrics.BROADCAST_SECONDS.observe(encode_seconds + time.perf_counter() - started)
+
+    @staticmethod
+    def _full_frame(message, frame=None):
+        """Lazily encode the full message once"""
+        full = [frame]
+
+        def full_frame():
+            if full[0] is None:
+                full[0] = encode_message(message)
+            return full[0]
+
+        return full_frame
+
+    def _deliver(self, group: SubscriptionGroup, message, full_frame, binary_frame):
+        """Queue one message for the members of a group"""
+        if message.get("type") != "measurement":
+            group_frame = full_frame()
+            for client in list(group.members):
+                client.enqueue(group_frame)
+            return
+
+        json_members = []
+        for client in list(group.members):
+            if client.encoding != ENCODING_JSON and binary_frame is not None:
+                self._enqueue_binary(client, binary_frame)
+            else:
+                json_members.append(client)
+        if not json_members:
+            return
+        group_frame, keyframe = group.measurement_frames(message, full_frame)
+        for client in json_members:
+            if client.needs_keyframe:
+                client.needs_keyframe = False
+                client.enqueue(keyframe())
+            else:
+                client.enqueue(group_frame)
+
+    def _schedule_flush(self, group: SubscriptionGroup):
+        if group.flush_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, group.last_flush + group.subscription.interval - loop.time())
+        group.flush_handle = loop.call_later(delay, self._flush, group)
+
+    def _flush(self, group: SubscriptionGroup):
+        """Send the coalesced measurement of a rate-limited group"""
+        group.flush_handle = None
+        group.last_flush = asyncio.get_running_loop().time()
+        if group.subscription.key not in self.groups:
+            return
+        message = group.coalescer.take()
+        if message is None:
+            return
+        binary_frame = None
+        if getattr(message, "sample", None) is not None:
+            binary_frame = self._binary_frames(message)
+        self._deliver(group, message, self._full_frame(message), binary_frame)
+
+    async def broadcast(self, message: dict):
+        self.publish(message)
+
+    def broadcast_threadsafe(self, message: dict):
+        """Encode the full frame in the calling thread, then publish on the event loop"""
+        if self.loop and not self.loop.is_closed():
+            # The seq is added to the frame by publish(), in publishing order
+            frame, encode_seconds = None, 0.0
+            if self.clients and DEFAULT_SUBSCRIPTION.key in self.groups:
+                started = time.perf_counter()
+                frame = encode_message(message)
+                encode_seconds = time.perf_counter() - started
+            self.loop.call_soon_threadsafe(self.publish, message, frame, encode_seconds)
+
+    def resume(self, websocket: WebSocket, resume_from: int) -> bool:
+        """
+        Queue the messages a client missed since `resume_from` (filtered by its
+        subscription) ahead of the live stream, followed by a "resumed" frame.
+        Sends a "resync" frame instead if they are no longer buffered.
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return False
+        missed = self.replay.since(int(resume_from))
+        binary = client.encoding != ENCODING_JSON
+        if missed is not None and binary:
+            # Binary frames can only be replayed in the current column layout
+            if any(e[1].get("type") == "measurement" and e[2] != self.schema.version for e in missed):
+                missed = None
+        if missed is None:
+            client.enqueue_control(encode_message({
+                "type": "resync",
+                "seq": self.replay.seq,
+                "oldest_seq": self.replay.floor + 1,
+            }))
+            return False
+
+        subscription = client.group.subscription if client.group else DEFAULT_SUBSCRIPTION
+        missed = [e for e in missed if subscription.accepts(e[1].get("type"))]
+        if subscription.interval:
+            # Rate-limited clients only need the latest measurement
+            measurements = [e for e in missed if e[1].get("type") == "measurement"]
+            missed = [e for e in missed if e[1].get("type") != "measurement"] + measurements[-1:]
+            missed.sort(key=lambda entry: entry[0])
+
+        for seq, message, schema_version in missed:
+            if message.get("type") != "measurement":
+                client.enqueue_control(encode_message(message))
+            elif binary and getattr(message, "sample", None) is not None:
+                if client.schema_version != self.schema.version:
+                    client.enqueue_control(encode_message(self.schema.to_message(client.encoding)))
+                    client.schema_version = self.schema.version
+                client.enqueue_control(encode_binary_sample(self.schema, seq, message, client.encoding))
+            elif subscription.is_default:
+                client.enqueue_control(encode_message(message))
+            else:
+                filtered = subscription.filter_measurement(message)
+                if subscription.deltas:
+                    filtered["keyframe"] = True
+                client.enqueue_control(encode_message(filtered))
+
+        client.enqueue_control(encode_message({
+            "type": "resumed",
+            "resume_from": int(resume_from),
+            "seq": self.replay.seq,
+            "replayed": len(missed),
+        }))
+        return True
+
+    async def send(self, websocket: WebSocket, message: dict):
+        """Send a direct reply to one client through its sender task"""
+        client = self.clients.get(websocket)
+        if client:
+            client.enqueue_control(encode_message(message))
@@ -12,6 +12,7 @@ import {
   UsersPage,
 } from "./Pages";
 import PropTypes from "prop-types";
+import { useAlertStream } from "./alertStream";
 
 function App() {
   // Restore user from localStorage on init
@@ -145,22 +146,26 @@ function Header({ user }) {
 function AlertBadge() {
   const [unreadCount, setUnreadCount] = useState(0);
 
-  useEffect(() => {
-    const fetchCount = async () => {
-      try {
-        const response = await fetch('http://localhost:8000/api/alerts/unread');
-        const data = await response.json();
-        setUnreadCount(data.count);
-      } catch (error) {
-        console.error('Error fetching unread count:', error);
-      }
-    };
+  const fetchCount = async () => {
+    try {
+      const response = await fetch('http://localhost:8000/api/alerts/unread');
+      const data = await response.json();
+      setUnreadCount(data.count);
+    } catch (error) {
+      console.error('Error fetching unread count:', error);
+    }
+  };
 
+  // Initial count, then live updates pushed over the WebSocket
+  useEffect(() => {
     fetchCount();
-    const interval = setInterval(fetchCount, 10000); // Refresh every 10s
-    return () => clearInterval(interval);
   }, []);
 
+  useAlertStream((message) => {
+    if (message.type === "resync") fetchCount();
+    else setUnreadCount(message.unread_count);
+  });
+
   if (unreadCount === 0) return null;
 
   return (
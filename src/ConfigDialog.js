@@ -37,6 +37,8 @@ export function ConfigDialog({ isOpen, onClose }) {
 
       socket.onopen = () => {
         console.log("ConfigDialog connected to WebSocket");
+        // Only command replies are needed here; skip the measurement stream
+        socket.send(JSON.stringify({ command: "subscribe", types: ["stm32_status"] }));
         if (isMounted.current) setWs(socket);
       };
 
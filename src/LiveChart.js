@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import {
     LineChart,
     Line,
@@ -10,27 +10,82 @@ import {
     ResponsiveContainer
 } from 'recharts';
 
-export function LiveChart({ latestMeasurement, config }) {
+// Keep the chart bounded regardless of how long the page stays open
+const MAX_CHART_POINTS = 2000;
+
+export function LiveChart({ latestMeasurement, config, resyncToken = 0 }) {
     const [chartData, setChartData] = useState([]);
     const [selectedMetrics, setSelectedMetrics] = useState(['total_pv_power']);
     const [availableMetrics, setAvailableMetrics] = useState([]);
     const [isSelectorOpen, setIsSelectorOpen] = useState(false);
 
-    // Fetch history on mount
+    const lastSeqRef = useRef(null);
+
+    // Fetch history on mount (columnar, down-sampled server-side).
+    // After a WebSocket resync only the samples since the last fetch are loaded.
     useEffect(() => {
-        fetch("/api/history/today")
+        const since = lastSeqRef.current;
+        const query = since !== null ? `&since=${since}` : '';
+        fetch(`/api/history/today?max_points=${MAX_CHART_POINTS}${query}`)
             .then(res => res.json())
             .then(data => {
-                if (Array.isArray(data)) {
-                    const processed = data.map(processMeasurement);
-                    setChartData(processed);
-                    if (data.length > 0) {
-                        discoverMetrics(data[data.length - 1]);
+                if (data && Array.isArray(data.timestamps)) {
+                    const rows = columnsToRows(data);
+                    if (since === null || data.reset) {
+                        setChartData(rows);
+                    } else {
+                        setChartData(prev => {
+                            // Merge by time, skipping samples the live stream already delivered
+                            const seen = new Set(prev.map(row => row.time));
+                            const next = [...prev, ...rows.filter(row => !seen.has(row.time))]
+                                .sort((a, b) => a.time - b.time);
+                            return next.length > MAX_CHART_POINTS ? next.slice(next.length - MAX_CHART_POINTS) : next;
+                        });
                     }
+                    lastSeqRef.current = data.seq;
+                    discoverMetrics(columnsToMessage(data));
                 }
             })
             .catch(err => console.error("Failed to load history:", err));
-    }, []);
+    }, [resyncToken]);
+
+    // Append live measurements as they arrive
+    useEffect(() => {
+        if (!latestMeasurement || latestMeasurement.type !== 'measurement') return;
+        setChartData(prev => {
+            const next = [...prev, processMeasurement(latestMeasurement)];
+            return next.length > MAX_CHART_POINTS ? next.slice(next.length - MAX_CHART_POINTS) : next;
+        });
+        discoverMetrics(latestMeasurement);
+    }, [latestMeasurement]);
+
+    // Convert a columnar /api/history/today response into chart rows
+    const columnsToRows = (data) => {
+        return data.timestamps.map((ts, i) => {
+            const row = { time: ts, timestamp: new Date(ts).toLocaleTimeString() };
+            for (const [name, values] of Object.entries(data.fields)) {
+                row[name] = values[i];
+            }
+            return row;
+        });
+    };
+
+    // Rebuild a measurement-shaped object from series names for metric discovery
+    // Raw series are named `${mbId}_${field}`; calculations are lowercase keys
+    const columnsToMessage = (data) => {
+        const msg = { calculations: {}, data: {} };
+        Object.keys(data.fields).forEach(name => {
+            if (/^[A-Z]/.test(name) && name.includes('_')) {
+                const idx = name.indexOf('_');
+                const mbId = name.slice(0, idx);
+                if (!msg.data[mbId]) msg.data[mbId] = {};
+                msg.data[mbId][name.slice(idx + 1)] = null;
+            } else {
+                msg.calculations[name] = null;
+            }
+        });
+        return msg;
+    };
 
     // ... (existing code)
 
@@ -130,8 +185,8 @@ export function LiveChart({ latestMeasurement, config }) {
     };
 
     const processMeasurement = (msg) => {
-        const timestamp = new Date(msg.timestamp).toLocaleTimeString();
-        const values = { timestamp };
+        const time = new Date(msg.timestamp).getTime();
+        const values = { time, timestamp: new Date(time).toLocaleTimeString() };
 
         if (msg.calculations) {
             Object.assign(values, msg.calculations);
@@ -67,6 +67,8 @@ export function MBConfigTab({ config, onConfigChange }) {
     let socket = new WebSocket(`${protocol}//${window.location.host}/ws`);
 
     socket.onopen = () => {
+      // Raw MB values only; calculations are not shown on this tab
+      socket.send(JSON.stringify({ command: "subscribe", types: ["measurement", "stm32_status"], calculations: [] }));
       if (isMounted.current) {
         console.log("MBConfigTab connected to WebSocket");
         setConnectionStatus("connected");
@@ -3,12 +3,15 @@ import { LiveChart } from "./LiveChart";
 import { HistoricalChart } from "./HistoricalChart";
 import "./Pages.css";
 import { ConfigDialog } from "./ConfigDialog";
+import { useAlertStream, applyAlertEvent } from "./alertStream";
 
 // Dashboard Page
 export function DashboardPage() {
   const [measurementData, setMeasurementData] = useState(null);
   const [config, setConfig] = useState(null);
   const wsRef = useRef(null);
+  const lastSeqRef = useRef(null);
+  const [resyncToken, setResyncToken] = useState(0);
 
   // Load config
   useEffect(() => {
@@ -18,29 +21,52 @@ export function DashboardPage() {
       .catch(err => console.error("Failed to load config:", err));
   }, []);
 
-  // WebSocket connection
+  // WebSocket connection (reconnects and resumes from the last seq seen)
   useEffect(() => {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const socket = new WebSocket(`${protocol}//${window.location.host}/ws`);
+    let socket = null;
+    let reconnectTimeout = null;
+    let closed = false;
+
+    const connect = () => {
+      const resume = lastSeqRef.current !== null ? `?resume_from=${lastSeqRef.current}` : '';
+      socket = new WebSocket(`${protocol}//${window.location.host}/ws${resume}`);
+
+      socket.onopen = () => console.log("Dashboard connected to WebSocket");
+
+      socket.onmessage = (event) => {
+        try {
+          const response = JSON.parse(event.data);
+          if (typeof response.seq === 'number' && response.type !== 'resumed' && response.type !== 'resync') {
+            // Replayed messages may overlap what we already have
+            if (lastSeqRef.current !== null && response.seq <= lastSeqRef.current) return;
+            lastSeqRef.current = response.seq;
+          }
+          if (response.type === "measurement" && response.data) {
+            setMeasurementData(response);
+          } else if (response.type === "resync") {
+            // Missed messages are gone; reload the chart history
+            lastSeqRef.current = response.seq;
+            setResyncToken(t => t + 1);
+          }
+        } catch (e) {
+          console.error("Dashboard WS error:", e);
+        }
+      };
 
-    socket.onopen = () => console.log("Dashboard connected to WebSocket");
+      socket.onclose = () => {
+        console.log("Dashboard WebSocket closed");
+        if (!closed) reconnectTimeout = setTimeout(connect, 3000);
+      };
 
-    socket.onmessage = (event) => {
-      try {
-        const response = JSON.parse(event.data);
-        if (response.type === "measurement" && response.data) {
-          setMeasurementData(response);
-        }
-      } catch (e) {
-        console.error("Dashboard WS error:", e);
-      }
+      wsRef.current = socket;
     };
 
-    socket.onclose = () => console.log("Dashboard WebSocket closed");
-
-    wsRef.current = socket;
+    connect();
 
     return () => {
+      closed = true;
+      if (reconnectTimeout) clearTimeout(reconnectTimeout);
       if (socket) socket.close();
     };
   }, []);
@@ -48,7 +74,7 @@ export function DashboardPage() {
   return (
     <>
       <MetricsCards data={measurementData} config={config} />
-      <MainContent data={measurementData} config={config} />
+      <MainContent data={measurementData} config={config} resyncToken={resyncToken} />
       <EnvironmentalCards data={measurementData} />
     </>
   );
@@ -154,13 +180,31 @@ export function AlertsPage() {
   const [viewMode, setViewMode] = useState('active'); // 'active' or 'history'
   const [severityFilter, setSeverityFilter] = useState('all'); // all, critical, error, warning, info
 
+  const limit = viewMode === 'history' ? 100 : 50;
+
+  // Whether an alert belongs in the current view (resolved state and severity)
+  const matchesView = (alert) => {
+    // 1. View Mode Filter
+    if (viewMode === 'active') {
+      // Active = Not Resolved
+      if (alert.resolved) return false;
+    }
+    // History shows everything, so no filter needed for 'history'
+
+    // 2. Severity Filter
+    if (severityFilter !== 'all') {
+      if (alert.severity.toLowerCase() !== severityFilter) return false;
+    }
+
+    return true;
+  };
+
   const fetchAlerts = async () => {
     try {
-      // If viewMode is 'active', we could filter by unread/unresolved, 
-      // but for now we fetch all and filter client-side or use API params if available.
-      // The current API supports severity. We'll fetch a larger limit for history.
-      const limit = viewMode === 'history' ? 100 : 50;
-      const response = await fetch(`/api/alerts?limit=${limit}`);
+      // The API filters by severity; resolved alerts are filtered client-side.
+      // We'll fetch a larger limit for history.
+      const severity = severityFilter !== 'all' ? `&severity=${severityFilter.toUpperCase()}` : '';
+      const response = await fetch(`/api/alerts?limit=${limit}${severity}`);
       if (response.ok) {
         const data = await response.json();
         setAlerts(data);
@@ -172,9 +216,18 @@ export function AlertsPage() {
 
   useEffect(() => {
     fetchAlerts();
-    const interval = setInterval(fetchAlerts, 10000); // Refresh every 10s
-    return () => clearInterval(interval);
-  }, [viewMode]); // Refetch when switching views
+  }, [viewMode, severityFilter]); // Refetch when switching views or severity
+
+  // Live alert events instead of polling
+  useAlertStream((message) => {
+    if (message.type === "resync") {
+      fetchAlerts();
+      return;
+    }
+    // New alerts outside the current view are left to the next fetch
+    if (message.event === "created" && !matchesView(message.alert)) return;
+    setAlerts(prev => applyAlertEvent(prev, message).slice(0, limit));
+  });
 
   const acknowledgeAlert = async (alertId) => {
     try {
@@ -200,21 +253,7 @@ export function AlertsPage() {
   };
 
   // Filter alerts based on View Mode and Severity Filter
-  const filteredAlerts = alerts.filter(alert => {
-    // 1. View Mode Filter
-    if (viewMode === 'active') {
-      // Active = Not Resolved
-      if (alert.resolved) return false;
-    }
-    // History shows everything, so no filter needed for 'history'
-
-    // 2. Severity Filter
-    if (severityFilter !== 'all') {
-      if (alert.severity.toLowerCase() !== severityFilter) return false;
-    }
-
-    return true;
-  });
+  const filteredAlerts = alerts.filter(matchesView);
 
   return (
     <div className="page-content">
@@ -744,10 +783,10 @@ function WeatherCard({ weather }) {
   );
 }
 
-function MainContent({ data, config }) {
+function MainContent({ data, config, resyncToken }) {
   return (
     <div className="main-content">
-      <LiveChart latestMeasurement={data} config={config} />
+      <LiveChart latestMeasurement={data} config={config} resyncToken={resyncToken} />
       <StationOverview data={data} config={config} />
     </div>
   );
@@ -767,23 +806,17 @@ function StationOverview({ data, config }) {
   const [unreadCount, setUnreadCount] = useState(0);
 
   // Fetch unread alerts count
-  useEffect(() => {
-    const fetchCount = async () => {
-      try {
-        const response = await fetch('/api/alerts/unread');
-        if (response.ok) {
-          const data = await response.json();
-          setUnreadCount(data.count);
-        }
-      } catch (error) {
-        console.error('Error fetching unread count:', error);
+  const fetchCount = async () => {
+    try {
+      const response = await fetch('/api/alerts/unread');
+      if (response.ok) {
+        const data = await response.json();
+        setUnreadCount(data.count);
       }
-    };
-
-    fetchCount();
-    const interval = setInterval(fetchCount, 10000); // Refresh every 10s
-    return () => clearInterval(interval);
-  }, []);
+    } catch (error) {
+      console.error('Error fetching unread count:', error);
+    }
+  };
 
   // INVD Data state
   const [invdData, setInvdData] = useState({
@@ -797,57 +830,72 @@ function StationOverview({ data, config }) {
   const [componentAlerts, setComponentAlerts] = useState({});
   const [stationAlertCount, setStationAlertCount] = useState(0);
 
+  const [stationAlerts, setStationAlerts] = useState([]);
+
   // Fetch alerts for station components
+  const fetchAlerts = async () => {
+    try {
+      const response = await fetch('/api/alerts?limit=100');
+      setStationAlerts(await response.json());
+    } catch (error) {
+      console.error('Error fetching alerts:', error);
+    }
+  };
+
+  // Initial load, then live alert events pushed over the WebSocket
   useEffect(() => {
-    const fetchAlerts = async () => {
-      try {
-        const response = await fetch('/api/alerts?limit=100');
-        const alerts = await response.json();
-
-        // Filter unresolved alerts
-        const activeAlerts = alerts.filter(alert => !alert.resolved);
-
-        // Group alerts by component
-        const alertsByComponent = {};
-        let stationCount = 0;
-
-        activeAlerts.forEach(alert => {
-          if (alert.component) {
-            // Map component names to station components
-            let componentKey = null;
-
-            if (alert.component.includes('VD') || alert.component.includes('ID') ||
-              alert.component === 'solar' || alert.component.includes('INVD_PV')) {
-              componentKey = 'solar';
-            } else if (alert.component === 'battery' || alert.component.includes('bat')) {
-              componentKey = 'storage';
-            } else if (alert.component === 'inverter') {
-              componentKey = 'inverter';
-            } else if (alert.component === 'consumption' || alert.component.includes('load')) {
-              componentKey = 'consumption';
-            }
-
-            if (componentKey) {
-              if (!alertsByComponent[componentKey]) {
-                alertsByComponent[componentKey] = [];
-              }
-              alertsByComponent[componentKey].push(alert);
-              stationCount++;
-            }
-          }
-        });
+    fetchCount();
+    fetchAlerts();
+  }, []);
 
-        setComponentAlerts(alertsByComponent);
-        setStationAlertCount(stationCount);
-      } catch (error) {
-        console.error('Error fetching alerts:', error);
+  useAlertStream((message) => {
+    if (message.type === "resync") {
+      fetchCount();
+      fetchAlerts();
+    } else {
+      setUnreadCount(message.unread_count);
+      setStationAlerts(prev => applyAlertEvent(prev, message));
+    }
+  });
+
+  // Group active alerts by station component
+  useEffect(() => {
+    // Filter unresolved alerts
+    const activeAlerts = stationAlerts.filter(alert => !alert.resolved);
+
+    // Group alerts by component
+    const alertsByComponent = {};
+    let stationCount = 0;
+
+    activeAlerts.forEach(alert => {
+      if (alert.component) {
+        // Map component names to station components
+        let componentKey = null;
+
+        if (alert.component.includes('VD') || alert.component.includes('ID') ||
+          alert.component === 'solar' || alert.component.includes('INVD_PV')) {
+          componentKey = 'solar';
+        } else if (alert.component === 'battery' || alert.component.includes('bat')) {
+          componentKey = 'storage';
+        } else if (alert.component === 'inverter') {
+          componentKey = 'inverter';
+        } else if (alert.component === 'consumption' || alert.component.includes('load')) {
+          componentKey = 'consumption';
+        }
+
+        if (componentKey) {
+          if (!alertsByComponent[componentKey]) {
+            alertsByComponent[componentKey] = [];
+          }
+          alertsByComponent[componentKey].push(alert);
+          stationCount++;
+        }
       }
-    };
+    });
 
-    fetchAlerts();
-    const interval = setInterval(fetchAlerts, 10000); // Refresh every 10s
-    return () => clearInterval(interval);
-  }, []);
+    setComponentAlerts(alertsByComponent);
+    setStationAlertCount(stationCount);
+  }, [stationAlerts]);
 
   // Helper function to get component status based on alerts
   const getComponentStatus = (componentKey) => {
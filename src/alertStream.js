@@ -0,0 +1,94 @@
+import { useEffect, useRef } from "react";
+
+// One WebSocket per tab carries alert events for every component that
+// needs them (badge, station overview, alerts page), replacing HTTP polling.
+// The server batches the transitions of one sample into one message:
+//   { type: "alert", events: [{ event, id, alert }, ...], unread_count }
+// Listeners get each event on its own:
+//   { type: "alert", event: "created" | "resolved" | "acknowledged" | "deleted",
+//     id, alert, unread_count }
+// Listeners also get { type: "resync" } after (re)connecting when events may
+// have been missed, and should reload from the REST API once.
+
+const listeners = new Set();
+let socket = null;
+let reconnectTimeout = null;
+let lastSeq = null;
+let connectedBefore = false;
+
+function notify(message) {
+  listeners.forEach(listener => listener(message));
+}
+
+function connect() {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+  const ws = new WebSocket(`${protocol}//${window.location.host}/ws`);
+  socket = ws;
+  reconnectTimeout = null;
+
+  ws.onopen = () => {
+    // Only alert events; after a reconnect, replay the ones we missed
+    const subscribe = { command: "subscribe", types: ["alert"] };
+    if (lastSeq !== null) subscribe.resume_from = lastSeq;
+    ws.send(JSON.stringify(subscribe));
+    // Nothing to resume from: anything during the outage can only be reloaded
+    if (lastSeq === null && connectedBefore) notify({ type: "resync" });
+    connectedBefore = true;
+  };
+
+  ws.onmessage = (event) => {
+    try {
+      const response = JSON.parse(event.data);
+      if (response.type === "alert") {
+        if (lastSeq !== null && response.seq <= lastSeq) return;
+        lastSeq = response.seq;
+        (response.events || []).forEach(e =>
+          notify({ type: "alert", ...e, unread_count: response.unread_count }));
+      } else if (response.type === "resync") {
+        lastSeq = response.seq;
+        notify({ type: "resync" });
+      }
+    } catch (e) {
+      console.error("Alert stream error:", e);
+    }
+  };
+
+  ws.onclose = () => {
+    if (socket !== ws) return;
+    socket = null;
+    if (listeners.size > 0) {
+      reconnectTimeout = setTimeout(connect, 3000);
+    }
+  };
+}
+
+// Apply an alert event to a list of alerts (as returned by /api/alerts)
+export function applyAlertEvent(alerts, message) {
+  if (message.event === "created") {
+    if (alerts.some(a => a.id === message.id)) return alerts;
+    return [message.alert, ...alerts];
+  }
+  return alerts.map(a => (a.id === message.id ? { ...a, ...message.alert } : a));
+}
+
+// Subscribe a component to alert events for as long as it is mounted
+export function useAlertStream(onMessage) {
+  const handlerRef = useRef(onMessage);
+  handlerRef.current = onMessage;
+
+  useEffect(() => {
+    const listener = (message) => handlerRef.current(message);
+    listeners.add(listener);
+    if (!socket && !reconnectTimeout) connect();
+
+    return () => {
+      listeners.delete(listener);
+      if (listeners.size === 0) {
+        if (reconnectTimeout) clearTimeout(reconnectTimeout);
+        reconnectTimeout = null;
+        if (socket) socket.close();
+        socket = null;
+      }
+    };
+  }, []);
+}